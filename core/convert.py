@@ -0,0 +1,2187 @@
+""" reading, flattening and writing shared by the converters, see dgraph/to_rdf.py and neo4j/to_csv.py """
+import array
+import bisect
+import codecs
+import collections
+import datetime
+import gzip
+import hashlib
+import heapq
+import itertools
+import logging
+import mmap
+import multiprocessing
+import os
+import queue
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+import ujson
+
+from flatten_json import flatten
+
+try:
+    # faster gzip decompression, when python-isal is installed
+    from isal import igzip as fast_gzip
+except ImportError:
+    fast_gzip = gzip
+
+try:
+    # lazy parsing, so projected records skip fields nobody reads
+    import simdjson
+except ImportError:
+    simdjson = None
+
+try:
+    # sorts the runs of the vertex index through an index instead of python ints
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def reader(path):
+    if path.endswith('.gz'):
+        return fast_gzip.open(path, 'rb')
+    else:
+        return open(path, 'rb')
+
+
+def read_batches(path, block_size=16 * 1024 * 1024, spill=False, timer=None):
+    """ yield lists of raw lines, reading and decompressing block_size bytes at a time
+
+    with spill, a line longer than huge_record is written to a temporary
+    file as it is read and yielded as a SpilledLine instead of a string;
+    a Timer is told how long reading took and how far into the file it got
+    """
+    with reader(path) as ins:
+        # the compressed file under a gzip reader
+        raw = getattr(ins, 'fileobj', ins)
+        rest = b''
+        spilled = None
+        while True:
+            if timer is not None:
+                start = time.perf_counter()
+                block = ins.read(block_size)
+                timer.seconds['decompress'] += time.perf_counter() - start
+                timer.read = raw.tell()
+            else:
+                block = ins.read(block_size)
+            if not block:
+                break
+            if spilled is not None:
+                cut = block.find(b'\n')
+                if cut < 0:
+                    spilled.write(block)
+                    continue
+                spilled.write(block[:cut])
+                yield [spilled]
+                spilled = None
+                block = block[cut + 1:]
+            block = rest + block
+            cut = block.rfind(b'\n') + 1
+            rest = block[cut:]
+            if cut:
+                yield block[:cut].splitlines()
+            if spill and len(rest) > huge_record:
+                spilled = SpilledLine()
+                spilled.write(rest)
+                rest = b''
+        if spilled is not None:
+            yield [spilled]
+        elif rest.strip():
+            yield [rest]
+
+
+# lines longer than this are streamed from a temporary file rather than parsed whole, see read_batches
+# a streamed record takes memory for its keys, not its values: about 100MB for a 300MB record of
+# a few thousand keys, but around 0.5-0.75KB for each distinct key of a label, for its schema or header,
+# so a record of 1.5M keys still takes 0.7-1.1GB, see tests/test_streaming.py
+huge_record = 16 * 1024 * 1024
+
+
+class SpilledLine(object):
+    """ a line too long to hold, kept in an anonymous temporary file, see read_batches """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+
+    def write(self, data):
+        self.file.write(data)
+
+    def events(self):
+        """ json_events of the line, read back block by block; the file goes once the line does """
+        self.file.seek(0)
+        yield from json_events(self.file)
+
+    def copy(self, out, block_size=16 * 1024 * 1024):
+        """ write the line to out a block at a time """
+        self.file.seek(0)
+        for block in iter(lambda: self.file.read(block_size), b''):
+            out.write(block)
+
+
+# characters of the cells or triples of a streamed record kept in memory while they wait for the ones before them, see Held
+held_size = 64 * 1024 * 1024
+
+
+class Held(object):
+    """ strings set aside until they can be written, in memory up to held_size characters and in a temporary file past that
+
+    the writers of streamed records hold the cells or triples that come
+    before they can be written, see write_streamed and emit_streamed; a
+    record could have all of them waiting, so their text can't all stay
+    in memory, only the tokens that find it again
+    """
+
+    def __init__(self, size=None):
+        self.size = held_size if size is None else size
+        self.used = 0
+        self.file = None
+
+    def hold(self, text):
+        """ a token for text, which take gives back """
+        if self.used + len(text) <= self.size:
+            self.used += len(text)
+            return text
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        data = text.encode('utf-8')
+        self.file.seek(0, 2)
+        offset = self.file.tell()
+        self.file.write(data)
+        return offset, len(data)
+
+    def take(self, token):
+        """ the text of a token of hold """
+        if type(token) is str:
+            self.used -= len(token)
+            return token
+        self.file.seek(token[0])
+        return self.file.read(token[1]).decode('utf-8')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# a string, number, literal or bracket, after any separators, see json_events
+token_re = re.compile(r'[\s,:]*(?:"([^"\\]*(?:\\.[^"\\]*)*)"|(-?[0-9][0-9.eE+-]*)|(true|false|null)|([\[\]{}]))')
+literals = {'true': True, 'false': False, 'null': None}
+
+
+def json_events(fh, block_size=1024 * 1024):
+    """ (event, value) for the json document in fh, read block_size bytes at a time
+
+    events are those of ijson: start_map, map_key, end_map, start_array,
+    end_array and value; only the current token and block are ever held,
+    so memory doesn't grow with the size of the document
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    eof = False
+    # True for objects, False for arrays
+    stack = []
+    key_next = False
+    while True:
+        m = token_re.match(buf, pos)
+        if m is None or (m.end() == len(buf) and not eof):
+            # the token may continue in the next block
+            if eof:
+                if buf[pos:].strip():
+                    raise ValueError('invalid json at {!r}'.format(buf[pos:pos + 64]))
+                return
+            block = fh.read(block_size)
+            eof = not block
+            if pos == 0 and buf:
+                # a token longer than a block, e.g. a long string; read more at once
+                block_size *= 2
+            buf = buf[pos:] + decoder.decode(block, final=eof)
+            pos = 0
+            continue
+        pos = m.end()
+        string, number, literal, bracket = m.groups()
+        if bracket is not None:
+            if bracket == '{':
+                stack.append(True)
+                key_next = True
+                yield 'start_map', None
+            elif bracket == '[':
+                stack.append(False)
+                key_next = False
+                yield 'start_array', None
+            else:
+                stack.pop()
+                key_next = bool(stack) and stack[-1]
+                yield 'end_map' if bracket == '}' else 'end_array', None
+            continue
+        if string is not None:
+            value = ujson.loads('"{}"'.format(string)) if '\\' in string else string
+            if key_next:
+                key_next = False
+                yield 'map_key', value
+                continue
+        elif number is not None:
+            value = float(number) if '.' in number or 'e' in number or 'E' in number else int(number)
+        else:
+            value = literals[literal]
+        key_next = bool(stack) and stack[-1]
+        yield 'value', value
+
+
+def build_json(events, event):
+    """ the object or list started by event, built from the rest of its json_events """
+    root = {} if event == 'start_map' else []
+    stack = [root]
+    key = None
+    for event, value in events:
+        if event == 'map_key':
+            key = value
+            continue
+        if event == 'end_map' or event == 'end_array':
+            stack.pop()
+            if not stack:
+                return root
+            continue
+        if event == 'start_map':
+            value = {}
+        elif event == 'start_array':
+            value = []
+        top = stack[-1]
+        if type(top) is dict:
+            top[key] = value
+        else:
+            top.append(value)
+        if event != 'value':
+            stack.append(value)
+    raise ValueError('truncated json')
+
+
+def skip_json(events):
+    """ consume the rest of the object or list whose start event was just read """
+    depth = 1
+    for event, _ in events:
+        if event == 'start_map' or event == 'start_array':
+            depth += 1
+        elif event == 'end_map' or event == 'end_array':
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def prefetch(items, depth=4):
+    """ drain the items generator on a background thread, staying at most depth items ahead """
+    q = queue.Queue(depth)
+    stop = threading.Event()
+
+    def fill():
+        try:
+            for item in items:
+                q.put((True, item))
+                if stop.is_set():
+                    return
+            q.put((False, None))
+        except BaseException as e:
+            q.put((False, e))
+        finally:
+            items.close()
+
+    thread = threading.Thread(target=fill, daemon=True)
+    thread.start()
+    try:
+        while True:
+            ok, item = q.get()
+            if not ok:
+                if item is not None:
+                    raise item
+                break
+            yield item
+    finally:
+        # unblock the producer if the consumer stopped early
+        stop.set()
+        while thread.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+# seconds between the progress lines of a conversion
+progress_interval = 60
+
+
+class Timer(object):
+    """ where the time converting a file goes, by stage, and how far through its compressed input it is
+
+    decompress and write run on threads of their own, overlapping the
+    other stages; parse, flatten and convert are timed on one record in
+    sample_every and scaled up, as timing every record would cost about as
+    much as flattening it
+
+    progress is by compressed bytes read, which runs a few blocks ahead of
+    the records converted, see prefetch
+    """
+    stages = ['decompress', 'parse', 'flatten', 'convert', 'write']
+
+    def __init__(self, input, sample_every=16):
+        self.input = input
+        self.size = os.path.getsize(input)
+        self.read = 0
+        self.records = 0
+        self.sample_every = sample_every
+        self.seconds = dict.fromkeys(self.stages, 0.0)
+        self.start = time.time()
+        self.next_progress = self.start + progress_interval
+
+    def flatten(self, flattener, line):
+        """ flattener(flattener.loads(line)), timed """
+        start = time.perf_counter()
+        record = flattener.loads(line)
+        parsed = time.perf_counter()
+        line = flattener(record)
+        self.seconds['parse'] += (parsed - start) * self.sample_every
+        self.seconds['flatten'] += (time.perf_counter() - parsed) * self.sample_every
+        return line
+
+    def tick(self, records):
+        """ note records converted so far, logging progress every progress_interval seconds """
+        self.records = records
+        now = time.time()
+        if now >= self.next_progress:
+            self.next_progress = now + progress_interval
+            elapsed = now - self.start
+            rate = self.read / elapsed
+            eta = (self.size - self.read) / rate if rate else float('inf')
+            logging.info('{}: {:.1%} of {:.1f} MB, {:.2f} MB/s, {:.0f} records/s, eta {}'.format(
+                self.input, self.read / self.size if self.size else 1, self.size / 1e6, rate / 1e6, records / elapsed,
+                datetime.timedelta(seconds=round(eta)) if eta != float('inf') else '?'))
+
+    def report(self, outputs):
+        """ json-able timings of the file, converted to outputs, with the peak RSS of this process """
+        elapsed = time.time() - self.start
+        return {
+            'input': self.input,
+            'outputs': outputs,
+            'input_bytes': self.size,
+            'records': self.records,
+            'seconds': round(elapsed, 3),
+            'mb_per_sec': round(self.size / 1e6 / elapsed, 3) if elapsed else None,
+            'records_per_sec': round(self.records / elapsed, 1) if elapsed else None,
+            'stages': {k: round(v, 3) for k, v in self.seconds.items()},
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+
+
+class StackSampler(object):
+    """ a sampling profiler: counts the stacks of the calling thread every interval seconds, on a thread of its own
+
+    write() saves them in the collapsed format of flamegraph.pl and speedscope
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.ident = threading.get_ident()
+        self.stacks = collections.Counter()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def _sample(self):
+        while not self.stop.wait(self.interval):
+            frame = sys._current_frames().get(self.ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}:{}'.format(os.path.basename(code.co_filename), code.co_name, frame.f_lineno))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        self.stop.set()
+        self.thread.join()
+        with open(path, 'w') as fh:
+            for stack, n in self.stacks.most_common():
+                fh.write('{} {}\n'.format(stack, n))
+        logging.info('wrote {}'.format(path))
+
+
+class AsyncWriter(object):
+    """ joins small writes into buffers of buffer_size characters written on a background thread
+
+    paths ending in .gz are written gzip compressed; the file is written to
+    '{path}.tmp' and only renamed to path once closed without an error, so
+    an interrupted conversion never leaves a truncated output behind;
+    a binary writer takes bytes instead of strings
+    """
+
+    def __init__(self, path, buffer_size=4 * 1024 * 1024, depth=4, timer=None, binary=False):
+        self.path = path
+        self.timer = timer
+        self.tmp_path = path + '.tmp'
+        if path.endswith('.gz'):
+            # compressed on the writer thread too; level 1 since the loaders only read it once
+            fh = fast_gzip.open(self.tmp_path, 'wb' if binary else 'wt', compresslevel=1, **({} if binary else {'newline': ''}))
+        else:
+            fh = open(self.tmp_path, 'wb') if binary else open(self.tmp_path, 'w', newline='')
+        self.empty = b'' if binary else ''
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+        self.error = None
+        self.queue = queue.Queue(depth)
+        self.thread = threading.Thread(target=self._drain, args=(fh,), daemon=True)
+        self.thread.start()
+
+    def _drain(self, fh):
+        with fh:
+            while True:
+                buf = self.queue.get()
+                if buf is None:
+                    break
+                if self.error is None:
+                    try:
+                        start = time.perf_counter()
+                        fh.write(buf)
+                        if self.timer is not None:
+                            self.timer.seconds['write'] += time.perf_counter() - start
+                    except BaseException as e:
+                        self.error = e
+
+    def write(self, s):
+        self.parts.append(s)
+        self.size += len(s)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        if self.parts:
+            self.queue.put(self.empty.join(self.parts))
+            self.parts = []
+            self.size = 0
+
+    def close(self, discard=False):
+        """ finish writing and move the file into place, or remove it if discard or writing failed """
+        if self.thread.is_alive():
+            if self.parts and not discard:
+                self.queue.put(self.empty.join(self.parts))
+                self.parts = []
+            self.queue.put(None)
+            self.thread.join()
+        if discard or self.error is not None:
+            if os.path.isfile(self.tmp_path):
+                os.remove(self.tmp_path)
+            if self.error is not None and not discard:
+                raise self.error
+        elif os.path.isfile(self.tmp_path):
+            os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(discard=exc_type is not None)
+
+
+mappings = (dict, simdjson.Object) if simdjson else (dict,)
+containers = (dict, list, simdjson.Object, simdjson.Array) if simdjson else (dict, list)
+scalars = (str, int, float, bool, type(None))
+
+
+def is_scalar_list(v):
+    """ whether v is a list, or a lazy simdjson one, of scalars only """
+    if not isinstance(v, list) and not (simdjson and isinstance(v, simdjson.Array)):
+        return False
+    return all(type(x) in scalars for x in v)
+
+
+class Flattener(object):
+    """ flatten(record, '.') for a stream of similarly shaped records
+
+    the joined key of every (prefix, key) pair is computed once and interned,
+    so records that repeat the layout of earlier ones only cost dict lookups;
+    new keys or list positions are joined and remembered as they appear
+
+    given fields, only those flattened keys are produced and subtrees that
+    can't lead to one are never visited; with pysimdjson installed, loads
+    parses long lines lazily so those subtrees never become python objects either;
+    a field of json_fields holding an object or list is kept whole as its json,
+    see pack_wide_types, and left out like the keys under it otherwise
+
+    with lists, a non-empty list of scalars is kept whole as a python list
+    under its own key, for list predicates and array columns, instead of a
+    key per position; lists holding objects or lists are still flattened
+    """
+
+    def __init__(self, separator='.', fields=None, lists=False, json_fields=()):
+        self.separator = separator
+        self.lists = lists
+        self.json_fields = set(json_fields)
+        self.paths = {}
+        self.fields = None
+        self.prefixes = None
+        self.loads = ujson.loads
+        if fields is not None:
+            self.fields = set(fields)
+            # over-inclusive when keys themselves contain the separator, which is harmless
+            self.prefixes = set()
+            for field in self.fields:
+                parts = str(field).split(separator)
+                for i in range(1, len(parts)):
+                    self.prefixes.add(separator.join(parts[:i]))
+            self.wanted = self.fields | self.prefixes
+            if simdjson:
+                self.parser = simdjson.Parser()
+                self.lazy = True
+                self.loads = self._loads
+
+    def _loads(self, line):
+        """ ujson for short lines, where parsing everything is cheaper than parsing lazily """
+        if len(line) < 4096 or not self.lazy:
+            return ujson.loads(line)
+        return self.parser.parse(line)
+
+    def __call__(self, record):
+        flattened = {}
+        if record:
+            if self.fields is None:
+                self._flatten(record, None, flattened)
+            else:
+                self._project(record, None, flattened)
+        return flattened
+
+    def _flatten(self, obj, prefix, flattened):
+        paths = self.paths.get(prefix)
+        if paths is None:
+            paths = self.paths[prefix] = {}
+        for k, v in (obj.items() if type(obj) is dict else enumerate(obj)):
+            key = paths.get(k)
+            if key is None:
+                # same rules as flatten_json._construct_key
+                key = sys.intern('{}{}{}'.format(prefix, self.separator, k)) if prefix else k
+                paths[k] = key
+            t = type(v)
+            if (t is dict or t is list) and v:
+                if t is list and self.lists and is_scalar_list(v):
+                    flattened[key] = v
+                else:
+                    self._flatten(v, key, flattened)
+            else:
+                flattened[key] = v
+
+    def _path(self, paths, prefix, k):
+        key = paths.get(k)
+        if key is None:
+            key = sys.intern('{}{}{}'.format(prefix, self.separator, k)) if prefix else k
+            paths[k] = key
+        return key
+
+    def _project(self, obj, prefix, flattened):
+        """ _flatten restricted to self.fields, for dicts and lists or their lazy simdjson counterparts """
+        paths = self.paths.get(prefix)
+        if paths is None:
+            paths = self.paths[prefix] = {}
+        if isinstance(obj, dict):
+            items = obj.items()
+        elif isinstance(obj, mappings):
+            # items() converts whole subtrees and a lookup by key scans the object,
+            # so only fall back to items() for big objects with most keys wanted
+            wanted = [k for k in obj.keys() if self._path(paths, prefix, k) in self.wanted]
+            if len(obj) > 64 and len(wanted) * 16 >= len(obj):
+                items = obj.items()
+                # records are similarly shaped, so lazy parsing won't pay off for later ones
+                self.lazy = False
+            else:
+                items = [(k, obj[k]) for k in wanted]
+        else:
+            items = enumerate(obj)
+        for k, v in items:
+            key = paths.get(k)
+            if key is None:
+                key = self._path(paths, prefix, k)
+            if key not in self.wanted:
+                continue
+            if isinstance(v, containers):
+                if v:
+                    # a list field is also a prefix when other records hold objects in it
+                    if key in self.fields and self.lists and is_scalar_list(v):
+                        flattened[key] = list(v)
+                    elif key in self.prefixes:
+                        self._project(v, key, flattened)
+                    elif key in self.json_fields:
+                        # lazy objects hand over their text without being converted
+                        flattened[key] = ujson.dumps(v, escape_forward_slashes=False) if type(v) in (dict, list) else v.mini.decode('utf-8')
+                    continue
+                v = {} if isinstance(v, mappings) else []
+            if key in self.fields:
+                flattened[key] = v
+
+    def stream(self, events):
+        """ the (key, value) pairs of self(record) one at a time, from the json_events of a record too big to load
+
+        keys are not cached, records this big are mostly keys seen once; with
+        lists, the scalars of a list are held until it turns out to be a list
+        of scalars only, or are let go a key per position once it holds more
+        """
+        events = iter(events)
+        separator = self.separator
+        buffered = self.lists and self.fields is None
+        # [key, index of the next item for lists or None, number of items, scalars held or None]
+        frames = []
+        key = None
+        for event, value in events:
+            if event == 'map_key':
+                prefix = frames[-1][0]
+                key = '{}{}{}'.format(prefix, separator, value) if prefix else value
+                continue
+            if event == 'end_map' or event == 'end_array':
+                key, _, n, held = frames.pop()
+                # an empty object or list is a value of its own, as in flatten
+                if n == 0 and frames and (self.fields is None or key in self.fields):
+                    yield key, {} if event == 'end_map' else []
+                elif held:
+                    yield key, held
+                continue
+            if not frames:
+                frames.append([None, None, 0, None])
+                continue
+            frame = frames[-1]
+            frame[2] += 1
+            if frame[3] is not None:
+                if event == 'value':
+                    frame[3].append(value)
+                    frame[1] += 1
+                    continue
+                # not a list of scalars after all
+                for i, v in enumerate(frame[3]):
+                    k = '{}{}{}'.format(frame[0], separator, i)
+                    if self.fields is None or k in self.fields:
+                        yield k, v
+                frame[3] = None
+            if frame[1] is not None:
+                key = '{}{}{}'.format(frame[0], separator, frame[1]) if frame[0] else frame[1]
+                frame[1] += 1
+            if event == 'value':
+                if self.fields is None or key in self.fields:
+                    yield key, value
+            elif self.fields is not None and key not in self.wanted:
+                skip_json(events)
+            elif self.fields is None or key in self.prefixes:
+                array = event == 'start_array'
+                # a list field is also a prefix when other records hold objects in it
+                held = array and (buffered or (self.lists and key in self.fields))
+                frames.append([key, 0 if array else None, 0, [] if held else None])
+            elif key in self.json_fields or self.lists:
+                # a field holding an object or list, kept whole as its json, or as a list of scalars with lists
+                v = build_json(events, event)
+                if not v or (self.lists and is_scalar_list(v)):
+                    yield key, v
+                elif key in self.json_fields:
+                    yield key, ujson.dumps(v, escape_forward_slashes=False)
+            else:
+                skip_json(events)
+
+
+class StreamedRecord(object):
+    """ a SpilledLine that items() flattens one (key, value) pair at a time, for the writers to pass on as they arrive """
+
+    def __init__(self, line, flattener, skip=()):
+        self.line = line
+        self.flattener = flattener
+        self.skip = skip
+
+    def items(self):
+        for k, v in self.flattener.stream(self.line.events()):
+            if k not in self.skip:
+                yield k, v
+
+
+def bench_flatten(input, limit=10000):
+    """ time flatten_json.flatten against Flattener on the first limit records of input """
+    records = []
+    for lines in read_batches(input):
+        records.extend(ujson.loads(line) for line in lines[:limit - len(records)])
+        if len(records) >= limit:
+            break
+    start = time.time()
+    expected = [flatten(record, '.') for record in records]
+    generic = time.time() - start
+    flattener = Flattener()
+    start = time.time()
+    flattened = [flattener(record) for record in records]
+    cached = time.time() - start
+    # same keys, values and key order
+    if [list(d.items()) for d in flattened] != [list(d.items()) for d in expected]:
+        raise ValueError('Flattener output differs from flatten for {}'.format(input))
+    logging.info('flatten {:.0f} records/s, Flattener {:.0f} records/s, speedup {:.2f}x over {} records'.format(
+        len(records) / generic, len(records) / cached, generic / cached, len(records)))
+    return generic, cached
+
+
+def records(path, fields=None, wide=None, text=False, index=None, dropped=None, timer=None, lists=False, json_fields=()):
+    """ (line, record, numbers) for each line of path, read, parsed and flattened once for every writer
+
+    record has only scalar data, and with lists, lists of scalars,
+    restricted to fields if given, with the objects or lists of json_fields
+    as their json, see Flattener; given the wide object of a vertex file, numbers is its text,
+    see split_wide, and None for records where it doesn't fit; line is the
+    json text of the record if text is set, and None otherwise
+
+    a vertex longer than huge_record comes back as a StreamedRecord, and
+    its line as the SpilledLine, instead; with a VertexIndex, edges whose
+    from or to vertex is not in it are left out and counted by label in
+    dropped; a Timer is given the time spent reading, parsing and flattening;
+    a worker over its budget raises a MemoryError between batches, see limit_memory
+    """
+    edge = 'Edge' in path
+    if fields is not None:
+        # always needed by the writers
+        fields = list(fields) + ['_id', 'gid', 'label', 'from', 'to']
+    flattener = Flattener(fields=fields, lists=lists, json_fields=json_fields)
+    n = 0
+    for lines in prefetch(read_batches(path, spill=True, timer=timer)):
+        check_memory()
+        for line in lines:
+            numbers = None
+            if type(line) is SpilledLine:
+                if not edge:
+                    yield line if text else None, StreamedRecord(line, flattener, skip=('_id',)), None
+                    continue
+                # an edge's facets go on one line anyway, so a huge edge is still collected into a dict
+                record = dict(flattener.stream(line.events()))
+            elif wide is not None and not edge:
+                start = time.perf_counter()
+                record = ujson.loads(line)
+                parsed = time.perf_counter()
+                numbers = split_wide(record, wide)
+                record = flattener(record)
+                if timer is not None:
+                    # few records and each a big one, so all of them are timed
+                    timer.seconds['parse'] += parsed - start
+                    timer.seconds['flatten'] += time.perf_counter() - parsed
+            elif timer is not None and n % timer.sample_every == 0:
+                record = timer.flatten(flattener, line)
+            else:
+                record = flattener(flattener.loads(line))
+            n += 1
+            if index is not None and edge and (record['from'] not in index or record['to'] not in index):
+                dropped[record['label']] = dropped.get(record['label'], 0) + 1
+                continue
+            record.pop('_id', None)
+            yield line if text else None, record, numbers
+
+
+def type_stats(path, sample_size=1000, lists=False):
+    """ return {key: {py type: count}} of scalar values, sample_size=None reads the whole file
+
+    with lists, lists of scalars are kept whole, see Flattener, and their
+    elements counted as '[py type]'
+    """
+    stats = {}
+    c = 0
+    for line in values(path, lists=lists):
+        for k, v in line.items():
+            t = v.__class__.__name__
+            if t == 'list':
+                for x in v:
+                    t = x.__class__.__name__
+                    if t in ['str', 'int', 'float', 'bool']:
+                        # only once an element has a type, a list of nulls has none
+                        counts = stats.setdefault(k, {})
+                        t = '[{}]'.format(t)
+                        counts[t] = counts.get(t, 0) + 1
+                continue
+            if t not in ['str', 'int', 'float', 'bool']:
+                continue
+            counts = stats.setdefault(k, {})
+            counts[t] = counts.get(t, 0) + 1
+        if sample_size and c == sample_size:
+            break
+        c += 1
+    return stats
+
+
+def values(path, fields=None, index=None, dropped=None, timer=None, lists=False):
+    """ return a dict for each line, with only fields if given, see records """
+    for _, record, _ in records(path, fields=fields, index=index, dropped=dropped, timer=timer, lists=lists):
+        yield record
+
+
+# objects with more fields than this, all of one numeric type, take the wide path, see find_wide
+wide_threshold = 1000
+# since 4.0 ujson writes floats with the shortest digits that round trip, like repr
+wide_numbers = int(ujson.__version__.split('.')[0]) >= 4
+exponent_re = re.compile(r'e(-?)(\d+)')
+
+
+def find_wide(fieldnames, types, numeric_types):
+    """ (parent, keys, python type) of the deepest object with more than wide_threshold fields, all of one numeric type, or None
+
+    Expression and CopyNumber vertices keep tens of thousands of values
+    under one key; keys are that object's keys, in the order of fieldnames
+    """
+    counts = {}
+    for k in fieldnames:
+        parts = k.split('.')
+        for i in range(1, len(parts)):
+            parent = '.'.join(parts[:i])
+            counts[parent] = counts.get(parent, 0) + 1
+    for parent in sorted(counts, key=lambda parent: (parent.count('.'), counts[parent]), reverse=True):
+        if counts[parent] <= wide_threshold:
+            continue
+        prefix = parent + '.'
+        keys = [k[len(prefix):] for k in fieldnames if k.startswith(prefix)]
+        value_types = set(types[prefix + k] for k in keys)
+        if len(value_types) == 1 and list(value_types)[0] in numeric_types:
+            return parent, keys, numeric_types[value_types.pop()]
+    return None
+
+
+def split_wide(record, wide):
+    """ pop the wide object of (parent, keys, python type) out of a parsed record, return its values as comma separated numbers
+
+    the numbers are formatted in one go by ujson, exactly as repr would; the
+    record is left alone and None returned when the object doesn't have the
+    keys, in order, and values of the type the schema expects
+    """
+    parent, keys, value_type = wide
+    parts = parent.split('.')
+    container = record
+    for part in parts[:-1]:
+        container = container.get(part) if type(container) is dict else None
+    obj = container.get(parts[-1]) if type(container) is dict else None
+    if type(obj) is not dict or list(obj) != keys:
+        return None
+    values = list(obj.values())
+    if set(map(type, values)) != {value_type}:
+        return None
+    try:
+        numbers = ujson.dumps(values)[1:-1]
+    except (OverflowError, ValueError):
+        # nan or inf
+        return None
+    if value_type is float and 'e' in numbers:
+        # 1e-05 and 1e+16 as repr has them, not 1e-5 and 1e16
+        numbers = exponent_re.sub(lambda m: 'e' + (m.group(1) or '+') + m.group(2).zfill(2), numbers)
+    del container[parts[-1]]
+    return numbers
+
+
+def pack_wide_types(types, numeric_types):
+    """ ({key: type} with the fields of the wide object, see find_wide, replaced by one string field holding its json, [that field]) """
+    wide = find_wide(list(types), types, numeric_types)
+    if wide is None:
+        return types, []
+    parent, keys, _ = wide
+    wide_fields = set('{}.{}'.format(parent, k) for k in keys)
+    packed = {}
+    for k, t in types.items():
+        if k in wide_fields:
+            packed.setdefault(parent, 'string')
+        else:
+            packed[k] = t
+    return packed, [parent]
+
+
+def get_packed_path(schema):
+    """ the fields of a schema or header that pack_wide_types packed, see write_packed """
+    return '{}.packed.json'.format(schema)
+
+
+def write_packed(schema, fields):
+    """ keep the packed fields of schema beside it, for the sinks to take as json_fields; none removes those of an earlier run """
+    path = get_packed_path(schema)
+    if not fields:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, 'w') as fh:
+        ujson.dump(fields, fh)
+
+
+def read_packed(schema):
+    """ the packed fields written beside schema by write_packed, the only ones to keep an object or list as json """
+    path = get_packed_path(schema)
+    if not os.path.isfile(path):
+        return []
+    with open(path, 'r') as fh:
+        return ujson.load(fh)
+
+
+first_cap_re = re.compile('(.)([A-Z][a-z]+)')
+all_cap_re = re.compile('([a-z0-9])([A-Z])')
+def to_snakecase(label):
+    # handle G2P exception
+    label = label.replace("G2P", "g2p")
+    s1 = first_cap_re.sub(r'\1_\2', label)
+    return all_cap_re.sub(r'\1_\2', s1).lower()
+
+
+def get_label(path):
+    """ given path, return label """
+    path = os.path.basename(path)
+    if 'Vertex' in path:
+        file_parts = path.split('.')
+        return file_parts[file_parts.index('Vertex') - 1]
+    elif 'Edge' in path:
+        edge_composite = re.search('(^.*\.)?(.*_.*_.*)\.Edge.json*', path).group(2)
+        return to_snakecase(edge_composite.split('_')[1])
+    else:
+        raise TypeError("not a vertex or edge file: {}".format(path))
+
+
+def read_manifest(manifest):
+    """ split manifest into vertex and edge files """
+    config = {
+        'edge_files': [],
+        'vertex_files': [],
+    }
+    config = types.SimpleNamespace(**config)
+
+    with open(manifest, 'r') as stream:
+        for line in stream:
+            line = line.strip()
+            if 'Edge' in line:
+                config.edge_files.append(line)
+            elif 'Vertex' in line:
+                config.vertex_files.append(line)
+    return config
+
+
+def get_build_state_path(outdir):
+    """ what every output in outdir was built from, see build_entry """
+    return os.path.join(outdir, 'build_state.json')
+
+
+def read_build_state(outdir):
+    path = get_build_state_path(outdir)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r') as fh:
+        return ujson.load(fh)
+
+
+def write_build_state(outdir, state):
+    path = get_build_state_path(outdir)
+    with open(path + '.tmp', 'w') as fh:
+        ujson.dump(state, fh, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def file_hash(path, block_size=1024 * 1024):
+    """ blake2b of the bytes of path """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def cached_hash(path, stat, digest):
+    """ digest, recorded along with stat, while the size and mtime of path are unchanged, otherwise a fresh hash """
+    if stat_key(path) == stat:
+        return digest
+    return file_hash(path)
+
+
+def build_key(schema, limit=None, index_hash=None, integer_ids=False):
+    """ everything besides the input an output depends on: the content of its schema, the limit and the vertex index it was filtered or numbered by """
+    key = 'single-pass' if schema is None else file_hash(schema)
+    key = '{} limit={}'.format(key, limit)
+    if index_hash:
+        key = '{} index={}'.format(key, index_hash)
+    if integer_ids:
+        key = '{} integer-ids'.format(key)
+    return key
+
+
+def build_entry(input, output, key, input_hash=None):
+    return {
+        'input': input,
+        'output': output,
+        'input_stat': stat_key(input),
+        'input_hash': input_hash or file_hash(input),
+        'key': key,
+        'output_stat': stat_key(output),
+        'output_hash': file_hash(output),
+    }
+
+
+def check_build(args):
+    """ for (input, output, key, entry, hash_input) the entry, refreshed, if output is up to date
+
+    up to date means the input content and key are the ones output was built
+    from and output itself is intact; returns (entry or None, input hash or
+    None), the input is hashed when it had to be or when hash_input is set
+    """
+    input, output, key, entry, hash_input = args
+    input_hash = None
+    if entry is not None and entry['key'] == key and os.path.isfile(output):
+        input_hash = cached_hash(input, entry['input_stat'], entry['input_hash'])
+        if input_hash == entry['input_hash'] and cached_hash(output, entry['output_stat'], entry['output_hash']) == entry['output_hash']:
+            return dict(entry, input=input, input_stat=stat_key(input), output_stat=stat_key(output)), input_hash
+    if hash_input and input_hash is None:
+        input_hash = file_hash(input)
+    return None, input_hash
+
+
+def is_intact(entry, sidecars=[]):
+    """ whether the output of a build entry, and its sidecars, still exist unchanged """
+    output = entry['output']
+    if not os.path.isfile(output) or not all(os.path.isfile(f(output)) for f in sidecars):
+        return False
+    return cached_hash(output, entry['output_stat'], entry['output_hash']) == entry['output_hash']
+
+
+def reuse_build(entry, output, sidecars=[]):
+    """ hard link (or copy) the output of a build entry, and its sidecars, to output """
+    for src, dst in [(entry['output'], output)] + [(f(entry['output']), f(output)) for f in sidecars]:
+        if os.path.exists(dst + '.tmp'):
+            os.remove(dst + '.tmp')
+        try:
+            os.link(src, dst + '.tmp')
+        except OSError:
+            shutil.copyfile(src, dst + '.tmp')
+        os.replace(dst + '.tmp', dst)
+    return dict(entry, output=output, output_stat=stat_key(output))
+
+
+def gid_hash(gid):
+    """ 64 bit hash of a gid; integer ids are positions among these, so it has to be a good one """
+    return int.from_bytes(hashlib.blake2b(gid.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def gid_check(gid):
+    """ a second, independent 64 bit hash of a gid, which tells two gids of the same gid_hash apart """
+    return int.from_bytes(hashlib.blake2b(gid.encode('utf-8'), digest_size=8, person=b'gid-check').digest(), 'big')
+
+
+def write_hashes(hashes, checks, tmpdir):
+    """ run of the (hash, check) pairs of two arrays, sorted, in a temporary file
+
+    numpy sorts an index of the pairs, without it they are sorted as
+    128 bit ints in a list, see hash_size for the memory each takes
+    """
+    fd, path = tempfile.mkstemp(suffix='.index', dir=tmpdir)
+    with os.fdopen(fd, 'wb') as fh:
+        if numpy is not None:
+            hashes = numpy.frombuffer(hashes, dtype=numpy.uint64)
+            checks = numpy.frombuffer(checks, dtype=numpy.uint64)
+            order = numpy.lexsort((checks, hashes))
+            for i in range(0, len(order), 1024 * 1024):
+                block = order[i:i + 1024 * 1024]
+                numpy.stack((hashes[block], checks[block]), axis=1).tofile(fh)
+            return path
+        pairs = [h << 64 | check for h, check in zip(hashes, checks)]
+        pairs.sort()
+        block = array.array('Q')
+        for pair in pairs:
+            block.append(pair >> 64)
+            block.append(pair & 0xffffffffffffffff)
+            if len(block) == 2 * 1024 * 1024:
+                block.tofile(fh)
+                block = array.array('Q')
+        block.tofile(fh)
+    return path
+
+
+# bytes a gid takes in a run of hash_gids, its hash and check and what write_hashes sorts them with, measured with some margin
+hash_size = 16 + (32 if numpy is not None else 80)
+
+
+def read_gids(path):
+    """ the gid of each vertex in path """
+    gids = Flattener(fields=['gid'])
+    for lines in prefetch(read_batches(path, spill=True)):
+        for line in lines:
+            if type(line) is SpilledLine:
+                # records give their gid first, no need to read the rest
+                yield next(v for k, v in gids.stream(line.events()))
+            else:
+                yield ujson.loads(line)['gid']
+
+
+def hash_gids(args):
+    """ sorted runs of the gid hashes of (path, tmpdir, run_size), run_size hashes at a time, see write_hashes """
+    path, tmpdir, run_size = args
+    runs = []
+    hashes = array.array('Q')
+    checks = array.array('Q')
+    for gid in read_gids(path):
+        hashes.append(gid_hash(gid))
+        checks.append(gid_check(gid))
+        if len(hashes) >= run_size:
+            runs.append(write_hashes(hashes, checks, tmpdir))
+            hashes = array.array('Q')
+            checks = array.array('Q')
+    if hashes:
+        runs.append(write_hashes(hashes, checks, tmpdir))
+    return runs
+
+
+def read_hashes(path, block_size=1024 * 1024):
+    """ the (hash, check) pairs of a run written by write_hashes """
+    with open(path, 'rb') as fh:
+        while True:
+            block = array.array('Q')
+            block.frombytes(fh.read(2 * block_size * block.itemsize))
+            if not block:
+                break
+            yield from zip(block[::2], block[1::2])
+
+
+def build_vertex_index(paths, output, jobs=None, memory=1024):
+    """ write the sorted, unique gid hashes of every vertex in paths to output, see VertexIndex
+
+    each file is hashed on a pool of workers into sorted runs of as many
+    hashes as fit in a worker's share of memory MB, see hash_size, which are
+    then merged; a gid repeated across files is kept once, but two
+    different gids of the same hash, told apart by gid_check, raise a
+    ValueError naming them, as membership and integer ids would take one
+    for the other
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    run_size = max(1, memory // jobs) * 1024 * 1024 // hash_size
+    tmpdir = os.path.dirname(output) or '.'
+    os.makedirs(tmpdir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=tmpdir) as tmpdir:
+        with multiprocessing.Pool(jobs) as pool:
+            runs = [run for file_runs in pool.map(hash_gids, [(path, tmpdir, run_size) for path in paths]) for run in file_runs]
+        # ~64 hashes per bucket of the leading bits, so a lookup bisects a short range
+        upper_bound = sum(os.path.getsize(run) for run in runs) // 16
+        bits = min(max(1, (upper_bound // 64).bit_length()), 24)
+        shift = 64 - bits
+        buckets = array.array('Q', [0]) * ((1 << bits) + 1)
+        bucket = 0
+        count = 0
+        with open(output + '.tmp', 'wb') as fh:
+            block = array.array('Q')
+            previous = None
+            for h, check in heapq.merge(*[read_hashes(run) for run in runs]):
+                if h == previous:
+                    if check != previous_check:
+                        gids = sorted(set(gid for path in paths for gid in read_gids(path) if gid_hash(gid) == h))
+                        raise ValueError('gids {} have the same hash {:016x}'.format(', '.join(gids), h))
+                    continue
+                previous = h
+                previous_check = check
+                while bucket <= h >> shift:
+                    buckets[bucket] = count
+                    bucket += 1
+                block.append(h)
+                count += 1
+                if len(block) == 1024 * 1024:
+                    block.tofile(fh)
+                    block = array.array('Q')
+            block.tofile(fh)
+            while bucket <= 1 << bits:
+                buckets[bucket] = count
+                bucket += 1
+            buckets.tofile(fh)
+            array.array('Q', [bits]).tofile(fh)
+    os.replace(output + '.tmp', output)
+    logging.info('wrote {} vertex ids to {}'.format(count, output))
+    return output
+
+
+class VertexIndex(object):
+    """ membership test for gids against a file written by build_vertex_index
+
+    the file is the sorted hashes, the offset of each bucket of their leading
+    bits and the number of bits; it is memory mapped, so workers share it,
+    and takes 8 bytes per vertex instead of the ~100 of a python set of gids
+
+    the position of a gid's hash doubles as a dense integer id, see uid
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            self.mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        words = memoryview(self.mmap).cast('Q')
+        bits = words[-1]
+        self.shift = 64 - bits
+        self.buckets = words[-(1 << bits) - 2:-1]
+        self.hashes = words[:self.buckets[-1]]
+        # edge files tend to list the edges of a vertex together
+        self.last = None
+        self.last_position = -1
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def find(self, gid):
+        """ position of gid in the index, -1 if it is not there """
+        if gid == self.last:
+            return self.last_position
+        h = gid_hash(gid)
+        bucket = h >> self.shift
+        hi = self.buckets[bucket + 1]
+        i = bisect.bisect_left(self.hashes, h, self.buckets[bucket], hi)
+        if i < hi and self.hashes[i] == h:
+            self.last = gid
+            self.last_position = i
+            return i
+        return -1
+
+    def __contains__(self, gid):
+        return self.find(gid) >= 0
+
+    def uid(self, gid):
+        """ integer id of gid, from 1 to the number of vertices; the same in every worker and for every run over the same vertices """
+        i = self.find(gid)
+        if i < 0:
+            raise KeyError('{} is not in {}'.format(gid, self.path))
+        return i + 1
+
+
+def get_vertex_index_path(outdir):
+    return os.path.join(outdir, 'vertex_index.bin')
+
+
+def get_dropped_path(output):
+    """ per-label counts of the dangling edges left out of output """
+    return '{}.dropped.json'.format(output)
+
+
+def vertex_index(config, outdir, jobs=None, memory=1024):
+    """ build the vertex index of the manifest's vertex files unless they are unchanged; returns (path, content hash)
+
+    the content hash goes into the build key of edge outputs, so they are
+    converted again only when the set of vertices actually changed
+    """
+    path = get_vertex_index_path(outdir)
+    key_path = '{}.json'.format(path)
+    stats = [[vertex_file] + stat_key(vertex_file) for vertex_file in config.vertex_files if os.path.isfile(vertex_file)]
+    if os.path.isfile(path) and os.path.isfile(key_path):
+        with open(key_path, 'r') as fh:
+            key = ujson.load(fh)
+        if key['vertex_files'] == stats and cached_hash(path, key['stat'], key['hash']) == key['hash']:
+            logging.info('{} is up to date'.format(path))
+            return path, key['hash']
+    build_vertex_index([vertex_file for vertex_file, _, _ in stats], path, jobs=jobs, memory=memory)
+    key = {'vertex_files': stats, 'stat': stat_key(path), 'hash': file_hash(path)}
+    with open(key_path + '.tmp', 'w') as fh:
+        ujson.dump(key, fh)
+    os.replace(key_path + '.tmp', key_path)
+    return path, key['hash']
+
+
+def report_dropped(outputs, outdir):
+    """ sum the per-file counts of dangling edges, of the edge files converted to outputs, into {outdir}/dropped_edges.json """
+    dropped = {}
+    for output in outputs:
+        dropped_path = get_dropped_path(output)
+        if not os.path.isfile(dropped_path):
+            continue
+        with open(dropped_path, 'r') as fh:
+            for label, count in ujson.load(fh).items():
+                dropped[label] = dropped.get(label, 0) + count
+    report_path = os.path.join(outdir, 'dropped_edges.json')
+    with open(report_path, 'w') as fh:
+        ujson.dump(dropped, fh, indent=1)
+    for label, count in sorted(dropped.items()):
+        logging.warning('dropped {} dangling {} edges'.format(count, label))
+    logging.info('wrote {}'.format(report_path))
+
+
+def scan_schema(args):
+    """ type statistics for (path, cache_path, sample_size, lists), reused from cache_path while the file's size and mtime are unchanged
+
+    lists only applies to vertices, dgraph facets can't hold lists, see type_stats
+    """
+    path, cache_path, sample_size, lists = args
+    if sample_size and ('Expression' in path or 'CopyNumber' in path):
+        sample_size = 1  # no need to read huge, uniform records
+    lists = lists and 'Edge' not in path
+    st = os.stat(path)
+    key = {
+        'path': os.path.realpath(path),
+        'size': st.st_size,
+        'mtime': st.st_mtime_ns,
+        'sample_size': sample_size,
+        'lists': lists,
+    }
+    if os.path.isfile(cache_path):
+        with open(cache_path, 'r') as fh:
+            cached = ujson.load(fh)
+        if cached['key'] == key:
+            logging.debug('schema cache hit {}'.format(path))
+            return cached['types']
+    stats = type_stats(path, sample_size, lists)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path + '.tmp', 'w') as fh:
+        ujson.dump({'key': key, 'types': stats}, fh)
+    os.replace(cache_path + '.tmp', cache_path)
+    return stats
+
+
+def write_dropped(output, input, index, dropped):
+    """ per-label counts of the dangling edges left out of output, if it was filtered by a vertex index """
+    if index is None:
+        return
+    dropped_path = get_dropped_path(output)
+    with open(dropped_path + '.tmp', 'w') as fh:
+        ujson.dump(dropped, fh)
+    os.replace(dropped_path + '.tmp', dropped_path)
+    logging.info('dropped {} dangling edges from {}'.format(sum(dropped.values()), input))
+
+
+class Sink(object):
+    """ a writer convert hands the records of an input to
+
+    fields are the flattened keys it reads, None for all of them, and wide
+    the wide object it takes as text, see find_wide; lists is set when it
+    takes lists of scalars whole and json_fields are the fields packed by
+    --pack-wide, which take an object as its json, see read_packed; a raw sink is given
+    the json text of each record as well, see records; an indexed sink is
+    given the VertexIndex of the run as index, see convert_job
+    """
+    fields = None
+    json_fields = ()
+    wide = None
+    lists = False
+    raw = False
+    indexed = False
+
+    def open(self, timer=None):
+        """ start writing, telling timer how long writing takes """
+
+    def write(self, line, record, numbers):
+        """ one of the records of the input, see records """
+        raise NotImplementedError
+
+    def close(self, discard=False):
+        """ finish writing, or throw away what was written if discard """
+
+
+def convert(input, sinks, limit=None, index=None, dropped=None, timer=None):
+    """ read, parse and flatten input once, writing each record to every sink; return the number of records
+
+    the fields flattened are those any sink reads, lists are kept whole if
+    any sink takes them, and the wide object of a vertex is split out only
+    when every sink wants the same one; see
+    records for index and timer, which is also told the time spent in the
+    sinks; they are closed at the end, or discarded if anything failed
+    """
+    flat = [sink for sink in sinks if not sink.raw]
+    fields = []
+    if any(sink.fields is None for sink in flat):
+        fields = None
+    else:
+        for sink in flat:
+            fields.extend(sink.fields)
+    wide = None
+    if flat and all(sink.wide == flat[0].wide for sink in flat):
+        wide = flat[0].wide
+    lists = any(sink.lists for sink in flat)
+    json_fields = set(k for sink in flat for k in sink.json_fields)
+    text = len(flat) < len(sinks)
+    opened = []
+    try:
+        for sink in sinks:
+            sink.open(timer)
+            opened.append(sink)
+        c = 0
+        for line, record, numbers in records(input, fields, wide, text, index=index, dropped=dropped, timer=timer, lists=lists, json_fields=json_fields):
+            if timer is None:
+                for sink in sinks:
+                    sink.write(line, record, numbers)
+            else:
+                # time one record in sample_every, and every wide or streamed one
+                whole = numbers is not None or type(record) is StreamedRecord
+                if whole or c % timer.sample_every == 0:
+                    start = time.perf_counter()
+                    for sink in sinks:
+                        sink.write(line, record, numbers)
+                    timer.seconds['convert'] += (time.perf_counter() - start) * (1 if whole else timer.sample_every)
+                else:
+                    for sink in sinks:
+                        sink.write(line, record, numbers)
+                if c % 4096 == 0:
+                    timer.tick(c)
+            c += 1
+            if limit and c == limit:
+                break
+    except BaseException:
+        for sink in opened:
+            sink.close(discard=True)
+        raise
+    for i, sink in enumerate(sinks):
+        try:
+            sink.close()
+        except BaseException:
+            for rest in sinks[i + 1:]:
+                rest.close(discard=True)
+            raise
+    if timer is not None:
+        timer.tick(c)
+    return c
+
+
+def get_json_path(outdir, path):
+    """ the json lines a JsonSink writes for path, always compressed """
+    name = path.replace('/', '.').strip('.')
+    if name.endswith('.gz'):
+        name = name[:-len('.gz')]
+    return os.path.join(outdir, '{}.gz'.format(name))
+
+
+class JsonSink(Sink):
+    """ the records convert kept, as the json lines they were read from, for mongoimport or grip load
+
+    so the grip backends load the same vertices and edges as the others,
+    e.g. without the dangling edges; lines are copied without being encoded again
+    """
+    raw = True
+
+    def __init__(self, input, output):
+        self.input = input
+        self.output = output
+        self.count = 0
+
+    def open(self, timer=None):
+        self.writer = AsyncWriter(self.output, timer=timer, binary=True)
+
+    def write(self, line, record, numbers):
+        if type(line) is SpilledLine:
+            line.copy(self.writer)
+        else:
+            self.writer.write(line)
+        self.writer.write(b'\n')
+        self.count += 1
+
+    def close(self, discard=False):
+        self.writer.close(discard=discard)
+        if not discard:
+            logging.info('wrote {} records to {}'.format(self.count, self.output))
+
+
+def split_file(args):
+    """ re-chunk (path, chunk_dir, chunk_size) into parts of about chunk_size bytes, return the part paths
+
+    each part is a complete file of whole records, so the parts of one big input
+    can be converted side by side; parts are reused while the input's size and
+    mtime are unchanged
+    """
+    path, chunk_dir, chunk_size = args
+    if os.path.getsize(path) <= chunk_size:
+        return [path]
+    st = os.stat(path)
+    key = {
+        'path': os.path.realpath(path),
+        'size': st.st_size,
+        'mtime': st.st_mtime_ns,
+        'chunk_size': chunk_size,
+    }
+    part_dir = os.path.join(chunk_dir, path.replace('/', '.').strip('.'))
+    marker_path = os.path.join(part_dir, 'split.json')
+    if os.path.isfile(marker_path):
+        with open(marker_path, 'r') as fh:
+            marker = ujson.load(fh)
+        if marker['key'] == key and all(os.path.isfile(part) for part in marker['parts']):
+            logging.debug('reusing {} parts of {}'.format(len(marker['parts']), path))
+            return marker['parts']
+    os.makedirs(part_dir, exist_ok=True)
+    parts = []
+    out = None
+    with open(path, 'rb') as raw:
+        ins = gzip.GzipFile(fileobj=raw) if path.endswith('.gz') else raw
+        start = 0
+        for line in ins:
+            if out is None or raw.tell() - start >= chunk_size:
+                if out:
+                    out.close()
+                # keep the label and Vertex/Edge in the name, see get_label
+                part = os.path.join(part_dir, 'part{:05d}.{}'.format(len(parts), os.path.basename(path)))
+                parts.append(part)
+                if path.endswith('.gz'):
+                    out = gzip.open(part + '.tmp', 'wb', compresslevel=1)
+                else:
+                    out = open(part + '.tmp', 'wb')
+                start = raw.tell()
+            out.write(line)
+    if out:
+        out.close()
+    if len(parts) == 1:
+        # decompressed in one read, nothing to gain
+        os.remove(parts[0] + '.tmp')
+        parts = [path]
+    for part in parts:
+        if part != path:
+            os.replace(part + '.tmp', part)
+    with open(marker_path, 'w') as fh:
+        ujson.dump({'key': key, 'parts': parts}, fh)
+    logging.info('split {} into {} parts'.format(path, len(parts)))
+    return parts
+
+
+def split_manifest(manifest, chunk_dir, chunk_size=512, jobs=None):
+    """ split files larger than chunk_size MB, return the path of a manifest listing their parts instead """
+    os.makedirs(chunk_dir, exist_ok=True)
+    with open(manifest, 'r') as stream:
+        paths = [line.strip() for line in stream if line.strip()]
+    tasks = [(path, chunk_dir, chunk_size * 1024 * 1024) for path in paths if os.path.isfile(path)]
+    with multiprocessing.Pool(jobs or multiprocessing.cpu_count()) as pool:
+        parts = dict(zip([task[0] for task in tasks], pool.map(split_file, tasks, chunksize=1)))
+    chunked_manifest = os.path.join(chunk_dir, os.path.basename(manifest))
+    with open(chunked_manifest, 'w') as outfile:
+        for path in paths:
+            for part in parts.get(path, [path]):
+                outfile.write('{}\n'.format(part))
+    logging.info('wrote {}'.format(chunked_manifest))
+    return chunked_manifest
+
+
+def get_delta_group(path):
+    """ name of the delta files for the records of path, '{label}.Vertex' or '{from}_{label}_{to}.Edge' """
+    path = os.path.basename(path)
+    if 'Vertex' in path:
+        return '{}.Vertex'.format(get_label(path))
+    return '{}.Edge'.format(re.search('(^.*\.)?(.*_.*_.*)\.Edge.json*', path).group(2))
+
+
+def write_run(run, tmpdir):
+    """ sorted run of (key, group, line) in a temporary file """
+    run.sort(key=lambda record: record[0])
+    fd, path = tempfile.mkstemp(suffix='.run.gz', dir=tmpdir)
+    os.close(fd)
+    with fast_gzip.open(path, 'wt', compresslevel=1) as fh:
+        for record in run:
+            fh.write(ujson.dumps(record, escape_forward_slashes=False))
+            fh.write('\n')
+    return path
+
+
+def read_run(path):
+    with fast_gzip.open(path, 'rt') as fh:
+        for line in fh:
+            yield ujson.loads(line)
+
+
+def sorted_records(paths, tmpdir, memory=1024, sort_keys=True):
+    """ (key, group, line) of every record in paths, sorted by key and then by order read, holding about memory MB at a time
+
+    vertices are keyed by gid and edges by from, label and to; line is the
+    record without _id, with sorted keys so equal records have equal lines,
+    or in the order of its keys without sort_keys
+    """
+    # python objects take about 4 times the size of the text they hold
+    budget = memory * 1024 * 1024 // 4
+    runs = []
+    run = []
+    size = 0
+    for path in paths:
+        group = get_delta_group(path)
+        for lines in prefetch(read_batches(path)):
+            for line in lines:
+                record = ujson.loads(line)
+                record.pop('_id', None)
+                if 'from' in record:
+                    key = '\x1f'.join([record['from'], record['label'], record['to']])
+                else:
+                    key = record['gid']
+                line = ujson.dumps(record, sort_keys=sort_keys, escape_forward_slashes=False)
+                run.append((key, group, line))
+                size += len(key) + len(line)
+                if size >= budget:
+                    runs.append(write_run(run, tmpdir))
+                    run = []
+                    size = 0
+    run.sort(key=lambda record: record[0])
+    try:
+        # merge keeps records with equal keys in the order of its inputs, so in the order they were read
+        for key, group, line in heapq.merge(*[read_run(path) for path in runs], run, key=lambda record: record[0]):
+            yield key, group, line
+    finally:
+        for path in runs:
+            os.remove(path)
+
+
+def unique_records(records):
+    """ the last of every run of records with the same key """
+    previous = None
+    for record in records:
+        if previous is not None and previous[0] != record[0]:
+            yield previous
+        previous = record
+    if previous is not None:
+        yield previous
+
+
+def merge_duplicates(lines, policy='last'):
+    """ merge the lines of copies of one vertex, in manifest order, into one line; returns (line, conflicting keys)
+
+    keys, and keys of data, missing from a copy are taken from the others;
+    where copies disagree the last copy wins with policy 'last' and the first
+    with policy 'first'; keys keep the order of the first copy, so the gid
+    stays first, see line_gid
+    """
+    order = list(ujson.loads(lines[0]))
+    if policy == 'first':
+        lines = reversed(lines)
+    merged = {}
+    data = {}
+    conflicts = 0
+    for line in lines:
+        record = ujson.loads(line)
+        for target, values in [(data, record.pop('data', None) or {}), (merged, record)]:
+            for k, v in values.items():
+                if k in target and target[k] != v:
+                    conflicts += 1
+                target[k] = v
+    if data:
+        merged['data'] = data
+    merged = dict([(k, merged[k]) for k in order if k in merged] + [(k, v) for k, v in merged.items() if k not in order])
+    return ujson.dumps(merged, escape_forward_slashes=False), conflicts
+
+
+def dedupe_group(args):
+    """ write one record per gid of (group, paths, dedupe_dir, memory, policy), return the path written
+
+    the records of all the paths are sorted by gid within memory MB, spilling
+    sorted runs to disk, and copies are merged, see merge_duplicates; reused
+    while the inputs are unchanged
+    """
+    group, paths, dedupe_dir, memory, policy = args
+    output = os.path.join(dedupe_dir, '{}.json.gz'.format(group))
+    marker_path = '{}.dedupe.json'.format(output)
+    key = {'inputs': [[os.path.realpath(path)] + stat_key(path) for path in paths], 'policy': policy}
+    if os.path.isfile(marker_path) and os.path.isfile(output):
+        with open(marker_path, 'r') as fh:
+            if ujson.load(fh)['key'] == key:
+                logging.debug('reusing {}'.format(output))
+                return output
+    records = 0
+    duplicates = 0
+    conflicts = 0
+    with tempfile.TemporaryDirectory(dir=dedupe_dir) as tmpdir, AsyncWriter(output) as writer:
+        for _, copies in itertools.groupby(sorted_records(paths, tmpdir, memory, sort_keys=False), key=lambda record: record[0]):
+            lines = [line for _, _, line in copies]
+            line = lines[0]
+            if len(lines) > 1:
+                line, conflicting = merge_duplicates(lines, policy)
+                duplicates += len(lines) - 1
+                conflicts += conflicting
+            writer.write(line)
+            writer.write('\n')
+            records += 1
+    with open(marker_path + '.tmp', 'w') as fh:
+        ujson.dump({'key': key, 'records': records, 'duplicates': duplicates, 'conflicts': conflicts}, fh)
+    os.replace(marker_path + '.tmp', marker_path)
+    logging.info('wrote {} {} records to {}, merged {} duplicates with {} conflicting values'.format(records, group, output, duplicates, conflicts))
+    return output
+
+
+def dedupe_manifest(manifest, dedupe_dir, memory=1024, policy='last', jobs=None):
+    """ merge duplicate vertices of labels split across several files, return the path of a manifest listing the merged files instead
+
+    neo4j-admin keeps an arbitrary copy of a duplicate node and dgraph gets
+    its predicates several times; files that are alone in their label and
+    edge files are listed as they are
+    """
+    os.makedirs(dedupe_dir, exist_ok=True)
+    with open(manifest, 'r') as stream:
+        paths = [line.strip() for line in stream if line.strip()]
+    groups = {}
+    for path in paths:
+        if 'Edge' not in path and os.path.isfile(path):
+            groups.setdefault(get_delta_group(path), []).append(path)
+    groups = {group: group_paths for group, group_paths in groups.items() if len(group_paths) > 1}
+    jobs = max(1, min(jobs or multiprocessing.cpu_count(), len(groups)))
+    tasks = [(group, group_paths, dedupe_dir, max(1, memory // jobs), policy) for group, group_paths in groups.items()]
+    with multiprocessing.Pool(jobs) as pool:
+        merged = dict(zip(groups, pool.map(dedupe_group, tasks, chunksize=1)))
+    deduped_manifest = os.path.join(dedupe_dir, os.path.basename(manifest))
+    written = set()
+    with open(deduped_manifest, 'w') as outfile:
+        for path in paths:
+            group = get_delta_group(path) if 'Edge' not in path else None
+            if group in merged:
+                if group in written:
+                    continue
+                written.add(group)
+                path = merged[group]
+            outfile.write('{}\n'.format(path))
+    logging.info('wrote {}'.format(deduped_manifest))
+    return deduped_manifest
+
+
+# the gid of a raw vertex line that gives it first, as records do
+gid_re = re.compile(rb'\s*\{\s*"gid"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def line_gid(line, gids):
+    """ the gid of a raw vertex line, from its start where records give it, see hash_gids; gids is a Flattener(fields=['gid']) """
+    if type(line) is SpilledLine:
+        return next(v for k, v in gids.stream(line.events()))
+    # a line with another key first is parsed, its first "gid" may be that of a nested object
+    m = gid_re.match(line)
+    if m is None:
+        return ujson.loads(line)['gid']
+    return ujson.loads(b'"' + m.group(1) + b'"')
+
+
+def reservoir_gids(args):
+    """ (label, gids) of (label, paths, size, seed), gids a uniform sample of size vertices of paths, the same for the same seed
+
+    only the lines that go into the sample are parsed
+    """
+    label, paths, size, seed = args
+    # a generator per label, so a label's sample doesn't depend on the others
+    rng = random.Random('{}:{}'.format(seed, label))
+    gids = Flattener(fields=['gid'])
+    sample = []
+    n = 0
+    for path in paths:
+        for lines in prefetch(read_batches(path, spill=True)):
+            for line in lines:
+                if n < size:
+                    sample.append(line_gid(line, gids))
+                else:
+                    i = rng.randrange(n + 1)
+                    if i < size:
+                        sample[i] = line_gid(line, gids)
+                n += 1
+    return label, sample
+
+
+def get_sample_path(sample_dir, path):
+    return os.path.join(sample_dir, path.replace('/', '.').strip('.'))
+
+
+def sample_edges(args):
+    """ copy the edges of (path, sample_dir, seeds) to or from a seed, return (path, the vertices they reference) """
+    path, sample_dir, seeds = args
+    output = get_sample_path(sample_dir, path) + '.edges'
+    endpoints = set()
+    with AsyncWriter(output, binary=True) as writer:
+        for lines in prefetch(read_batches(path)):
+            for line in lines:
+                record = ujson.loads(line)
+                if record['from'] in seeds or record['to'] in seeds:
+                    endpoints.add(record['from'])
+                    endpoints.add(record['to'])
+                    writer.write(line)
+                    writer.write(b'\n')
+    return path, endpoints
+
+
+def sample_vertices(args):
+    """ copy the vertices of (path, sample_dir, gids) that are in gids, return (path, their gids) """
+    path, sample_dir, keep = args
+    output = get_sample_path(sample_dir, path)
+    found = set()
+    gids = Flattener(fields=['gid'])
+    with AsyncWriter(output, binary=True) as writer:
+        for lines in prefetch(read_batches(path, spill=True)):
+            for line in lines:
+                gid = line_gid(line, gids)
+                if gid not in keep:
+                    continue
+                found.add(gid)
+                if type(line) is SpilledLine:
+                    line.copy(writer)
+                else:
+                    writer.write(line)
+                writer.write(b'\n')
+    return path, found
+
+
+def sample_manifest(manifest, sample_dir, size, seed=0, jobs=None):
+    """ sample a connected subgraph of the manifest, return the path of a manifest listing its files instead
+
+    size vertices of each label are reservoir sampled as seeds, see
+    reservoir_gids; the edge files are read once for the edges to or from
+    a seed, and the vertices at their other ends are kept along with the
+    seeds, so no edge of the sample dangles and every seed with edges has
+    some; files are reused while the inputs, size and seed are unchanged
+    """
+    os.makedirs(sample_dir, exist_ok=True)
+    with open(manifest, 'r') as stream:
+        paths = [line.strip() for line in stream if line.strip() and os.path.isfile(line.strip())]
+    config = read_manifest(manifest)
+    vertex_files = [path for path in config.vertex_files if path in paths]
+    edge_files = [path for path in config.edge_files if path in paths]
+    sampled_manifest = os.path.join(sample_dir, os.path.basename(manifest))
+    marker_path = os.path.join(sample_dir, 'sample.json')
+    key = {'inputs': [[os.path.realpath(path)] + stat_key(path) for path in paths], 'size': size, 'seed': seed}
+    if os.path.isfile(marker_path) and os.path.isfile(sampled_manifest):
+        with open(marker_path, 'r') as fh:
+            if ujson.load(fh)['key'] == key:
+                logging.info('reusing the sample in {}'.format(sample_dir))
+                return sampled_manifest
+
+    labels = {}
+    for path in vertex_files:
+        labels.setdefault(get_label(path), []).append(path)
+    with multiprocessing.Pool(jobs or multiprocessing.cpu_count()) as pool:
+        seeds = set()
+        for label, gids in pool.map(reservoir_gids, [(label, label_paths, size, seed) for label, label_paths in labels.items()], chunksize=1):
+            seeds.update(gids)
+        keep = set(seeds)
+        for _, endpoints in pool.map(sample_edges, [(path, sample_dir, seeds) for path in edge_files], chunksize=1):
+            keep.update(endpoints)
+        found = set()
+        for _, gids in pool.map(sample_vertices, [(path, sample_dir, keep) for path in vertex_files], chunksize=1):
+            found.update(gids)
+
+    # edges to vertices the manifest doesn't have
+    edges = 0
+    dangling = 0
+    for path in edge_files:
+        output = get_sample_path(sample_dir, path)
+        with AsyncWriter(output, binary=True) as writer:
+            for lines in read_batches(output + '.edges'):
+                for line in lines:
+                    record = ujson.loads(line)
+                    if record['from'] not in found or record['to'] not in found:
+                        dangling += 1
+                        continue
+                    writer.write(line)
+                    writer.write(b'\n')
+                    edges += 1
+        os.remove(output + '.edges')
+
+    sampled = set(vertex_files + edge_files)
+    with open(sampled_manifest, 'w') as outfile:
+        for path in paths:
+            if path not in sampled:
+                continue
+            outfile.write('{}\n'.format(get_sample_path(sample_dir, path)))
+    with open(marker_path + '.tmp', 'w') as fh:
+        ujson.dump({'key': key, 'seeds': len(seeds), 'vertices': len(found), 'edges': edges, 'dangling': dangling}, fh)
+    os.replace(marker_path + '.tmp', marker_path)
+    logging.info('sampled {} seeds of {} labels, {} vertices and {} edges, leaving out {} dangling edges'.format(len(seeds), len(labels), len(found), edges, dangling))
+    logging.info('wrote {}'.format(sampled_manifest))
+    return sampled_manifest
+
+
+def diff_records(old, new):
+    """ merge join two sorted record streams into ('upsert', new), ('delete', old) and ('change', old, new) """
+    old = unique_records(old)
+    new = unique_records(new)
+    o = next(old, None)
+    n = next(new, None)
+    while o is not None or n is not None:
+        if n is None or (o is not None and o[0] < n[0]):
+            yield 'delete', o
+            o = next(old, None)
+        elif o is None or n[0] < o[0]:
+            yield 'upsert', n
+            n = next(new, None)
+        else:
+            if o[2] != n[2]:
+                yield 'change', o, n
+            o = next(old, None)
+            n = next(new, None)
+
+
+def get_delta_path(outdir, op, group):
+    return os.path.join(outdir, 'json', op, '{}.json.gz'.format(group))
+
+
+def manifest_key(manifest):
+    """ the files a manifest lists, with their sizes and mtimes """
+    config = read_manifest(manifest)
+    return [[path] + stat_key(path) for path in config.vertex_files + config.edge_files if os.path.isfile(path)]
+
+
+def upsert_line(line):
+    """ the json of the record of line with its gid as _id, the key of its document in mongo """
+    record = ujson.loads(line)
+    return ujson.dumps(dict({'_id': record['gid']}, **record), escape_forward_slashes=False)
+
+
+def diff_json(old_manifest, new_manifest, outdir, memory=1024):
+    """ write the records added, removed or changed from old_manifest to new_manifest as json deltas
+
+    json/upsert holds the new version of added and changed records, with
+    the gid as _id as grip and BsonSink key documents, json/delete the removed records and json/stale, for changed vertices,
+    {gid, label, removed} with the flattened keys the new version lacks;
+    reused as long as the inputs of both manifests are unchanged
+    """
+    marker_path = os.path.join(outdir, 'json', 'diff.json')
+    key = {'old': manifest_key(old_manifest), 'new': manifest_key(new_manifest)}
+    if os.path.isfile(marker_path):
+        with open(marker_path, 'r') as fh:
+            if ujson.load(fh) == key:
+                logging.info('{} is up to date'.format(marker_path))
+                return
+        os.remove(marker_path)
+    for op in ['upsert', 'delete', 'stale']:
+        shutil.rmtree(os.path.join(outdir, 'json', op), ignore_errors=True)
+        os.makedirs(os.path.join(outdir, 'json', op))
+    old_config = read_manifest(old_manifest)
+    new_config = read_manifest(new_manifest)
+    writers = {}
+
+    def write(op, group, line):
+        if (op, group) not in writers:
+            writers[(op, group)] = AsyncWriter(get_delta_path(outdir, op, group))
+        writers[(op, group)].write(line)
+        writers[(op, group)].write('\n')
+
+    flattener = Flattener()
+    counts = {}
+    try:
+        for typ in ['vertex_files', 'edge_files']:
+            old_files = [path for path in getattr(old_config, typ) if os.path.isfile(path)]
+            new_files = [path for path in getattr(new_config, typ) if os.path.isfile(path)]
+            with tempfile.TemporaryDirectory(dir=outdir) as tmpdir:
+                # both sides hold a run in memory at once
+                old = sorted_records(old_files, tmpdir, memory // 2)
+                new = sorted_records(new_files, tmpdir, memory // 2)
+                for change in diff_records(old, new):
+                    op = change[0]
+                    counts[op] = counts.get(op, 0) + 1
+                    if op == 'delete':
+                        write('delete', change[1][1], change[1][2])
+                        continue
+                    new_group, new_line = change[-1][1:]
+                    write('upsert', new_group, upsert_line(new_line))
+                    if op == 'change' and typ == 'vertex_files':
+                        old_record = flattener(ujson.loads(change[1][2]))
+                        new_record = flattener(ujson.loads(new_line))
+                        removed = [k for k in old_record if k not in new_record]
+                        if removed:
+                            write('stale', new_group, ujson.dumps({'gid': new_record['gid'], 'label': new_record['label'], 'removed': removed}))
+    except BaseException:
+        for writer in writers.values():
+            writer.close(discard=True)
+        raise
+    for writer in writers.values():
+        writer.close()
+    with open(marker_path + '.tmp', 'w') as fh:
+        ujson.dump(key, fh)
+    os.replace(marker_path + '.tmp', marker_path)
+    logging.info('{} added, {} removed, {} changed records'.format(counts.get('upsert', 0), counts.get('delete', 0), counts.get('change', 0)))
+
+
+def read_delta(outdir, op):
+    """ (group, path) of the delta files of op """
+    directory = os.path.join(outdir, 'json', op)
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json.gz'):
+            yield name[:-len('.json.gz')], os.path.join(directory, name)
+
+
+# bytes of resident memory a worker may use, checked between batches by records, see limit_memory
+memory_budget = None
+
+
+def limit_memory(megabytes):
+    """ pool initializer, give each worker a budget of resident memory
+
+    a cap on the address space would count what is mapped rather than used,
+    e.g. the vertex index, thread stacks and the arenas of the allocator
+    """
+    global memory_budget
+    memory_budget = megabytes * 1024 * 1024 if megabytes else None
+
+
+def resident_memory():
+    """ bytes of memory this process holds now, or at its peak where /proc isn't there """
+    try:
+        with open('/proc/self/statm', 'rb') as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def check_memory():
+    """ raise a MemoryError once this worker holds more than its memory_budget """
+    if memory_budget is not None:
+        used = resident_memory()
+        if used > memory_budget:
+            raise MemoryError('worker holds {} MB, over its budget of {} MB'.format(used >> 20, memory_budget >> 20))
+
+
+def worker_count(jobs=None, worker_memory=None):
+    """ jobs or the cpu count, capped so that workers of worker_memory MB fit in physical memory """
+    jobs = jobs or multiprocessing.cpu_count()
+    if worker_memory:
+        total_memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        jobs = max(1, min(jobs, total_memory // (worker_memory * 1024 * 1024)))
+    return jobs
+
+
+def log_progress(files, total_files, size, total_size, start):
+    """ log how much of the input of a run has been converted, by compressed bytes, and when it should be done """
+    elapsed = time.time() - start
+    rate = size / elapsed if elapsed else 0
+    eta = datetime.timedelta(seconds=round((total_size - size) / rate)) if rate else '?'
+    logging.info('converted {} of {} files, {:.1%} of {:.1f} MB, {:.2f} MB/s, eta {}'.format(
+        files, total_files, size / total_size if total_size else 1, total_size / 1e6, rate / 1e6, eta))
+
+
+def write_timings(reports, timings_dir, name, start, skipped=0):
+    """ the per file timings of a run and their totals to {timings_dir}/{name}_{time}.json, return its path """
+    elapsed = time.time() - start
+    size = sum(report['input_bytes'] for report in reports)
+    stages = {stage: round(sum(report['stages'][stage] for report in reports), 3) for stage in Timer.stages}
+    total = {
+        'files': len(reports),
+        'skipped': skipped,
+        'input_bytes': size,
+        'records': sum(report['records'] for report in reports),
+        'seconds': round(elapsed, 3),
+        'mb_per_sec': round(size / 1e6 / elapsed, 3) if elapsed else None,
+        'stages': stages,
+        'peak_rss_mb': max(report['peak_rss_mb'] for report in reports) if reports else None,
+    }
+    os.makedirs(timings_dir, exist_ok=True)
+    path = os.path.join(timings_dir, '{}_{}.json'.format(name, time.strftime('%Y%m%d%H%M%S', time.localtime(start))))
+    with open(path, 'w') as fh:
+        ujson.dump({'total': total, 'files': reports}, fh, indent=2)
+    logging.info('{} files, {} records, {:.1f} MB in {:.1f}s; {}'.format(
+        total['files'], total['records'], size / 1e6, elapsed, ', '.join('{} {:.1f}s'.format(k, v) for k, v in stages.items())))
+    logging.info('wrote {}'.format(path))
+    return path
+
+
+def convert_job(args):
+    """ convert an input once for all its sinks, for (input, sinks, limit, vertex_index, timings_dir, profile)
+
+    sinks are (class, output, options, key, input_hash), each built in the
+    worker as class(input, output, **options), with index=VertexIndex as well
+    for indexed ones; edges to or from vertices missing from vertex_index
+    are dropped for every sink, see write_dropped
+
+    return (input, [(output, build entry)], error, timings); with profile,
+    the stacks sampled while converting are written to {timings_dir}/{input name}.stacks
+    """
+    input, sinks, limit, vertex_index, timings_dir, profile = args
+    outputs = [output for _, output, _, _, _ in sinks]
+    timer = Timer(input)
+    sampler = StackSampler() if profile else None
+    try:
+        index = VertexIndex(vertex_index) if vertex_index else None
+        edge_index = index if 'Edge' in input else None
+        dropped = {}
+        built = [cls(input, output, index=index, **options) if cls.indexed else cls(input, output, **options) for cls, output, options, _, _ in sinks]
+        convert(input, built, limit=limit, index=edge_index, dropped=dropped, timer=timer)
+        input_hash = sinks[0][4] or file_hash(input)
+        entries = []
+        for _, output, _, key, _ in sinks:
+            write_dropped(output, input, edge_index, dropped)
+            entries.append((output, build_entry(input, output, key, input_hash)))
+        return input, entries, None, timer.report(outputs)
+    except Exception:
+        # never leave a stale file behind to be mistaken for a finished one
+        for output in outputs:
+            if os.path.isfile(output):
+                os.remove(output)
+        return input, [], traceback.format_exc(), timer.report(outputs)
+    finally:
+        if sampler:
+            os.makedirs(timings_dir, exist_ok=True)
+            sampler.write(os.path.join(timings_dir, '{}.stacks'.format(input.replace('/', '.').strip('.'))))
+
+
+def convert_all(config, backends, limit=None, index=None, jobs=None, worker_memory=None, timings_dir='timings', name='convert', profile=False):
+    """ convert every file in config on a pool of workers, largest input first, reading each once for all backends
+
+    a backend is a SimpleNamespace of its outdir, which holds its build
+    state, reuse_from, the outdir of a previous build or None, and functions
+    of an input path giving its output, the (sink class, options) writing
+    it, its build key and its sidecars, see is_intact; index is the (path,
+    content hash) of a vertex index, see vertex_index, passed to every sink
+
+    outputs whose input content and key are unchanged since they were built
+    are kept; outputs of identical inputs in this or a reuse_from directory
+    are linked rather than converted again; an input is converted for the
+    backends whose outputs are left
+
+    progress is logged as files finish, by compressed bytes converted, and
+    the time each file took per stage and its workers peak RSS are written
+    to {timings_dir}/{name}_{time}.json; with profile, the stacks sampled
+    in each worker too, see StackSampler
+    """
+    start = time.time()
+    index_path = index[0] if index else None
+    states = [read_build_state(backend.outdir) for backend in backends]
+    # (input hash, key) -> entry, for inputs that moved or were copied
+    builts = []
+    for backend, state in zip(backends, states):
+        built = {}
+        for entry in list(read_build_state(backend.reuse_from).values() if backend.reuse_from else []) + list(state.values()):
+            built[(entry['input_hash'], entry['key'])] = entry
+        builts.append(built)
+    paths = []
+    candidates = []
+    for path in config.vertex_files + config.edge_files:
+        if not os.path.isfile(path):
+            logging.warning('{} does not exist'.format(path))
+            continue
+        paths.append(path)
+        for backend, state, built in zip(backends, states, builts):
+            output_path = backend.output(path)
+            candidates.append((path, output_path, backend.key(path), state.get(output_path), len(built) > 0))
+
+    with multiprocessing.Pool(jobs or multiprocessing.cpu_count()) as pool:
+        checked = iter(pool.map(check_build, candidates))
+    candidates = iter(candidates)
+    # output -> the build state it goes in
+    owners = {}
+    tasks = []
+    for path in paths:
+        sinks = []
+        for backend, state, built in zip(backends, states, builts):
+            _, output_path, key, _, _ = next(candidates)
+            entry, input_hash = next(checked)
+            sidecars = backend.sidecars(path)
+            if entry is not None and all(os.path.isfile(f(output_path)) for f in sidecars):
+                logging.info('skipping {}, {} is up to date'.format(path, output_path))
+                state[output_path] = entry
+                continue
+            previous = built.get((input_hash, key))
+            if previous is not None and previous['output'] != output_path and is_intact(previous, sidecars):
+                logging.info('skipping {}, reusing {}'.format(path, previous['output']))
+                state[output_path] = dict(reuse_build(previous, output_path, sidecars), input=path, input_stat=stat_key(path))
+                continue
+            cls, options = backend.sink(path)
+            sinks.append((cls, output_path, options, key, input_hash))
+            owners[output_path] = (backend.outdir, state)
+        if sinks:
+            tasks.append((path, sinks, limit, index_path, timings_dir, profile))
+    for backend, state in zip(backends, states):
+        write_build_state(backend.outdir, state)
+    # start the biggest files first so they don't straggle at the end
+    tasks.sort(key=lambda task: os.path.getsize(task[0]), reverse=True)
+
+    failed = []
+    reports = []
+    total_size = sum(os.path.getsize(task[0]) for task in tasks)
+    done_size = 0
+    convert_start = time.time()
+    with multiprocessing.Pool(worker_count(jobs, worker_memory), initializer=limit_memory, initargs=(worker_memory,), maxtasksperchild=1) as pool:
+        for path, entries, error, report in pool.imap_unordered(convert_job, tasks):
+            reports.append(report)
+            done_size += report['input_bytes']
+            log_progress(len(reports), len(tasks), done_size, total_size, convert_start)
+            if error:
+                logging.error('failed to convert {}\n{}'.format(path, error))
+                failed.append(path)
+                continue
+            for output_path, entry in entries:
+                outdir, state = owners[output_path]
+                state[output_path] = entry
+                write_build_state(outdir, state)
+    write_timings(reports, timings_dir, name, start, skipped=len(paths) - len(tasks))
+    if failed:
+        raise SystemExit('{} of {} conversions failed: {}'.format(len(failed), len(tasks), ', '.join(failed)))
@@ -0,0 +1,239 @@
+""" bson dumps of the grip vertex and edge collections, for mongorestore, see util/convert.py """
+import gzip
+import logging
+import os
+import shlex
+import shutil
+import struct
+import ujson
+
+from core.convert import AsyncWriter, Sink, SpilledLine
+
+pack_int32 = struct.Struct('<i').pack
+pack_int64 = struct.Struct('<q').pack
+pack_double = struct.Struct('<d').pack
+unpack_int32 = struct.Struct('<i').unpack_from
+unpack_int64 = struct.Struct('<q').unpack_from
+unpack_double = struct.Struct('<d').unpack_from
+
+# mongod refuses larger documents
+max_bson_size = 16 * 1024 * 1024
+# key -> its bson cstring, keys repeat in every record of a file
+cstrings = {}
+# array elements are keyed by their position
+index_keys = [str(i).encode() + b'\x00' for i in range(1024)]
+
+
+def cstring(key):
+    """ key as a bson element name """
+    name = cstrings.get(key)
+    if name is None:
+        if '\x00' in key:
+            raise ValueError('bson keys can not contain a null character: {!r}'.format(key))
+        name = cstrings[key] = key.encode('utf-8') + b'\x00'
+    return name
+
+
+def encode_element(name, v, parts):
+    """ append the bson element of a json value v, named by the cstring name, to parts """
+    t = v.__class__
+    if t is str:
+        b = v.encode('utf-8')
+        parts.append(b'\x02' + name + pack_int32(len(b) + 1) + b + b'\x00')
+    elif t is bool:
+        parts.append(b'\x08' + name + (b'\x01' if v else b'\x00'))
+    elif t is int and -0x80000000 <= v <= 0x7fffffff:
+        parts.append(b'\x10' + name + pack_int32(v))
+    elif t is int and -0x8000000000000000 <= v <= 0x7fffffffffffffff:
+        parts.append(b'\x12' + name + pack_int64(v))
+    elif t is float or t is int:
+        # bigger integers are doubles, as mongoimport reads them
+        parts.append(b'\x01' + name + pack_double(float(v)))
+    elif v is None:
+        parts.append(b'\x0a' + name)
+    elif t is dict:
+        parts.append(b'\x03' + name + encode_document(v))
+    elif t is list:
+        parts.append(b'\x04' + name + encode_array(v))
+    else:
+        raise TypeError('no bson type for {!r}'.format(v))
+
+
+def encode_document(doc, id=None):
+    """ the bson of a dict of json values, with id as its _id, in place of any _id it has, if given """
+    parts = []
+    if id is not None:
+        encode_element(b'_id\x00', id, parts)
+    for k, v in doc.items():
+        if id is not None and k == '_id':
+            continue
+        encode_element(cstring(k), v, parts)
+    body = b''.join(parts)
+    return pack_int32(len(body) + 5) + body + b'\x00'
+
+
+def encode_array(values):
+    parts = []
+    for i, v in enumerate(values):
+        encode_element(index_keys[i] if i < len(index_keys) else str(i).encode() + b'\x00', v, parts)
+    body = b''.join(parts)
+    return pack_int32(len(body) + 5) + body + b'\x00'
+
+
+def decode_document(data, offset=0, array=False):
+    """ (dict, or list if array, of the bson document at offset of data, offset after it) """
+    end = offset + unpack_int32(data, offset)[0] - 1
+    offset += 4
+    doc = {}
+    while offset < end:
+        t = data[offset]
+        name_end = data.index(b'\x00', offset + 1)
+        k = data[offset + 1:name_end].decode('utf-8')
+        offset = name_end + 1
+        if t == 0x02:
+            n = unpack_int32(data, offset)[0]
+            v = data[offset + 4:offset + 3 + n].decode('utf-8')
+            offset += 4 + n
+        elif t == 0x08:
+            v = data[offset] == 1
+            offset += 1
+        elif t == 0x10:
+            v = unpack_int32(data, offset)[0]
+            offset += 4
+        elif t == 0x12:
+            v = unpack_int64(data, offset)[0]
+            offset += 8
+        elif t == 0x01:
+            v = unpack_double(data, offset)[0]
+            offset += 8
+        elif t == 0x0a:
+            v = None
+        elif t == 0x03 or t == 0x04:
+            v, offset = decode_document(data, offset, t == 0x04)
+        else:
+            raise ValueError('unsupported bson type 0x{:02x} of {}'.format(t, k))
+        doc[k] = v
+    if data[end] != 0:
+        raise ValueError('bson document not terminated at {}'.format(end))
+    return list(doc.values()) if array else doc, end + 1
+
+
+def bson_documents(path):
+    """ the documents of a bson file, e.g. of a dump, decoded to dicts; .gz files are decompressed """
+    with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as fh:
+        while True:
+            size = fh.read(4)
+            if not size:
+                break
+            n = unpack_int32(size)[0]
+            data = size + fh.read(n - 4)
+            if len(data) < n:
+                raise ValueError('truncated bson document in {}'.format(path))
+            yield decode_document(data)[0]
+
+
+def get_bson_path(outdir, path):
+    """ the bson documents a BsonSink writes for path, always compressed, see write_dump """
+    name = path.replace('/', '.').strip('.')
+    for suffix in ['.gz', '.json']:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return os.path.join(outdir, 'parts', '{}.bson.gz'.format(name))
+
+
+class BsonSink(Sink):
+    """ the records convert kept, as the documents grip keeps in mongo, with the gid as _id
+
+    records are parsed again from their json, as the flattened ones have
+    lost their nesting; records too big for mongo are left out and logged
+    """
+    raw = True
+
+    def __init__(self, input, output):
+        self.input = input
+        self.output = output
+        self.count = 0
+        self.too_large = 0
+
+    def open(self, timer=None):
+        os.makedirs(os.path.dirname(self.output), exist_ok=True)
+        self.writer = AsyncWriter(self.output, timer=timer, binary=True)
+
+    def write(self, line, record, numbers):
+        if type(line) is SpilledLine:
+            # longer than huge_record, which is mongo's limit already
+            self.too_large += 1
+            return
+        doc = ujson.loads(line)
+        data = encode_document(doc, id=doc['gid'])
+        if len(data) > max_bson_size:
+            self.too_large += 1
+            return
+        self.writer.write(data)
+        self.count += 1
+
+    def close(self, discard=False):
+        self.writer.close(discard=discard)
+        if discard:
+            return
+        if self.too_large:
+            logging.warning('left {} records of more than {} bytes out of {}'.format(self.too_large, max_bson_size, self.output))
+        logging.info('wrote {} records to {}'.format(self.count, self.output))
+
+
+# the indexes grip creates on its collections
+collection_indexes = {
+    'vertices': ['label'],
+    'edges': ['from', 'to', 'label'],
+}
+
+
+def write_dump(config, outdir, graph, db='grip', insertion_workers=8, mongo_host='mongo', grip_host='grip:8202'):
+    """ join the bson parts of the files in config into a mongodump of the collections of graph and write {outdir}/load_bson.sh to restore it
+
+    a gzip file may hold several members, so the compressed parts are
+    appended as they are; {outdir}/dump/{db}/ then has the bson and
+    metadata, with the indexes grip expects, of {graph}_vertices and
+    {graph}_edges, for a single mongorestore of both
+
+    load_bson.sh restores into mongo_host and registers the graph with
+    grip_host, unless MONGO_HOST or GRIP_HOST say otherwise when it runs
+    """
+    dump_dir = os.path.join(outdir, 'dump', db)
+    os.makedirs(dump_dir, exist_ok=True)
+    for kind, paths in [('vertices', config.vertex_files), ('edges', config.edge_files)]:
+        collection = '{}_{}'.format(graph, kind)
+        bson_path = os.path.join(dump_dir, '{}.bson.gz'.format(collection))
+        metadata_path = os.path.join(dump_dir, '{}.metadata.json.gz'.format(collection))
+        parts = [get_bson_path(outdir, path) for path in paths if os.path.isfile(get_bson_path(outdir, path))]
+        if not parts:
+            # an empty file is no gzip, grip create makes the collection instead
+            for stale in [bson_path, metadata_path]:
+                if os.path.isfile(stale):
+                    os.remove(stale)
+            logging.warning('no {} to restore into {}'.format(kind, collection))
+            continue
+        with open(bson_path + '.tmp', 'wb') as out:
+            for part in parts:
+                with open(part, 'rb') as fh:
+                    shutil.copyfileobj(fh, out, 16 * 1024 * 1024)
+        os.replace(bson_path + '.tmp', bson_path)
+        logging.info('wrote {}'.format(bson_path))
+        ns = '{}.{}'.format(db, collection)
+        indexes = [{'v': 2, 'key': {'_id': 1}, 'name': '_id_', 'ns': ns}]
+        indexes.extend({'v': 2, 'key': {k: 1}, 'name': '{}_1'.format(k), 'ns': ns} for k in collection_indexes[kind])
+        with gzip.open(metadata_path, 'wt') as fh:
+            ujson.dump({'options': {}, 'indexes': indexes, 'collectionName': collection}, fh)
+        logging.info('wrote {}'.format(metadata_path))
+
+    load_path = os.path.join(outdir, 'load_bson.sh')
+    with open(load_path, 'w') as outfile:
+        outfile.write('#!/bin/bash\n\nset -e\n\n')
+        outfile.write('MONGO_HOST=${{MONGO_HOST:-{}}}\n'.format(shlex.quote(mongo_host)))
+        outfile.write('GRIP_HOST=${{GRIP_HOST:-{}}}\n\n'.format(shlex.quote(grip_host)))
+        outfile.write('mongorestore --host="$MONGO_HOST" --gzip --numInsertionWorkersPerCollection {} --bypassDocumentValidation --dir {}\n'.format(
+            insertion_workers, shlex.quote(os.path.abspath(os.path.join(outdir, 'dump')))))
+        # registers the graph with grip, whose indexes are restored already
+        outfile.write('grip create {} --host "$GRIP_HOST"\n'.format(shlex.quote(graph)))
+    logging.info('wrote {}'.format(load_path))
+    return load_path
@@ -1,239 +1,492 @@
 import argparse
-import gzip
+import glob
+import hashlib
+import itertools
 import logging
 import multiprocessing
 import os
 import re
+import shutil
 import sys
+import time
 import types
 import ujson
+import zlib
 
-from flatten_json import flatten
-
-
-def reader(path):
-    if path.endswith('.gz'):
-        return gzip.open(path, 'r')
-    else:
-        return open(path, 'r')
-
-
-def to_vertex(path):
-    """ vertex with only scalar data """
-    with reader(path) as ins:
-        for line in ins:
-            line = flatten(ujson.loads(line), '.')
-            del line['_id']
-            yield line
-
-
-def to_edge(path):
-    """ edge with only scalar data """
-    with reader(path) as ins:
-        for line in ins:
-            line = flatten(ujson.loads(line), '.')
-            del line['_id']
-            yield line
+# the conversion core shared with neo4j/to_csv.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from core.convert import (  # noqa: E402
+    AsyncWriter,
+    bench_flatten,
+    build_key,
+    convert,
+    convert_all,
+    dedupe_manifest,
+    diff_json,
+    find_wide,
+    get_dropped_path,
+    get_label,
+    Held,
+    pack_wide_types,
+    read_batches,
+    read_delta,
+    read_manifest,
+    read_packed,
+    report_dropped,
+    sample_manifest,
+    scan_schema,
+    Sink,
+    split_manifest,
+    StreamedRecord,
+    type_stats,
+    values,
+    vertex_index,
+    VertexIndex,
+    wide_numbers,
+    write_dropped,
+    write_packed,
+)
 
 
 def keys(path, sample_size=1000):
     """ return [names of keys] and [types of keys]"""
     if 'Expression' in path or 'CopyNumber' in path:
         sample_size = 1  # no need to read huge, uniform records
-    kv_scheme = {}
-    c = 0
-    xformer = to_vertex
-    if 'Edge' in path:
-        xformer = to_edge
-    for line in xformer(path):
-        kv_scheme.update({k: line[k].__class__.__name__ for k in line.keys() if line[k] is not None})
-        if c == sample_size:
-            break
-        c += 1
-
-    decorated_keys = []
+    kv_scheme = type_stats(path, sample_size)
     keys = list(kv_scheme.keys())
-    for key in keys:
-        py_type = kv_scheme[key]
-        if py_type not in ['str', 'int', 'float', 'bool']:
-            continue
-        decorated_keys.append('{}:{}'.format(key, py_type))
+    decorated_keys = ['{}:{}'.format(key, widen(kv_scheme[key])) for key in keys]
     return keys, decorated_keys
 
 
-def values(path):
-    """ return a dict for each line """
-    xformer = to_vertex
-    if 'Edge' in path:
-        xformer = to_edge
-    for line in xformer(path):
-        yield line
-
-
-first_cap_re = re.compile('(.)([A-Z][a-z]+)')
-all_cap_re = re.compile('([a-z0-9])([A-Z])')
-def to_snakecase(label):
-    # handle G2P exception
-    label = label.replace("G2P", "g2p")
-    s1 = first_cap_re.sub(r'\1_\2', label)
-    return all_cap_re.sub(r'\1_\2', s1).lower()
-
-
-def get_label(path):
-    """ given path, return label """
-    path = os.path.basename(path)
-    if 'Vertex' in path:
-        file_parts = path.split('.')
-        return file_parts[file_parts.index('Vertex') - 1]
-    elif 'Edge' in path:
-        edge_composite = re.search('(^.*\.)?(.*_.*_.*)\.Edge.json*', path).group(2)
-        return to_snakecase(edge_composite.split('_')[1])
-    else:
-        raise TypeError("not a vertex or edge file: {}".format(path))
-
-
 def to_header_dict(path, output=None):
     """ generate header dictionary """
     fieldnames, decorated_fieldnames = keys(path)
     return dict(zip(fieldnames, decorated_fieldnames))
 
 
+# write schema files for each type
+py2dgraph = {
+    'str': 'string',
+}
+# handle type mismatches in unified schema
+# keys of form (current, new)
+type_prio = {
+    ('string', 'string'): 'string',
+    ('string', 'int'): 'string',
+    ('string', 'float'): 'string',
+    ('string', 'bool'): 'string',
+    ('int', 'int'): 'int',
+    ('int', 'string'): 'string',
+    ('int', 'float'): 'float',
+    ('int', 'bool'): 'string',
+    ('float', 'float'): 'float',
+    ('float', 'string'): 'string',
+    ('float', 'int'): 'float',
+    ('float', 'bool'): 'string',
+    ('bool', 'bool'): 'bool',
+    ('bool', 'string'): 'string',
+    ('bool', 'int'): 'string',
+    ('bool', 'float'): 'string',
+}
+
+
 def get_output_path(outdir, path):
-    return os.path.join(outdir, '{}.rdf'.format(path.replace('/', '.').strip('.')))
+    return os.path.join(outdir, '{}.rdf.gz'.format(path.replace('/', '.').strip('.')))
+
+
+def get_stats_path(output):
+    """ per-file type statistics written by a single pass conversion """
+    return '{}.schema.json'.format(output)
+
+
+def get_cache_path(outdir, path):
+    """ per-file type statistics cached by cmd_gen """
+    return os.path.join(outdir, 'schema_cache', '{}.json'.format(path.replace('/', '.').strip('.')))
+
+
+def to_headers(file_stats):
+    """ given [(path, type statistics)], return {label: {key: 'key:type'}} widened across files """
+    label_types = {}
+    for path, stats in file_stats:
+        label = get_label(path)
+        typ = 'Vertex' if 'Vertex' in path else 'Edge'
+        label = '{}.{}'.format(label, typ)
+        if label not in label_types:
+            label_types[label] = {}
+        for k, type_counts in stats.items():
+            label_types[label].setdefault(k, {}).update(type_counts)
+    headers = {}
+    for label, types in label_types.items():
+        headers[label] = {k: '{}:{}'.format(k, widen(type_counts)) for k, type_counts in types.items()}
+    return headers
+
+
+def widen(type_counts):
+    """ given {py type: count}, return the dgraph type that fits all values, a list type if any were in lists, see type_stats """
+    t = None
+    for py_type in type_counts:
+        new_t = py2dgraph.get(py_type.strip('[]'), py_type.strip('[]'))
+        if py_type.startswith('['):
+            new_t = '[{}]'.format(new_t)
+        t = new_t if t is None else unify(t, new_t)
+    return t
+
+
+def unify(current, new):
+    """ type_prio for types that may be list types, e.g. [string], giving a list type if either is one """
+    t = type_prio[(current.strip('[]'), new.strip('[]'))]
+    if current.startswith('[') or new.startswith('['):
+        return '[{}]'.format(t)
+    return t
+
+
+# literals of repeated strings (chromosomes, project ids, ...), filled until it holds 65536;
+# only short strings repeat, long ones would just pin text in memory
+string_literals = {}
+
+
+def convert_string(x):
+    literal = string_literals.get(x) if type(x) is str else None
+    if literal is None:
+        literal = ujson.dumps(str(x).strip().replace('\n', '').replace('\r', '').replace('\\', ''), escape_forward_slashes=False)
+        if type(x) is str and len(x) <= 64 and len(string_literals) < 65536:
+            string_literals[x] = literal
+    return literal
+
+
+def convert_bool(x):
+    return '"True"' if x else '"False"'
+
+
+def convert_int(x):
+    return '"%d"' % int(x)
+
+
+def convert_float(x):
+    return '"%r"' % float(x)
+
+
+converters = {
+    'string': convert_string,
+    'bool': convert_bool,
+    'int': convert_int,
+    'float': convert_float,
+}
 
 
 def convert_value(x, typ):
     if x is None:
         return None
-    if typ == 'string':
-        x = str(x).strip().replace('\n', '').replace('\r', '').replace('\\', '')
-        return ujson.dumps(x, escape_forward_slashes=False)
-    elif typ == 'bool':
-        return '"{}"'.format(bool(x))
-    elif typ == 'int':
-        return '"{}"'.format(int(x))
-    elif typ == 'float':
-        return '"{}"'.format(float(x))
-    else:
+    if typ.startswith('['):
+        # a list predicate, a literal per element
+        return [convert_value(e, typ[1:-1]) for e in (x if type(x) is list else [x]) if e is not None]
+    if typ not in converters:
         raise TypeError("unknown type: {}".format(typ))
+    return converters[typ](x)
+
+
+valid_re = re.compile('[^a-zA-Z0-9\-\_]+')
+
+
+def blank_node(gid):
+    """ the blank node of a gid, dgraph bulk assigns it a uid and --store_xids keeps its name """
+    return '_:' + valid_re.sub('-', gid)
+
 
+def convert_xid(x):
+    return ujson.dumps(x, escape_forward_slashes=False)
 
-def to_rdf(input, output, schema, limit=None):
-    """ file to rdf '{path}.rdf' """
+
+def read_schema(schema):
+    """ fieldnames, in order, and {fieldname: type} from a schema file """
     fieldnames = []
     types = {}
     with open(schema, 'r') as fh:
         for line in fh:
             line = line.split(' ')
             f = line[0].strip(':').strip('<').strip('>')
-            t = line[1]
+            # a handful of types shared by every field, not a string each
+            t = sys.intern(line[1])
             fieldnames.append(f)
             types[f] = t
-    valid_re = re.compile('[^a-zA-Z0-9\-\_]+')
-    with open(output, 'w') as writer:
-        c = 0
-        for line in values(input):
-            row = {k: convert_value(line[k], types[k]) for k in fieldnames if k in line and k not in ['gid', 'label', 'from', 'to']}
-            if 'Edge' in input:
-                writer.write('_:{} <{}> _:{}'.format(valid_re.sub('-', line['from']),
-                                                     line['label'],
-                                                     valid_re.sub('-', line['to'])))
-                if len(row) > 0:
-                    attrs = []
-                    for k, v in row.items():
-                        attrs.append('{}={}'.format(k, v))
-                    writer.write(' ({})'.format(', '.join(attrs)))
-                writer.write(' .\n')
-            else:
-                gid = valid_re.sub('-', line['gid'])
-                # https://docs.dgraph.io/howto/#giving-nodes-a-type
-                writer.write('_:{} <label.{}> "" .\n'.format(gid, line['label']))
-                for k, v in row.items():
-                    if v is None:
-                        continue
-                    # hack to ignore embedded json docs
-                    # if v.startswith("{"):
-                        # logging.warning("skipping field %s", k)
-                        # continue
-                    rdf = '_:{} <{}> {} .\n'.format(gid, k, v)
-                    writer.write(rdf)
-            c += 1
-            if limit and c == limit:
-                break
-        logging.info('wrote {} records to {}'.format(c, output))
-    return output
+    return fieldnames, types
 
 
-def to_rdf_job(path, outdir, limit=None):
-    """ cmd line to transform json to rdf """
-    output_path = get_output_path(outdir, path)
-    label = get_label(path)
-    typ = 'Vertex' if 'Vertex' in path else 'Edge'
-    label = '{}.{}'.format(label, typ)
-    schema_path = os.path.join(outdir, '{}.schema.rdf'.format(label))
-    comment = ''
-    if os.path.isfile(output_path):
-        comment = '# '
-    if limit:
-        limit = '--limit {}'.format(limit)
-    else:
-        limit = ''
-    script_dir = os.path.dirname(os.path.realpath(__file__))
-    return '{}python3.7 {}/to_rdf.py convert --input {} --output {} --schema {} {}'.format(comment, script_dir, path, output_path, schema_path, limit)
+def compile_field(k, typ):
+    """ (key, predicate, converter) for one field of an emitter, that of the elements for a list type """
+    typ = typ.strip('[]')
+    if typ not in converters:
+        raise TypeError("unknown type: {}".format(typ))
+    return (k, ' <{}> '.format(k), converters[typ])
 
 
-def cmd_gen(manifest, cmd_outdir, rdf_outdir, limit):
-    """ render commands to generate rdf file(s) and for for loading them into dgraph """
+def compile_emitter(fieldnames, types):
+    """ the fields of a schema as a tuple of (key, predicate, converter), built once per file """
+    return tuple(compile_field(k, types[k]) for k in fieldnames if k not in ['gid', 'label', 'from', 'to'])
 
-    config = {
-        'edge_files': [],
-        'vertex_files': [],
-    }
-    config = types.SimpleNamespace(**config)
 
-    with open(manifest, 'r') as stream:
-        for line in stream:
-            line = line.strip()
-            if 'Edge' in line:
-                config.edge_files.append(line)
-            else:
-                config.vertex_files.append(line)
+def emit_vertex(line, emitter, out, node=blank_node):
+    """ append the triples of a vertex to out, returns the number of triples """
+    gid = node(line['gid'])
+    # https://docs.dgraph.io/howto/#giving-nodes-a-type
+    out.append('{} <label.{}> "" .\n'.format(gid, line['label']))
+    return 1 + emit_fields(gid, line, emitter, out)
 
-    vertex_rdfs = {}
-    edge_rdfs = {}
-    to_rdf_commands = []
-    headers = {}
-    # read all files to determine header by label
-    for path in config.vertex_files + config.edge_files:
-        if not os.path.isfile(path):
-            logging.warning('{} does not exist'.format(path))
+
+def emit_fields(gid, line, emitter, out):
+    """ append the triples of the fields of a record to out, returns the number of triples """
+    n = 0
+    for k, predicate, convert in emitter:
+        v = line.get(k)
+        if v is None:
             continue
-        label = get_label(path)
-        typ = 'Vertex' if 'Vertex' in path else 'Edge'
-        label = '{}.{}'.format(label, typ)
-        if label not in headers:
-            headers[label] = {}
-        headers[label] = {**headers[label], **to_header_dict(path)}
-    # write schema files for each type
-    py2dgraph = {
-        'str': 'string',
-    }
-    # handle type mismatches in unified schema
-    # keys of form (current, new)
-    type_prio = {
-        ('string', 'string'): 'string',
-        ('string', 'int'): 'string',
-        ('string', 'float'): 'string',
-        ('string', 'bool'): 'string',
-        ('int', 'int'): 'int',
-        ('int', 'string'): 'string',
-        ('int', 'float'): 'float',
-        ('int', 'bool'): 'string',
-        ('float', 'float'): 'float',
-        ('float', 'string'): 'string',
-        ('float', 'int'): 'float',
-        ('float', 'bool'): 'string',
-    }
+        # hack to ignore embedded json docs
+        # if v.startswith("{"):
+            # logging.warning("skipping field %s", k)
+            # continue
+        if type(v) is list:
+            # a list predicate, a triple per element
+            for x in v:
+                if x is not None:
+                    out.append(gid + predicate + convert(x) + ' .\n')
+                    n += 1
+            continue
+        out.append(gid + predicate + convert(v) + ' .\n')
+        n += 1
+    return n
+
+
+def emit_streamed(record, field_of, out, writer, node=blank_node):
+    """ write the triples of a StreamedRecord vertex to writer as its pairs arrive, after what out has so far
+
+    field_of(key, value) is the (key, predicate, converter) of a pair or
+    None; the triples of pairs are only held until the gid and label are
+    known, which records give first, and past held_size in a temporary
+    file, see Held
+    """
+    writer.write(''.join(out))
+    out.clear()
+    # the writer buffers by size, a count of triples could be any size with values this long
+    write = writer.write
+    gid = label = None
+    held = Held()
+    waiting = []
+    for k, v in record.items():
+        if waiting is not None:
+            if k == 'gid':
+                gid = node(v)
+            elif k == 'label':
+                label = v
+        field = field_of(k, v)
+        if field is not None and v is not None:
+            for x in (v if type(v) is list else (v,)):
+                if x is None:
+                    continue
+                if waiting is not None:
+                    waiting.append(held.hold(field[1] + field[2](x) + ' .\n'))
+                else:
+                    write(gid + field[1] + field[2](x) + ' .\n')
+        if waiting is not None and gid is not None and label is not None:
+            write('{} <label.{}> "" .\n'.format(gid, label))
+            for token in waiting:
+                write(gid + held.take(token))
+            waiting = None
+            held.close()
+    held.close()
+    if waiting is not None:
+        raise KeyError('label' if gid is not None else 'gid')
+
+
+def emit_edge(line, emitter, out, node=blank_node):
+    """ append the triple of an edge, with its facets, to out, returns the number of triples """
+    attrs = ['{}={}'.format(k, convert(line[k]) if line[k] is not None else None) for k, _, convert in emitter if k in line]
+    out.append('{} <{}> {}{} .\n'.format(node(line['from']),
+                                         line['label'],
+                                         node(line['to']),
+                                         ' ({})'.format(', '.join(attrs)) if attrs else ''))
+    return 1
+
+
+def bench_rdf(input, schema, limit=100000):
+    """ records/s and triples/s of the compiled emitter against per-value convert_value and format on the first limit records of input """
+    fieldnames, types = read_schema(schema)
+    records = []
+    for line in values(input, fields=fieldnames, lists=any(t.startswith('[') for t in types.values())):
+        records.append(line)
+        if len(records) == limit:
+            break
+    edge = 'Edge' in input
+    start = time.time()
+    expected = []
+    for line in records:
+        row = {k: convert_value(line[k], types[k]) for k in fieldnames if k in line and k not in ['gid', 'label', 'from', 'to']}
+        if edge:
+            expected.append('_:{} <{}> _:{}'.format(valid_re.sub('-', line['from']), line['label'], valid_re.sub('-', line['to'])))
+            if len(row) > 0:
+                expected.append(' ({})'.format(', '.join('{}={}'.format(k, v) for k, v in row.items())))
+            expected.append(' .\n')
+        else:
+            gid = valid_re.sub('-', line['gid'])
+            expected.append('_:{} <label.{}> "" .\n'.format(gid, line['label']))
+            for k, v in row.items():
+                for literal in (v if type(v) is list else [v]):
+                    if literal is not None:
+                        expected.append('_:{} <{}> {} .\n'.format(gid, k, literal))
+    generic = time.time() - start
+    start = time.time()
+    emitter = compile_emitter(fieldnames, types)
+    emit = emit_edge if edge else emit_vertex
+    out = []
+    triples = sum(emit(line, emitter, out) for line in records)
+    compiled = time.time() - start
+    if ''.join(out) != ''.join(expected):
+        raise ValueError('compiled emitter output differs from convert_value for {}'.format(input))
+    for name, elapsed in [('convert_value', generic), ('compiled', compiled)]:
+        logging.info('{} {:.0f} records/s, {:.0f} triples/s'.format(name, len(records) / elapsed, triples / elapsed))
+    logging.info('speedup {:.2f}x over {} records, {} triples'.format(generic / compiled, len(records), triples))
+    return generic, compiled
+
+
+class RdfSink(Sink):
+    """ writes the records of input to output as rdf, see to_rdf, or with a shard plan to the shards, see ShardWriter """
+    indexed = True
+
+    def __init__(self, input, output, schema=None, index=None, integer_ids=False, shard_plan=None):
+        if integer_ids and index is None:
+            raise ValueError('integer ids are assigned by a vertex index')
+        self.input = input
+        self.output = output
+        self.schema = schema
+        self.shard_plan = shard_plan
+        self.node = blank_node
+        # fields every record starts with
+        prefix = ()
+        if integer_ids:
+            self.node = lambda gid: '<0x{:x}>'.format(index.uid(gid))
+            if 'Edge' not in input:
+                prefix = (('gid', ' <xid> ', convert_xid),)
+        self.prefix = prefix
+        self.emit = emit_edge if 'Edge' in input else emit_vertex
+        self.stats = {}
+        # (key, python type) -> field of a per-record emitter when there is no schema
+        self.compiled = {}
+        self.out = []
+        self.count = 0
+        if schema:
+            fieldnames, types = read_schema(schema)
+            self.fields = fieldnames
+            self.lists = any(t.startswith('[') for t in types.values())
+            self.json_fields = read_packed(schema)
+            self.emitter = prefix + compile_emitter(fieldnames, types)
+            lookup = {field[0]: field for field in self.emitter}
+            self.field_of = lambda k, v: lookup.get(k)
+            if wide_numbers and 'Edge' not in input:
+                self.wide = find_wide(fieldnames, types, {'float': float, 'int': int})
+        else:
+            self.lookup = {field[0]: field for field in prefix}
+            self.field_of = self.tally
+        if self.wide:
+            # the wide object goes out through one template, the other fields around it as usual
+            parent, keys, _ = self.wide
+            wide_fields = set('{}.{}'.format(parent, k) for k in keys)
+            first = min(i for i, k in enumerate(fieldnames) if k in wide_fields)
+            self.before = prefix + compile_emitter([k for k in fieldnames[:first] if k not in wide_fields], types)
+            self.after = compile_emitter([k for k in fieldnames[first:] if k not in wide_fields], types)
+            self.template = ''.join('\x00 <{}> "%s" .\n'.format('{}.{}'.format(parent, k).replace('%', '%%')) for k in keys)
+
+    def tally(self, k, v):
+        """ the field of a pair of a StreamedRecord when there is no schema, tallying its type as write does """
+        t = v.__class__
+        field = self.compiled.get((k, t))
+        if field is None:
+            if t.__name__ not in ['str', 'int', 'float', 'bool']:
+                return None
+            field = self.compiled[(k, t)] = compile_field(k, py2dgraph.get(t.__name__, t.__name__))
+        counts = self.stats.setdefault(k, {})
+        counts[t.__name__] = counts.get(t.__name__, 0) + 1
+        return self.lookup.get(k) if k in ['gid', 'label', 'from', 'to'] else field
+
+    def open(self, timer=None):
+        if self.shard_plan is not None:
+            self.writer = ShardWriter(self.output, self.shard_plan, timer=timer)
+        else:
+            self.writer = AsyncWriter(self.output, timer=timer)
+
+    def write(self, line, record, numbers):
+        out = self.out
+        if numbers is not None:
+            gid = self.node(record['gid'])
+            self.emit(record, self.before, out, self.node)
+            out.append((self.template % tuple(numbers.split(','))).replace('\x00', gid))
+            emit_fields(gid, record, self.after, out)
+        elif type(record) is StreamedRecord:
+            emit_streamed(record, self.field_of, out, self.writer, self.node)
+        elif self.schema:
+            self.emit(record, self.emitter, out, self.node)
+        else:
+            emitter = list(self.prefix)
+            compiled = self.compiled
+            stats = self.stats
+            for k, v in record.items():
+                t = v.__class__
+                field = compiled.get((k, t))
+                if field is None:
+                    if t.__name__ not in ['str', 'int', 'float', 'bool']:
+                        continue
+                    field = compiled[(k, t)] = compile_field(k, py2dgraph.get(t.__name__, t.__name__))
+                counts = stats.setdefault(k, {})
+                counts[t.__name__] = counts.get(t.__name__, 0) + 1
+                if k not in ['gid', 'label', 'from', 'to']:
+                    emitter.append(field)
+            self.emit(record, emitter, out, self.node)
+        # a wide record is a few MB of rdf on its own
+        if len(out) >= 4096 or numbers is not None or type(record) is StreamedRecord:
+            self.writer.write(''.join(out))
+            out.clear()
+        self.count += 1
+
+    def close(self, discard=False):
+        if not discard:
+            self.writer.write(''.join(self.out))
+        self.writer.close(discard=discard)
+        if discard:
+            return
+        logging.info('wrote {} records to {}'.format(self.count, self.output))
+        if not self.schema:
+            stats_path = get_stats_path(self.output)
+            with open(stats_path + '.tmp', 'w') as fh:
+                ujson.dump({'input': self.input, 'types': self.stats}, fh)
+            os.replace(stats_path + '.tmp', stats_path)
+            logging.info('wrote {}'.format(stats_path))
+
+
+def to_rdf(input, output, schema=None, limit=None, vertex_index=None, integer_ids=False, timer=None):
+    """ file to rdf '{path}.rdf'
+
+    without a schema, each value is converted according to its own type and
+    the types seen are tallied into '{output}.schema.json' for merge_schema
+
+    with a vertex_index, see build_vertex_index, edges to or from vertices
+    not in it are dropped and counted by label in '{output}.dropped.json';
+    with integer_ids as well, nodes are written as the uids VertexIndex.uid
+    assigns, which saves dgraph bulk mapping every blank node, and the gid
+    is kept verbatim in <xid>
+
+    vertices longer than huge_record are written a triple at a time as
+    they are parsed, see emit_streamed, so memory doesn't grow with them
+
+    a Timer, if given, is told the time spent in each stage and logs progress
+    """
+    index = VertexIndex(vertex_index) if vertex_index else None
+    edge_index = index if 'Edge' in input else None
+    dropped = {}
+    convert(input, [RdfSink(input, output, schema, index, integer_ids)], limit=limit, index=edge_index, dropped=dropped, timer=timer)
+    write_dropped(output, input, edge_index, dropped)
+    return output
+
+
+def write_schemas(headers, rdf_outdir):
+    """ write {label}.schema.rdf for each label and the unified schema.rdf """
     unified_schema = {}
     # write individual schemas and create a unified schema
     for label in headers.keys():
@@ -243,10 +496,13 @@ def cmd_gen(manifest, cmd_outdir, rdf_outdir, limit):
                 f, t = v.split(":")
                 if f in ["gid", "label", "from", "to"]:
                     continue
+                if t == 'None':
+                    # no value of it had a type, e.g. lists of nulls only
+                    continue
                 t = py2dgraph.get(t, t)
                 if f in unified_schema:
                     ct = unified_schema[f]
-                    t = type_prio[(ct, t)]
+                    t = unify(ct, t)
                 unified_schema[f] = t
                 myfile.write('<{}>: {} .\n'.format(f, t))
         # write overall schema
@@ -254,6 +510,527 @@ def cmd_gen(manifest, cmd_outdir, rdf_outdir, limit):
         with open(output_path, "w", newline='') as myfile:
             for k,v in unified_schema.items():
                 myfile.write('<{}>: {} .\n'.format(k, v))
+            # blank node names kept by dgraph bulk --store_xids, so diff deltas can find the nodes again
+            myfile.write('<xid>: string @index(exact) .\n')
+
+
+def merge_schema(manifest, rdf_outdir):
+    """ reduce the per-file type statistics of a single pass conversion into schema files """
+    config = read_manifest(manifest)
+    file_stats = []
+    for path in config.vertex_files + config.edge_files:
+        if not os.path.isfile(path):
+            logging.warning('{} does not exist'.format(path))
+            continue
+        stats_path = get_stats_path(get_output_path(rdf_outdir, path))
+        with open(stats_path, 'r') as fh:
+            file_stats.append((path, ujson.load(fh)['types']))
+    write_schemas(to_headers(file_stats), rdf_outdir)
+
+
+def get_shard_dir(rdf_outdir):
+    return os.path.join(rdf_outdir, 'shards')
+
+
+def get_shard_marker_path(rdf_outdir, path):
+    """ the output of path when sharding, listing the parts its triples went to, see ShardWriter """
+    name = os.path.basename(get_output_path(rdf_outdir, path))[:-len('.rdf.gz')]
+    return os.path.join(get_shard_dir(rdf_outdir), '{}.shard.json'.format(name))
+
+
+def estimate_predicate_sizes(config, rdf_outdir, integer_ids=False):
+    """ {predicate: estimated bytes} of the rdf of config's files, before converting them
+
+    each file's size is spread over its predicates by the number of values
+    of their keys in the type statistics infer_schema cached, see scan_schema;
+    an edge file's goes to its label and the fields --pack-wide packed to their parent
+    """
+    sizes = {}
+    for path in config.vertex_files + config.edge_files:
+        if not os.path.isfile(path):
+            continue
+        label = get_label(path)
+        counts = {}
+        if 'Edge' in path:
+            counts['<{}>'.format(label)] = 1
+        else:
+            with open(get_cache_path(rdf_outdir, path), 'r') as fh:
+                stats = ujson.load(fh)['types']
+            packed = read_packed(os.path.join(rdf_outdir, '{}.Vertex.schema.rdf'.format(label)))
+            for k, type_counts in stats.items():
+                if k == 'gid':
+                    if not integer_ids:
+                        continue
+                    predicate = '<xid>'
+                elif k == 'label':
+                    predicate = '<label.{}>'.format(label)
+                else:
+                    predicate = '<{}>'.format(next((p for p in packed if k.startswith(p + '.')), k))
+                counts[predicate] = counts.get(predicate, 0) + sum(type_counts.values())
+        total = sum(counts.values())
+        size = os.path.getsize(path)
+        for predicate, n in counts.items():
+            sizes[predicate] = sizes.get(predicate, 0) + size * n // total
+    return sizes
+
+
+def assign_predicates(sizes, shards):
+    """ {predicate: shard} balancing the bytes of each shard, largest predicate first
+
+    a predicate bigger than a shard's fair share is spread over every shard
+    by subject instead, marked by shard -1
+    """
+    share = sum(sizes.values()) / shards
+    loads = [0] * shards
+    assignment = {}
+    for predicate, size in sorted(sizes.items(), key=lambda item: (-item[1], item[0])):
+        if size > share:
+            assignment[predicate] = -1
+            loads = [load + size / shards for load in loads]
+            continue
+        shard = loads.index(min(loads))
+        assignment[predicate] = shard
+        loads[shard] += size
+    return assignment
+
+
+def plan_shards(config, rdf_outdir, shards, integer_ids=False, memory=1024):
+    """ how RdfSink routes the triples of config's files to shards, see ShardWriter
+
+    the assignment of predicates, see assign_predicates, is made from
+    estimate_predicate_sizes and kept in {rdf_outdir}/shards/assignment.json
+    while shards is unchanged, so a changed input doesn't move predicates
+    and rebuild every output; memory is the MB of triples a worker holds
+    """
+    shard_dir = get_shard_dir(rdf_outdir)
+    os.makedirs(shard_dir, exist_ok=True)
+    assignment_path = os.path.join(shard_dir, 'assignment.json')
+    assignment = None
+    if os.path.isfile(assignment_path):
+        with open(assignment_path, 'r') as fh:
+            kept = ujson.load(fh)
+        if kept['shards'] == shards:
+            assignment = kept['assignment']
+    if assignment is None:
+        assignment = assign_predicates(estimate_predicate_sizes(config, rdf_outdir, integer_ids), shards)
+        with open(assignment_path + '.tmp', 'w') as fh:
+            ujson.dump({'shards': shards, 'assignment': assignment}, fh)
+        os.replace(assignment_path + '.tmp', assignment_path)
+    spread = sorted(predicate for predicate, shard in assignment.items() if shard < 0)
+    if spread:
+        logging.info('spreading {} over every shard'.format(', '.join(spread)))
+    key = hashlib.blake2b(ujson.dumps(assignment, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+    return types.SimpleNamespace(shards=shards, assignment=assignment, key='{}:{}'.format(shards, key), memory=memory)
+
+
+class ShardWriter(object):
+    """ an AsyncWriter for the rdf of an input that routes its triples by predicate to the shards of a plan, see plan_shards
+
+    path is the marker listing the parts written, see get_shard_marker_path;
+    triples are held until about plan.memory MB are buffered, then every
+    shard's buffer is sorted by subject and written as a part of its own.
+    Spread predicates go to the shard of their subject and the ones the
+    assignment doesn't know, e.g. of keys past the sample, to that of their
+    name. Parts are named afresh on every build, so those of the marker
+    being replaced stay intact until clean_shards removes them
+    """
+
+    def __init__(self, path, plan, timer=None):
+        self.path = path
+        self.plan = plan
+        self.timer = timer
+        self.name = '{}.{}'.format(os.path.basename(path)[:-len('.shard.json')], os.urandom(4).hex())
+        # python strings take about 4 times the size of the text they hold
+        self.budget = plan.memory * 1024 * 1024 // 4
+        self.buffers = {}
+        self.size = 0
+        self.parts = []
+
+    def write(self, text):
+        # the sink writes whole triples, so the last piece is empty
+        assignment = self.plan.assignment
+        shards = self.plan.shards
+        buffers = self.buffers
+        for line in text.split('\n')[:-1]:
+            subject, predicate, _ = line.split(' ', 2)
+            shard = assignment.get(predicate)
+            if shard is None:
+                shard = zlib.crc32(predicate.encode('utf-8')) % shards
+            elif shard < 0:
+                shard = zlib.crc32(subject.encode('utf-8')) % shards
+            buffer = buffers.get(shard)
+            if buffer is None:
+                buffer = buffers[shard] = []
+            buffer.append(line)
+            self.size += len(line)
+        if self.size >= self.budget:
+            self.flush()
+
+    def flush(self):
+        """ write every shard's buffer, sorted by subject, as its next part """
+        for shard, lines in sorted(self.buffers.items()):
+            lines.sort()
+            part = os.path.join(os.path.dirname(self.path), '{:03d}'.format(shard), '{}.{:03d}.rdf.gz'.format(self.name, len(self.parts)))
+            os.makedirs(os.path.dirname(part), exist_ok=True)
+            with AsyncWriter(part, timer=self.timer) as writer:
+                for i in range(0, len(lines), 4096):
+                    writer.write('\n'.join(lines[i:i + 4096]))
+                    writer.write('\n')
+            self.parts.append(part)
+        self.buffers = {}
+        self.size = 0
+
+    def close(self, discard=False):
+        """ write the last parts and the marker listing them, or remove the parts written if discard """
+        if discard:
+            for part in self.parts:
+                os.remove(part)
+            return
+        self.flush()
+        with open(self.path + '.tmp', 'w') as fh:
+            ujson.dump({'parts': self.parts}, fh)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def clean_shards(rdf_outdir, markers, shards):
+    """ remove the markers not in markers, with their sidecars, and the parts none of them lists, log the size of each shard """
+    shard_dir = get_shard_dir(rdf_outdir)
+    markers = set(markers)
+    parts = set()
+    for name in os.listdir(shard_dir):
+        if '.shard.json' not in name:
+            continue
+        path = os.path.join(shard_dir, name)
+        if path[:path.index('.shard.json') + len('.shard.json')] not in markers:
+            os.remove(path)
+        elif name.endswith('.shard.json'):
+            with open(path, 'r') as fh:
+                parts.update(ujson.load(fh)['parts'])
+    for path in glob.glob(os.path.join(shard_dir, '*', '*.rdf.gz*')):
+        if path not in parts:
+            os.remove(path)
+    for shard in range(shards):
+        shard_parts = [part for part in parts if os.path.basename(os.path.dirname(part)) == '{:03d}'.format(shard)]
+        logging.info('shard {}: {} parts, {} bytes'.format(shard, len(shard_parts), sum(os.path.getsize(part) for part in shard_parts)))
+
+
+def stored_xid(gid, integer_ids=False):
+    """ the <xid> dgraph keeps for a gid: the gid itself with integer ids, else the name of its blank node, which dgraph bulk --store_xids keeps """
+    return convert_xid(gid if integer_ids else valid_re.sub('-', gid))
+
+
+def delete_blocks(outdir, integer_ids=False):
+    """ (query, delete) lines of an upsert block for every removed vertex or edge and every stale vertex
+
+    nodes are found by their <xid>, see stored_xid; each block gets
+    variables of its own, numbered across the blocks
+    """
+    n = 0
+    for group, path in read_delta(outdir, 'delete'):
+        for lines in read_batches(path):
+            for line in lines:
+                record = ujson.loads(line)
+                if group.endswith('.Edge'):
+                    yield (['f{} as var(func: eq(xid, {}))'.format(n, stored_xid(record['from'], integer_ids)),
+                            't{} as var(func: eq(xid, {}))'.format(n, stored_xid(record['to'], integer_ids))],
+                           ['uid(f{0}) <{1}> uid(t{0}) .'.format(n, record['label'])])
+                else:
+                    yield (['v{} as var(func: eq(xid, {}))'.format(n, stored_xid(record['gid'], integer_ids))],
+                           ['uid(v{}) * * .'.format(n)])
+                n += 1
+    for group, path in read_delta(outdir, 'stale'):
+        for lines in read_batches(path):
+            for line in lines:
+                record = ujson.loads(line)
+                yield (['v{} as var(func: eq(xid, {}))'.format(n, stored_xid(record['gid'], integer_ids))],
+                       ['uid(v{}) <{}> * .'.format(n, k) for k in record['removed']])
+                n += 1
+
+
+def set_blocks(outdir):
+    """ (query, set) lines of an upsert block for every added or changed vertex, then every added edge, of a dgraph loaded with integer ids
+
+    dgraph live --upsertPredicate xid finds nodes by the names of blank
+    nodes, which can't hold every gid, so these find them by the gid kept in
+    <xid> and create the ones that aren't there; values are converted by
+    their own type, as to_rdf does without a schema. A vertex and an edge
+    never share a block, an edge would make a second node of a new vertex
+    """
+    compiled = {}
+    n = 0
+    for group, path in sorted(read_delta(outdir, 'upsert'), key=lambda item: item[0].endswith('.Edge')):
+        edge = group.endswith('.Edge')
+        if edge and n:
+            yield None
+        for record in values(path):
+            emitter = []
+            for k, v in record.items():
+                t = v.__class__
+                if k in ['gid', 'label', 'from', 'to'] or t.__name__ not in ['str', 'int', 'float', 'bool']:
+                    continue
+                field = compiled.get((k, t))
+                if field is None:
+                    field = compiled[(k, t)] = compile_field(k, py2dgraph.get(t.__name__, t.__name__))
+                emitter.append(field)
+            # a variable for each node, one for both ends of a loop, as dgraph rejects unused ones
+            nodes = {}
+            for var, gid in ([('f', record['from']), ('t', record['to'])] if edge else [('v', record['gid'])]):
+                nodes.setdefault(gid, '{}{}'.format(var, n))
+            query = ['{} as var(func: eq(xid, {}))'.format(var, stored_xid(gid, True)) for gid, var in nodes.items()]
+            out = ['uid({}) <xid> {} .\n'.format(var, stored_xid(gid, True)) for gid, var in nodes.items()]
+            (emit_edge if edge else emit_vertex)(record, emitter, out, lambda gid: 'uid({})'.format(nodes[gid]))
+            yield (query, ''.join(out).splitlines())
+            n += 1
+
+
+def write_upsert_block(path, blocks, mutation='delete'):
+    """ an upsert block of the (query, mutation) lines of blocks, mutation is delete or set """
+    with open(path, 'w') as fh:
+        fh.write('upsert {\n  query {\n')
+        for query, _ in blocks:
+            for q in query:
+                fh.write('    {}\n'.format(q))
+        fh.write('  }}\n\n  mutation {{\n    {} {{\n'.format(mutation))
+        for _, lines in blocks:
+            for line in lines:
+                fh.write('      {}\n'.format(line))
+        fh.write('    }\n  }\n}\n')
+
+
+def write_upsert_blocks(blocks, directory, batch_size, mutation='delete'):
+    """ write blocks to upsert blocks of batch_size in directory, a None in blocks ends one early; returns their paths """
+    paths = []
+    batch = []
+    for block in itertools.chain(blocks, [None]):
+        if block is not None:
+            batch.append(block)
+        if batch and (block is None or len(batch) == batch_size):
+            paths.append(os.path.join(directory, '{:05d}.rdf'.format(len(paths))))
+            write_upsert_block(paths[-1], batch, mutation)
+            batch = []
+    return paths
+
+
+def diff(old_manifest, new_manifest, outdir, memory=1024, batch_size=1000, integer_ids=False):
+    """ rdf deltas from old_manifest to new_manifest and {outdir}/load_delta.sh to apply them to a running dgraph
+
+    dgraph/upsert/*.rdf.gz are set mutations for dgraph live in upsert mode,
+    which finds existing nodes by the xids dgraph bulk --store_xids keeps;
+    dgraph/delete/*.rdf are upsert blocks of batch_size removed vertices,
+    removed edges or changed vertices with predicates they no longer have
+
+    with integer_ids, for a dgraph loaded with them, nodes are found by the
+    gid kept in <xid> instead, and dgraph/upsert/*.rdf are upsert blocks of
+    batch_size vertices or edges too, see set_blocks
+    """
+    diff_json(old_manifest, new_manifest, outdir, memory=memory)
+    rdf_dir = os.path.join(outdir, 'dgraph')
+    shutil.rmtree(rdf_dir, ignore_errors=True)
+    os.makedirs(os.path.join(rdf_dir, 'upsert'))
+    os.makedirs(os.path.join(rdf_dir, 'delete'))
+    upserts = []
+    if integer_ids:
+        upserts = write_upsert_blocks(set_blocks(outdir), os.path.join(rdf_dir, 'upsert'), batch_size, 'set')
+    else:
+        for group, path in read_delta(outdir, 'upsert'):
+            output = os.path.join(rdf_dir, 'upsert', '{}.rdf.gz'.format(group))
+            to_rdf(path, output)
+            os.remove(get_stats_path(output))
+            upserts.append(output)
+    deletes = write_upsert_blocks(delete_blocks(outdir, integer_ids), os.path.join(rdf_dir, 'delete'), batch_size)
+    logging.info('wrote {} upsert files and {} delete blocks to {}'.format(len(upserts), len(deletes), rdf_dir))
+
+    load_path = os.path.join(outdir, 'load_delta.sh')
+    with open(load_path, 'w') as outfile:
+        outfile.write('set -e\n')
+        for path in deletes + (upserts if integer_ids else []):
+            outfile.write("curl -sSf -H 'Content-Type: application/rdf' --data-binary @{} 'http://alpha:8080/mutate?commitNow=true' > /dev/null\n".format(path))
+        if upserts and not integer_ids:
+            outfile.write('dgraph live --files {} --upsertPredicate xid --alpha alpha:9080 --zero zero:5080\n'.format(','.join(upserts)))
+    logging.info('wrote {}'.format(load_path))
+
+
+def infer_schema(config, rdf_outdir, full_scan=False, jobs=None, pack_wide=False, cache_dir=None, native_lists=False):
+    """ read all files to determine schema by label
+
+    with pack_wide, the wide object of a label, see find_wide, becomes one
+    string predicate holding its json instead of a predicate per key
+
+    with native_lists, a list of scalars of a vertex becomes one list
+    predicate, e.g. [string], with a triple per element, instead of a
+    predicate per position; lists of objects are still flattened
+
+    cache_dir holds the type statistics of each file, see scan_schema, by
+    default the outdir; another converter run on the same files can share them
+    """
+    scan = []
+    for path in config.vertex_files + config.edge_files:
+        if not os.path.isfile(path):
+            logging.warning('{} does not exist'.format(path))
+            continue
+        scan.append(path)
+    sample_size = None if full_scan else 1000
+    with multiprocessing.Pool(jobs or multiprocessing.cpu_count()) as pool:
+        stats = pool.map(scan_schema, [(path, get_cache_path(cache_dir or rdf_outdir, path), sample_size, native_lists) for path in scan], chunksize=1)
+    headers = to_headers(zip(scan, stats))
+    packed = {}
+    if pack_wide:
+        for label, header in headers.items():
+            types, packed[label] = pack_wide_types({k: v.split(':')[1] for k, v in header.items()}, {'float': float, 'int': int})
+            headers[label] = {k: '{}:{}'.format(k, t) for k, t in types.items()}
+    write_schemas(headers, rdf_outdir)
+    for label in headers:
+        write_packed(os.path.join(rdf_outdir, '{}.schema.rdf'.format(label)), packed.get(label))
+
+
+def rdf_backend(rdf_outdir, single_pass=False, limit=None, index_hash=None, integer_ids=False, reuse_from=None, shard_plan=None):
+    """ the rdf outputs of the files of a manifest, for convert_all, see run; with a shard plan, see plan_shards, their shard markers """
+
+    def schema(path):
+        if single_pass:
+            return None
+        label = '{}.{}'.format(get_label(path), 'Vertex' if 'Vertex' in path else 'Edge')
+        return os.path.join(rdf_outdir, '{}.schema.rdf'.format(label))
+
+    def key(path):
+        indexed = 'Edge' in path or integer_ids
+        key = build_key(schema(path), limit, index_hash if indexed else None, integer_ids)
+        if shard_plan is not None:
+            key = '{} shards={}'.format(key, shard_plan.key)
+        return key
+
+    def sidecars(path):
+        files = [get_stats_path] if single_pass else []
+        if index_hash and 'Edge' in path:
+            # edges filtered by the vertex index also keep their dropped counts
+            files.append(get_dropped_path)
+        return files
+
+    def output(path):
+        if shard_plan is not None:
+            return get_shard_marker_path(rdf_outdir, path)
+        return get_output_path(rdf_outdir, path)
+
+    return types.SimpleNamespace(
+        outdir=rdf_outdir,
+        # the parts a marker lists stay in the shards of its own outdir
+        reuse_from=reuse_from if shard_plan is None else None,
+        output=output,
+        sink=lambda path: (RdfSink, {'schema': schema(path), 'integer_ids': integer_ids, 'shard_plan': shard_plan}),
+        key=key,
+        sidecars=sidecars,
+    )
+
+
+def run(manifest, rdf_outdir, limit=None, single_pass=False, full_scan=False, jobs=None, worker_memory=None, chunk_size=None, chunk_dir=None, reuse_from=None, drop_dangling=False, dedupe=False, dedupe_policy='last', integer_ids=False, shards=None, pack_wide=False, timings_dir='timings', profile=False, sample=None, sample_seed=0, native_lists=False):
+    """ convert every file in the manifest on a pool of workers, largest input first
+
+    outputs whose input content and schema are unchanged since they were
+    built are kept; outputs of identical inputs in this or the reuse_from
+    directory, e.g. that of the previous release, are linked rather than
+    converted again
+
+    with drop_dangling, edges to or from vertices missing from the manifest
+    are left out, see build_vertex_index, and counted by label in
+    {outdir}/dropped_edges.json; with sample, a connected subgraph of that
+    many vertices of each label is converted instead, see sample_manifest
+
+    the time each file took per stage is written to {timings_dir}/to_rdf_{time}.json,
+    see convert_all
+    """
+    if pack_wide and single_pass:
+        raise ValueError('--pack-wide changes the inferred schema, it can not be combined with --single-pass')
+    if native_lists and single_pass:
+        raise ValueError('--native-lists changes the inferred schema, it can not be combined with --single-pass')
+    if shards and single_pass:
+        raise ValueError('--shards assigns predicates by the inferred schema, it can not be combined with --single-pass')
+    os.makedirs(rdf_outdir, exist_ok=True)
+    if dedupe:
+        manifest = dedupe_manifest(manifest, os.path.join(rdf_outdir, 'dedupe'), memory=worker_memory or 1024, policy=dedupe_policy, jobs=jobs)
+    if sample:
+        manifest = sample_manifest(manifest, os.path.join(rdf_outdir, 'sample'), sample, seed=sample_seed, jobs=jobs)
+    if chunk_size:
+        manifest = split_manifest(manifest, chunk_dir or os.path.join(rdf_outdir, 'chunks'), chunk_size, jobs=jobs)
+    config = read_manifest(manifest)
+    if not single_pass:
+        infer_schema(config, rdf_outdir, full_scan=full_scan, jobs=jobs, pack_wide=pack_wide, native_lists=native_lists)
+    if integer_ids:
+        # an edge to a vertex without an id can not be written
+        drop_dangling = True
+    index = None
+    if drop_dangling:
+        index = vertex_index(config, rdf_outdir, jobs=jobs, memory=worker_memory or 1024)
+
+    shard_plan = None
+    if shards:
+        # half of a worker's memory for the triples it holds before sorting them
+        shard_plan = plan_shards(config, rdf_outdir, shards, integer_ids, memory=(worker_memory or 1024) // 2)
+
+    backend = rdf_backend(rdf_outdir, single_pass, limit, index[1] if index else None, integer_ids, reuse_from, shard_plan)
+    convert_all(config, [backend], limit=limit, index=index, jobs=jobs, worker_memory=worker_memory, timings_dir=timings_dir, name='to_rdf', profile=profile)
+    if single_pass:
+        merge_schema(manifest, rdf_outdir)
+    if drop_dangling:
+        report_dropped([backend.output(path) for path in config.edge_files], rdf_outdir)
+    if shards:
+        clean_shards(rdf_outdir, [backend.output(path) for path in config.vertex_files + config.edge_files], shards)
+
+
+def run_job(manifest, rdf_outdir, limit=None, single_pass=False, full_scan=False, jobs=None, worker_memory=None, chunk_size=None, chunk_dir=None, reuse_from=None, drop_dangling=False, dedupe=False, dedupe_policy='last', integer_ids=False, shards=None, pack_wide=False, timings_dir='timings', profile=False, sample=None, sample_seed=0, native_lists=False):
+    """ cmd line to convert every file in the manifest, which has been split already """
+    options = []
+    if limit:
+        options.append('--limit {}'.format(limit))
+    if single_pass:
+        options.append('--single-pass')
+    if full_scan:
+        options.append('--full-scan')
+    if jobs:
+        options.append('--jobs {}'.format(jobs))
+    if worker_memory:
+        options.append('--worker-memory {}'.format(worker_memory))
+    if reuse_from:
+        options.append('--reuse-from {}'.format(reuse_from))
+    if shards:
+        options.append('--shards {}'.format(shards))
+    if pack_wide:
+        options.append('--pack-wide')
+    if native_lists:
+        options.append('--native-lists')
+    if timings_dir != 'timings':
+        options.append('--timings-dir {}'.format(timings_dir))
+    if profile:
+        options.append('--profile')
+    if integer_ids:
+        options.append('--integer-ids')
+    elif drop_dangling:
+        options.append('--drop-dangling')
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    return 'python3.7 {}/to_rdf.py run --manifest {} --rdf-outdir {} {}'.format(script_dir, manifest, rdf_outdir, ' '.join(options))
+
+
+def cmd_gen(manifest, cmd_outdir, rdf_outdir, limit, single_pass=False, full_scan=False, jobs=None, worker_memory=None, chunk_size=None, chunk_dir=None, reuse_from=None, drop_dangling=False, dedupe=False, dedupe_policy='last', integer_ids=False, shards=None, pack_wide=False, timings_dir='timings', profile=False, sample=None, sample_seed=0, native_lists=False):
+    """ infer the schema and write {cmd_outdir}/load_db.sh, which converts with `run` and loads the rdf into dgraph """
+    if pack_wide and single_pass:
+        raise ValueError('--pack-wide changes the inferred schema, it can not be combined with --single-pass')
+    if native_lists and single_pass:
+        raise ValueError('--native-lists changes the inferred schema, it can not be combined with --single-pass')
+    if shards and single_pass:
+        raise ValueError('--shards assigns predicates by the inferred schema, it can not be combined with --single-pass')
+
+    if dedupe:
+        manifest = dedupe_manifest(manifest, os.path.join(rdf_outdir, 'dedupe'), memory=worker_memory or 1024, policy=dedupe_policy, jobs=jobs)
+    if sample:
+        manifest = sample_manifest(manifest, os.path.join(rdf_outdir, 'sample'), sample, seed=sample_seed, jobs=jobs)
+    if chunk_size:
+        manifest = split_manifest(manifest, chunk_dir or os.path.join(rdf_outdir, 'chunks'), chunk_size, jobs=jobs)
+    config = read_manifest(manifest)
+
+    vertex_rdfs = {}
+    edge_rdfs = {}
+    # with single_pass the schema is inferred while converting, see merge_schema
+    if not single_pass:
+        infer_schema(config, rdf_outdir, full_scan=full_scan, jobs=jobs, pack_wide=pack_wide, native_lists=native_lists)
 
     for path in config.vertex_files:
         if not os.path.isfile(path):
@@ -263,7 +1040,6 @@ def cmd_gen(manifest, cmd_outdir, rdf_outdir, limit):
         if label not in vertex_rdfs:
             vertex_rdfs[label] = []
             vertex_rdfs[label].append(os.path.join(rdf_outdir, '{}.Vertex.schema.rdf'.format(label)))
-        to_rdf_commands.append(to_rdf_job(path, rdf_outdir, limit=limit))
         vertex_rdfs[label].append(get_output_path(rdf_outdir, path))
 
     for path in config.edge_files:
@@ -274,41 +1050,128 @@ def cmd_gen(manifest, cmd_outdir, rdf_outdir, limit):
         if label not in edge_rdfs:
             edge_rdfs[label] = []
             edge_rdfs[label].append(os.path.join(rdf_outdir, '{}.Edge.schema.rdf'.format(label)))
-        to_rdf_commands.append(to_rdf_job(path, rdf_outdir, limit=limit))
         edge_rdfs[label].append(get_output_path(rdf_outdir, path))
 
-    to_rdf_path = os.path.join(cmd_outdir, 'to_rdf_commands.sh')
-    with open(to_rdf_path, 'w') as outfile:
-        for command in to_rdf_commands:
-            outfile.write('{}\n'.format(command))
-    logging.info('wrote {}'.format(to_rdf_path))
-
     load_path = os.path.join(cmd_outdir, 'load_db.sh')
     with open(load_path, 'w') as outfile:
-        outfile.write('set -e\n'.format(multiprocessing.cpu_count(), to_rdf_path))
-        outfile.write('parallel --jobs {} < {}\n'.format(multiprocessing.cpu_count(), to_rdf_path))
-        outfile.write('cat {} > {}\n'.format(os.path.join(rdf_outdir, '*.json.gz.rdf'), os.path.join(rdf_outdir, 'data.rdf')))
-        # TODO
-        # outfile.write('dgraph bulk --schema {}/schema.rdf --rdfs {}/data.rdf --out {}'.format(rdf_outdir, rdf_outdir, dgraph_alpha_dir))
+        outfile.write('set -e\n')
+        outfile.write('{}\n'.format(run_job(manifest, rdf_outdir, limit=limit, single_pass=single_pass, full_scan=full_scan, jobs=jobs, worker_memory=worker_memory, reuse_from=reuse_from, drop_dangling=drop_dangling, integer_ids=integer_ids, shards=shards, pack_wide=pack_wide, timings_dir=timings_dir, profile=profile, native_lists=native_lists)))
+        # dgraph bulk reads the compressed files as they are, no need to concatenate them
+        rdfs = [path for paths in list(vertex_rdfs.values()) + list(edge_rdfs.values()) for path in paths[1:]]
+        # with integer ids the nodes already have uids and their gids are written to <xid>
+        options = '' if integer_ids else ' --store_xids'
+        if shards:
+            # dgraph bulk reads every file in the shard directories
+            rdfs = [os.path.join(get_shard_dir(rdf_outdir), '{:03d}'.format(shard)) for shard in range(shards)]
+            options = '{} --map_shards {} --reduce_shards {}'.format(options, shards, shards)
+        outfile.write('dgraph bulk --schema {} --rdfs {} --zero zero:5080 --out ./tmp_dgraph{}\n'.format(os.path.join(rdf_outdir, 'schema.rdf'), ','.join(rdfs), options))
     logging.info('wrote {}'.format(load_path))
 
 
 if __name__ == '__main__':  # pragma: no cover
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
     logging.getLogger().setLevel(logging.DEBUG)
     parser = argparse.ArgumentParser(description='Loads vertexes and edges into dgraph')
     subparsers = parser.add_subparsers(help='sub-command help')
     cmdgen_parser = subparsers.add_parser('cmd-gen', help='generate to_rdf commands')
     cmdgen_parser.add_argument('-l', '--limit', dest='limit', type=int, default=None, help='limit the number of rows in each vertex/edge')
     cmdgen_parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
-    cmdgen_parser.add_argument('-c', '--cmd-outdir', dest='cmd_outdir', default='.', help='directory in which to write command files (to_rdf_commands.txt, load_db.txt)')
+    cmdgen_parser.add_argument('-c', '--cmd-outdir', dest='cmd_outdir', default='.', help='directory in which to write load_db.sh')
     cmdgen_parser.add_argument('-r', '--rdf-outdir', dest='rdf_outdir', default='.', help='directory in which commands should specify to write rdf files')
+    cmdgen_parser.add_argument('--full-scan', dest='full_scan', action='store_true', default=False, help='read every record of every file to infer the schema, instead of a sample')
+    cmdgen_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None, help='number of processes used to infer the schema [default: cpu count]')
+    cmdgen_parser.add_argument('--single-pass', dest='single_pass', action='store_true', default=False, help='infer the schema while converting instead of reading every file up front')
+    cmdgen_parser.add_argument('--worker-memory', dest='worker_memory', type=int, default=None, help='memory budget in MB for each conversion worker')
+    cmdgen_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=None, help='split inputs larger than this many MB into parts that are converted in parallel')
+    cmdgen_parser.add_argument('--chunk-dir', dest='chunk_dir', default=None, help='directory in which to write the parts of split inputs [default: {outdir}/chunks]')
+    cmdgen_parser.add_argument('--reuse-from', dest='reuse_from', default=None, help='rdf output directory of a previous build, e.g. the last release, whose outputs are reused for identical inputs')
+    cmdgen_parser.add_argument('--drop-dangling', dest='drop_dangling', action='store_true', default=False, help='leave out edges to or from vertices missing from the manifest, counted by label in dropped_edges.json')
+    cmdgen_parser.add_argument('--dedupe', dest='dedupe', action='store_true', default=False, help='merge vertices with the same gid from the several files of a label into one file first, sorting within --worker-memory [default: 1024] MB')
+    cmdgen_parser.add_argument('--dedupe-policy', dest='dedupe_policy', choices=['last', 'first'], default='last', help='which copy of a duplicate vertex wins where their values conflict, in manifest order [default: last]')
+    cmdgen_parser.add_argument('--integer-ids', dest='integer_ids', action='store_true', default=False, help='write vertices as <0x..> uids from the vertex index instead of blank nodes, keeping the gid in <xid>; implies --drop-dangling')
+    cmdgen_parser.add_argument('--shards', dest='shards', type=int, default=None, help='partition the rdf by predicate into this many shard directories, sorted by subject, for dgraph bulk --map_shards/--reduce_shards')
+    cmdgen_parser.add_argument('--pack-wide', dest='pack_wide', action='store_true', default=False, help='write objects of more than 1000 numeric values, e.g. expression values, as one json string predicate instead of a predicate per key')
+    cmdgen_parser.add_argument('--native-lists', dest='native_lists', action='store_true', default=False, help='write lists of scalars of a vertex as one list predicate, e.g. [string], with a triple per element, instead of a predicate per position')
+    cmdgen_parser.add_argument('--timings-dir', dest='timings_dir', default='timings', help='directory in which to write the timings of the run, per file and stage [default: timings]')
+    cmdgen_parser.add_argument('--profile', dest='profile', action='store_true', default=False, help='sample the stacks of each conversion worker and write them to the timings directory, for flamegraph.pl or speedscope')
+    cmdgen_parser.add_argument('--sample', dest='sample', type=int, default=None, help='convert a connected sample of this many vertices of each label, the edges to or from them and the vertices at their other ends, instead of every record')
+    cmdgen_parser.add_argument('--sample-seed', dest='sample_seed', type=int, default=0, help='random seed of --sample [default: 0]')
     cmdgen_parser.set_defaults(func=cmd_gen)
+    bench_parser = subparsers.add_parser('bench-flatten', help='compare flatten_json with the cached Flattener on records of a real file')
+    bench_parser.add_argument('-l', '--limit', dest='limit', type=int, default=10000, help='number of records to flatten [default: 10000]')
+    bench_parser.add_argument('-i', '--input', dest='input', required=True, help='path for single input file')
+    bench_parser.set_defaults(func=bench_flatten)
+    bench_rdf_parser = subparsers.add_parser('bench-rdf', help='compare per-value conversion with the compiled emitter on records of a real file')
+    bench_rdf_parser.add_argument('-l', '--limit', dest='limit', type=int, default=100000, help='number of records to convert [default: 100000]')
+    bench_rdf_parser.add_argument('-i', '--input', dest='input', required=True, help='path for single input file')
+    bench_rdf_parser.add_argument('-s', '--schema', dest='schema', required=True, help='path to corresponding schema file')
+    bench_rdf_parser.set_defaults(func=bench_rdf)
+    diff_parser = subparsers.add_parser('diff', help='write rdf deltas between two releases and load_delta.sh to apply them to a running dgraph')
+    diff_parser.add_argument('--old-manifest', dest='old_manifest', required=True, help='manifest file path of the loaded release')
+    diff_parser.add_argument('--new-manifest', dest='new_manifest', required=True, help='manifest file path of the new release')
+    diff_parser.add_argument('-o', '--outdir', dest='outdir', required=True, help='directory in which to write the deltas')
+    diff_parser.add_argument('--memory', dest='memory', type=int, default=1024, help='memory in MB used to sort records before spilling to disk [default: 1024]')
+    diff_parser.add_argument('--batch-size', dest='batch_size', type=int, default=1000, help='deletions per upsert block [default: 1000]')
+    diff_parser.add_argument('--integer-ids', dest='integer_ids', action='store_true', default=False, help='the running dgraph was loaded with --integer-ids: find nodes by the gid kept in <xid> and upsert them with upsert blocks instead of dgraph live')
+    diff_parser.set_defaults(func=diff)
+    run_parser = subparsers.add_parser('run', help='infer the schema and convert every file in the manifest to RDF')
+    run_parser.add_argument('-l', '--limit', dest='limit', type=int, default=None, help='limit the number of rows in each vertex/edge')
+    run_parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
+    run_parser.add_argument('-r', '--rdf-outdir', dest='rdf_outdir', default='.', help='directory in which to write rdf files')
+    run_parser.add_argument('--full-scan', dest='full_scan', action='store_true', default=False, help='read every record of every file to infer the schema, instead of a sample')
+    run_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None, help='number of worker processes [default: cpu count]')
+    run_parser.add_argument('--single-pass', dest='single_pass', action='store_true', default=False, help='infer the schema while converting instead of reading every file up front')
+    run_parser.add_argument('--worker-memory', dest='worker_memory', type=int, default=None, help='memory budget in MB for each worker; also caps the number of workers to fit in physical memory')
+    run_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=None, help='split inputs larger than this many MB into parts that are converted in parallel')
+    run_parser.add_argument('--chunk-dir', dest='chunk_dir', default=None, help='directory in which to write the parts of split inputs [default: {outdir}/chunks]')
+    run_parser.add_argument('--reuse-from', dest='reuse_from', default=None, help='rdf output directory of a previous build, e.g. the last release, whose outputs are reused for identical inputs')
+    run_parser.add_argument('--drop-dangling', dest='drop_dangling', action='store_true', default=False, help='leave out edges to or from vertices missing from the manifest, counted by label in dropped_edges.json')
+    run_parser.add_argument('--dedupe', dest='dedupe', action='store_true', default=False, help='merge vertices with the same gid from the several files of a label into one file first, sorting within --worker-memory [default: 1024] MB')
+    run_parser.add_argument('--dedupe-policy', dest='dedupe_policy', choices=['last', 'first'], default='last', help='which copy of a duplicate vertex wins where their values conflict, in manifest order [default: last]')
+    run_parser.add_argument('--integer-ids', dest='integer_ids', action='store_true', default=False, help='write vertices as <0x..> uids from the vertex index instead of blank nodes, keeping the gid in <xid>; implies --drop-dangling')
+    run_parser.add_argument('--shards', dest='shards', type=int, default=None, help='partition the rdf by predicate into this many shard directories, sorted by subject, for dgraph bulk --map_shards/--reduce_shards')
+    run_parser.add_argument('--pack-wide', dest='pack_wide', action='store_true', default=False, help='write objects of more than 1000 numeric values, e.g. expression values, as one json string predicate instead of a predicate per key')
+    run_parser.add_argument('--native-lists', dest='native_lists', action='store_true', default=False, help='write lists of scalars of a vertex as one list predicate, e.g. [string], with a triple per element, instead of a predicate per position')
+    run_parser.add_argument('--timings-dir', dest='timings_dir', default='timings', help='directory in which to write the timings of the run, per file and stage [default: timings]')
+    run_parser.add_argument('--profile', dest='profile', action='store_true', default=False, help='sample the stacks of each conversion worker and write them to the timings directory, for flamegraph.pl or speedscope')
+    run_parser.add_argument('--sample', dest='sample', type=int, default=None, help='convert a connected sample of this many vertices of each label, the edges to or from them and the vertices at their other ends, instead of every record')
+    run_parser.add_argument('--sample-seed', dest='sample_seed', type=int, default=0, help='random seed of --sample [default: 0]')
+    run_parser.set_defaults(func=run)
+    split_parser = subparsers.add_parser('split', help='split large inputs into parts and write a manifest listing the parts')
+    split_parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
+    split_parser.add_argument('--chunk-dir', dest='chunk_dir', required=True, help='directory in which to write the parts and the new manifest')
+    split_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=512, help='split inputs larger than this many MB [default: 512]')
+    split_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None, help='number of worker processes [default: cpu count]')
+    split_parser.set_defaults(func=split_manifest)
+
+    dedupe_parser = subparsers.add_parser('dedupe', help='merge duplicate vertices and write a manifest listing the merged files')
+    dedupe_parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
+    dedupe_parser.add_argument('--dedupe-dir', dest='dedupe_dir', required=True, help='directory in which to write the merged files and the new manifest')
+    dedupe_parser.add_argument('--memory', dest='memory', type=int, default=1024, help='memory in MB used to sort records before spilling to disk [default: 1024]')
+    dedupe_parser.add_argument('--policy', dest='policy', choices=['last', 'first'], default='last', help='which copy of a duplicate vertex wins where their values conflict, in manifest order [default: last]')
+    dedupe_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None, help='number of worker processes [default: cpu count]')
+    dedupe_parser.set_defaults(func=dedupe_manifest)
+
+    sample_parser = subparsers.add_parser('sample', help='sample a connected subgraph and write a manifest listing its files')
+    sample_parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
+    sample_parser.add_argument('--sample-dir', dest='sample_dir', required=True, help='directory in which to write the sampled files and the new manifest')
+    sample_parser.add_argument('--size', dest='size', type=int, required=True, help='number of vertices of each label to sample, before those the edges of the sample reference')
+    sample_parser.add_argument('--seed', dest='seed', type=int, default=0, help='random seed; the same seed picks the same sample [default: 0]')
+    sample_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None, help='number of worker processes [default: cpu count]')
+    sample_parser.set_defaults(func=sample_manifest)
+
     tordf_parser = subparsers.add_parser('convert', help='convert input json to RDF')
     tordf_parser.add_argument('-l', '--limit', dest='limit', type=int, default=None, help='limit the number of rows in each vertex/edge')
     tordf_parser.add_argument('-i', '--input', dest='input', required=True, help='path for single input file')
     tordf_parser.add_argument('-o', '--output', dest='output', required=True, help='path for single output file')
-    tordf_parser.add_argument('-s', '--schema', dest='schema', required=True, help='path to corresponding schema file')
+    tordf_parser.add_argument('-s', '--schema', dest='schema', default=None, help='path to corresponding schema file; if omitted types are inferred and written to {output}.schema.json')
+    tordf_parser.add_argument('--vertex-index', dest='vertex_index', default=None, help='vertex index written by run --drop-dangling; edges to or from vertices not in it are dropped and counted in {output}.dropped.json')
+    tordf_parser.add_argument('--integer-ids', dest='integer_ids', action='store_true', default=False, help='write vertices as <0x..> uids from the vertex index instead of blank nodes, keeping the gid in <xid>, numbered by --vertex-index')
     tordf_parser.set_defaults(func=to_rdf)
+    merge_parser = subparsers.add_parser('merge-schema', help='merge the type statistics of single pass conversions into schema files')
+    merge_parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
+    merge_parser.add_argument('-r', '--rdf-outdir', dest='rdf_outdir', default='.', help='directory containing the converted rdf files')
+    merge_parser.set_defaults(func=merge_schema)
     args = parser.parse_args()
     logging.debug(vars(args))
     cmd_args = vars(args).copy()
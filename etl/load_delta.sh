@@ -0,0 +1,39 @@
+#!/bin/bash
+
+set -e
+
+if [ "$#" -ne 2 ]; then
+		printf "Illegal number of parameters.\n\n"
+		printf "Usage:\n	load_delta.sh <graph> <delta_dir>\n\n"
+		printf "<delta_dir> is the --outdir of 'to_rdf.py diff' or 'to_csv.py diff'\n"
+		exit 1
+fi
+
+graph=$1
+delta_dir=$(realpath $2)
+
+gofast="--numInsertionWorkers 24 --writeConcern 0 --bypassDocumentValidation --host=mongo"
+
+# removed records, matched by their gid as _id, in batches of 10000
+for f in $(ls $delta_dir/json/delete/*.json.gz 2> /dev/null); do
+		if [[ $f =~ \.Edge\.json\.gz$ ]]; then
+				collection=${graph}_edges
+		else
+				collection=${graph}_vertices
+		fi
+		gunzip -c $f | python3 -c "
+import json, sys
+gids = [json.loads(line)['gid'] for line in sys.stdin]
+for i in range(0, len(gids), 10000):
+    print('db.$collection.deleteMany({_id: {\$in: %s}})' % json.dumps(gids[i:i + 10000]))
+" | mongo --quiet --host mongo grip
+done
+
+# added and changed records replace the documents with the same _id, their gid
+for f in $(ls $delta_dir/json/upsert/*.Vertex.json.gz 2> /dev/null); do
+		gunzip -c $f | mongoimport -d grip -c ${graph}_vertices --type json --mode upsert --upsertFields _id $gofast
+done
+
+for f in $(ls $delta_dir/json/upsert/*.Edge.json.gz 2> /dev/null); do
+		gunzip -c $f | mongoimport -d grip -c ${graph}_edges --type json --mode upsert --upsertFields _id $gofast
+done
@@ -1,126 +1,135 @@
 import argparse
 import csv
-import gzip
+import io
 import logging
 import multiprocessing
 import os
-import re
+import sys
 import types
 import ujson
 
-from flatten_json import flatten
-
-
-def reader(path):
-    if path.endswith('.gz'):
-        return gzip.open(path, 'r')
-    else:
-        return open(path, 'r')
-
-
-def to_vertex(path):
-    """ vertex with only scalar data """
-    with reader(path) as ins:
-        for line in ins:
-            line = flatten(ujson.loads(line), '.')
-            del line['_id']
-            del line['label']
-            yield line
-
-
-def to_edge(path):
-    """ edge with only scalar data """
-    with reader(path) as ins:
-        for line in ins:
-            line = flatten(ujson.loads(line), '.')
-            # not used
-            del line['_id']
-            del line['gid']
-            # rename from, to, label
-            # line[':START_ID'] = line['from']
-            # line[':END_ID'] = line['to']
-            # line[':TYPE'] = line['label']
-            # del line['label']
-            # del line['from']
-            # del line['to']
-            yield line
+# the conversion core shared with dgraph/to_rdf.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from core.convert import (  # noqa: E402
+    AsyncWriter,
+    bench_flatten,
+    build_key,
+    convert,
+    convert_all,
+    dedupe_manifest,
+    diff_json,
+    find_wide,
+    Flattener,
+    get_dropped_path,
+    get_label,
+    Held,
+    pack_wide_types,
+    read_batches,
+    read_delta,
+    read_manifest,
+    read_packed,
+    report_dropped,
+    sample_manifest,
+    scan_schema,
+    Sink,
+    split_manifest,
+    StreamedRecord,
+    type_stats,
+    vertex_index,
+    VertexIndex,
+    wide_numbers,
+    write_dropped,
+    write_packed,
+)
+
+
+py_2_neo = {
+    'str': 'string',
+    'bool': 'boolean',
+    'int': 'long',
+    'float': 'float'
+}  # xlate py types to neo4j
+
+# handle type mismatches across files of the same label
+# keys of form (current, new)
+type_prio = {
+    ('string', 'string'): 'string',
+    ('string', 'long'): 'string',
+    ('string', 'float'): 'string',
+    ('string', 'boolean'): 'string',
+    ('long', 'long'): 'long',
+    ('long', 'string'): 'string',
+    ('long', 'float'): 'float',
+    ('long', 'boolean'): 'string',
+    ('float', 'float'): 'float',
+    ('float', 'string'): 'string',
+    ('float', 'long'): 'float',
+    ('float', 'boolean'): 'string',
+    ('boolean', 'boolean'): 'boolean',
+    ('boolean', 'string'): 'string',
+    ('boolean', 'long'): 'string',
+    ('boolean', 'float'): 'string',
+}
+
+
+def widen(type_counts):
+    """ given {py type: count}, return the neo type that fits all values, an array type if any were in lists, see type_stats """
+    t = None
+    for py_type in type_counts:
+        new_t = py_2_neo.get(py_type.strip('[]'), py_type.strip('[]'))
+        if py_type.startswith('['):
+            new_t = '{}[]'.format(new_t)
+        t = new_t if t is None else unify(t, new_t)
+    return t
+
+
+def unify(current, new):
+    """ type_prio for types that may be array types, e.g. string[], giving an array type if either is one """
+    t = type_prio[(current.replace('[]', ''), new.replace('[]', ''))]
+    if current.endswith('[]') or new.endswith('[]'):
+        return '{}[]'.format(t)
+    return t
+
+
+def decorate_key(key, value_type, integer_ids=False):
+    """ header column for key, renaming gid, from, to and label
+
+    with integer_ids the id is the unnamed column of _uid and gid is kept as
+    an ordinary property, see to_csv
+    """
+    if key == '_uid':
+        key = ''
+        value_type = 'ID'
+    elif key == 'gid' and not integer_ids:
+        value_type = 'ID'
+    elif key == "from":
+        key = ''
+        value_type = 'START_ID'
+    elif key == "to":
+        key = ''
+        value_type = 'END_ID'
+    elif key == "label":
+        key = ''
+        value_type = 'TYPE'
+    return '{}:{}'.format(key, value_type)
+
+
+def ignored_key(path):
+    """ the key neo4j has no column for, the label of a vertex, which is its file's, and the gid of an edge """
+    return 'gid' if 'Edge' in path else 'label'
 
 
 def keys(path, sample_size=1000):
     """ return [names of keys] and [neo types of keys]"""
     if 'Expression' in path or 'CopyNumber' in path:
         sample_size = 1  # no need to read huge, uniform records
-    kv_scheme = {}
-    py_2_neo = {
-        'str': 'string',
-        'bool': 'boolean',
-        'int': 'long',
-        'float': 'float'
-    }  # xlate py types to neo4j
-    c = 0
-    xformer = to_vertex
-    if 'Edge' in path:
-        xformer = to_edge
-    for line in xformer(path):
-        kv_scheme.update({k: line[k].__class__.__name__ for k in line.keys() if line[k] is not None})
-        if c == sample_size:
-            break
-        c += 1
-
-    decorated_keys = []
+    kv_scheme = type_stats(path, sample_size)
+    kv_scheme.pop(ignored_key(path), None)
     keys = list(kv_scheme.keys())
-    for key in keys:
-        py_type = kv_scheme[key]
-        # ignore lists, dicts, etc... flatten_json should have taken care of most of these
-        if py_type not in py_2_neo:
-            continue
-        value_type = py_2_neo[py_type]
-        if key == 'gid':
-            value_type = 'ID'
-        elif key == "from":
-            key = ''
-            value_type = 'START_ID'
-        elif key == "to":
-            key = ''
-            value_type = 'END_ID'
-        elif key == "label":
-            key = ''
-            value_type = 'TYPE'
-        decorated_keys.append('{}:{}'.format(key, value_type))
+    decorated_keys = [decorate_key(key, widen(kv_scheme[key])) for key in keys]
     return keys, decorated_keys
 
 
-def values(path):
-    """ return a dict for each line """
-    xformer = to_vertex
-    if 'Edge' in path:
-        xformer = to_edge
-    for line in xformer(path):
-        yield line
-
-
-first_cap_re = re.compile('(.)([A-Z][a-z]+)')
-all_cap_re = re.compile('([a-z0-9])([A-Z])')
-def to_snakecase(label):
-    # handle G2P exception
-    label = label.replace("G2P", "g2p")
-    s1 = first_cap_re.sub(r'\1_\2', label)
-    return all_cap_re.sub(r'\1_\2', s1).lower()
-
-
-def get_label(path):
-    """ given path, return label """
-    path = os.path.basename(path)
-    if 'Vertex' in path:
-        file_parts = path.split('.')
-        return file_parts[file_parts.index('Vertex') - 1]
-    elif 'Edge' in path:
-        edge_composite = re.search('(^.*\.)?(.*_.*_.*)\.Edge.json*', path).group(2)
-        return to_snakecase(edge_composite.split('_')[1])
-    else:
-        raise TypeError("not a vertex or edge file: {}".format(path))
-
-
 def to_csv_header(path, output=None):
     """ file to csv '{path}.header.csv' """
     fieldnames, decorated_fieldnames = keys(path)
@@ -128,22 +137,88 @@ def to_csv_header(path, output=None):
 
 
 def get_output_path(outdir, path):
-    return os.path.join(outdir, '{}.csv'.format(path.replace('/', '.')))
-
-
-def to_csv(input, output, header, limit=None, write_header=False):
-    """ file to csv '{path}.csv' """
-    replace_str = lambda x: str(x).strip().replace('\n', '').replace('\r', '')  if x is not None else None
-    neo_2_py = {
-        'string': replace_str,
-        'boolean': lambda x: bool(x) if x is not None else None,
-        'long': lambda x: int(x) if x is not None else None,
-        'float': lambda x: float(x) if x is not None else None,
-        'ID': replace_str,
-        'START_ID': replace_str,
-        'END_ID': replace_str,
-        'TYPE': replace_str,
-    }
+    return os.path.join(outdir, '{}.csv.gz'.format(path.replace('/', '.')))
+
+
+def get_stats_path(output):
+    """ per-file columns and type statistics written by a single pass conversion """
+    return '{}.schema.json'.format(output)
+
+
+def get_header_path(output):
+    """ per-file header written by merge_header """
+    return '{}.header.csv'.format(output[:-len('.csv.gz')] if output.endswith('.gz') else output[:-len('.csv')])
+
+
+def get_cache_path(outdir, path):
+    """ per-file type statistics cached by cmd_gen """
+    return os.path.join(outdir, 'schema_cache', '{}.json'.format(path.replace('/', '.')))
+
+
+def to_label_types(file_stats):
+    """ given [(path, type statistics)], return {label: {key: neo type}} widened across files """
+    label_types = {}
+    for path, stats in file_stats:
+        label = get_label(path)
+        typ = 'Vertex' if 'Vertex' in path else 'Edge'
+        label = '{}.{}'.format(label, typ)
+        if label not in label_types:
+            label_types[label] = {}
+        for k, type_counts in stats.items():
+            if k != ignored_key(path):
+                label_types[label].setdefault(k, {}).update(type_counts)
+    return {label: {k: widen(type_counts) for k, type_counts in types.items()} for label, types in label_types.items()}
+
+
+def convert_string(x):
+    return str(x).strip().replace('\n', '').replace('\r', '') if x is not None else None
+
+
+def convert_boolean(x):
+    return bool(x) if x is not None else None
+
+
+def convert_long(x):
+    return int(x) if x is not None else None
+
+
+def convert_float(x):
+    return float(x) if x is not None else None
+
+
+# neo4j-admin import --array-delimiter, a control character no value is expected to hold
+array_delimiter = '\x1f'
+
+
+def convert_array(convert):
+    """ the converter of an array column whose elements convert converts, joined by array_delimiter """
+    def convert_elements(x):
+        if x is None:
+            return None
+        elements = [str(convert(e)).replace(array_delimiter, '') for e in (x if type(x) is list else [x]) if e is not None]
+        return array_delimiter.join(elements) if elements else None
+    return convert_elements
+
+
+neo_2_py = {
+    'string': convert_string,
+    'boolean': convert_boolean,
+    'long': convert_long,
+    'float': convert_float,
+    'ID': convert_string,
+    'START_ID': convert_string,
+    'END_ID': convert_string,
+    'TYPE': convert_string,
+}
+# array columns of native lists, see infer_headers
+neo_2_py.update({'{}[]'.format(t): convert_array(neo_2_py[t]) for t in ['string', 'boolean', 'long', 'float']})
+# values of these types never contain a delimiter, quote or newline
+unquoted_types = ['boolean', 'long', 'float']
+id_types = ['ID', 'START_ID', 'END_ID']
+
+
+def read_header(header):
+    """ fieldnames, in column order, and {fieldname: type} from a header file """
     with open(header, 'r') as fh:
         reader = csv.DictReader(fh)
         fnames = reader.fieldnames
@@ -151,8 +226,10 @@ def to_csv(input, output, header, limit=None, write_header=False):
         types = {}
         for x in fnames:
             f, t = x.split(":")
+            # a handful of types shared by every column, not a string each
+            t = sys.intern(t)
             if t == "ID":
-                f = "gid"
+                f = "gid" if f else "_uid"
             if t == "TYPE":
                 f = "label"
             elif t == "START_ID":
@@ -161,120 +238,616 @@ def to_csv(input, output, header, limit=None, write_header=False):
                 f = "to"
             fieldnames.append(f)
             types[f] = t
-    with open(output, 'w', newline='') as myfile:
-        writer = csv.DictWriter(myfile, fieldnames=fieldnames, extrasaction='raise')
-        if write_header:
-            writer.writeheader()
-        c = 0
-        for line in values(input):
-            row = {k: neo_2_py[types[k]](line[k]) for k in fieldnames if k in line}
-            writer.writerow(row)
-            c += 1
-            if limit and c == limit:
-                break
-        logging.info('wrote {} records to {}'.format(c, output))
+    return fieldnames, types
+
+
+def compile_columns(fieldnames, types, uid=None):
+    """ the columns of a header as a tuple of (key, converter), built once per file; uid converts the id columns """
+    columns = []
+    for k in fieldnames:
+        if uid is not None and types[k] in id_types:
+            # _uid is the integer id of the gid
+            columns.append(('gid' if k == '_uid' else k, uid))
+        else:
+            columns.append((k, neo_2_py[types[k]]))
+    return tuple(columns)
+
+
+def join_rows(rows):
+    """ csv.writer output for rows whose values need no quoting """
+    return ''.join([','.join([v if type(v) is str else str(v) if v is not None else '' for v in row]) + '\r\n' for row in rows])
+
+
+def format_row(cells):
+    """ csv.writer output for one row, without the line ending """
+    buf = io.StringIO()
+    csv.writer(buf).writerow(cells)
+    return buf.getvalue()[:-2]
+
+
+def format_cell(v):
+    """ csv.writer output for one cell of a row of several """
+    if v is None:
+        return ''
+    if type(v) is not str:
+        return str(v)
+    if ',' in v or '"' in v or '\r' in v or '\n' in v:
+        return '"{}"'.format(v.replace('"', '""'))
+    return v
+
+
+def write_streamed(out, record, cells_of, columns):
+    """ write the csv row of a StreamedRecord as its pairs arrive
+
+    cells_of(key, value) gives the [(position, value)] of a pair; a cell is
+    written once every cell before it is, so only cells that come ahead of
+    their column are held, e.g. those after a column the record doesn't
+    have, and past held_size in a temporary file, see Held; columns are
+    read once all pairs are in, as they may still grow
+    """
+    held = Held()
+    pending = {}
+    n = 0
+    # a cell at a time, the writer buffers by size and the cells may be long
+    for k, v in record.items():
+        for i, cell in cells_of(k, v):
+            pending[i] = held.hold(format_cell(cell))
+        while n in pending:
+            out.write((',' if n else '') + held.take(pending.pop(n)))
+            n += 1
+    # then the cells held back, and empty ones for the columns the record doesn't have
+    while n < len(columns):
+        out.write((',' if n else '') + (held.take(pending.pop(n)) if n in pending else ''))
+        n += 1
+    out.write('\r\n')
+    held.close()
+
+
+class CsvSink(Sink):
+    """ writes the records of input to output as csv rows in the columns of header, see to_csv """
+    indexed = True
+
+    def __init__(self, input, output, header, index=None, integer_ids=False, write_header=False, safe_columns=None):
+        if integer_ids and index is None:
+            raise ValueError('integer ids are assigned by a vertex index')
+        uid = index.uid if integer_ids else None
+        self.output = output
+        self.write_header = write_header
+        fieldnames, types = read_header(header)
+        self.fields = fieldnames
+        self.lists = any(t.endswith('[]') for t in types.values())
+        self.json_fields = read_packed(header)
+        self.columns = columns = compile_columns(fieldnames, types, uid)
+        safe_columns = safe_columns or []
+        # csv quotes a lone empty field, so single column files always go through it
+        self.unquoted = len(fieldnames) > 1 and all(types[k] in unquoted_types or k in safe_columns or (uid and types[k] in id_types) for k in fieldnames)
+        wide = None
+        if wide_numbers and 'Edge' not in input:
+            wide = find_wide(fieldnames, types, {'float': float, 'long': int})
+        if wide:
+            # the wide columns are written as the text split_wide returns, so they have to be adjacent, in key order
+            parent, keys, _ = wide
+            first = fieldnames.index('{}.{}'.format(parent, keys[0]))
+            last = first + len(keys)
+            if fieldnames[first:last] != ['{}.{}'.format(parent, k) for k in keys]:
+                wide = None
+        self.wide = wide
+        if wide:
+            self.before, self.after = columns[:first], columns[last:]
+        key_columns = {}
+        for i, (k, convert) in enumerate(columns):
+            key_columns.setdefault(k, []).append((i, convert))
+        self.cells_of = lambda k, v: [(i, convert(v)) for i, convert in key_columns.get(k, ())]
+        self.rows = []
+        self.count = 0
+
+    def open(self, timer=None):
+        self.writer = AsyncWriter(self.output, timer=timer)
+        writer = csv.writer(self.writer)
+        if self.write_header:
+            writer.writerow(self.fields)
+        self.write_rows = writer.writerows
+        if self.unquoted:
+            self.write_rows = lambda rows: self.writer.write(join_rows(rows))
+
+    def write(self, line, record, numbers):
+        rows = self.rows
+        if numbers is not None:
+            self.write_rows(rows)
+            rows.clear()
+            out = self.writer
+            # a trailing or leading empty cell leaves the comma next to the numbers
+            out.write(format_row([convert(record.get(k)) for k, convert in self.before] + ['']) if self.before else '')
+            out.write(numbers)
+            out.write(format_row([''] + [convert(record.get(k)) for k, convert in self.after]) if self.after else '')
+            out.write('\r\n')
+        elif type(record) is StreamedRecord:
+            self.write_rows(rows)
+            rows.clear()
+            write_streamed(self.writer, record, self.cells_of, self.columns)
+        else:
+            rows.append([convert(record.get(k)) for k, convert in self.columns])
+            if len(rows) == 4096:
+                self.write_rows(rows)
+                rows.clear()
+        self.count += 1
+
+    def close(self, discard=False):
+        if not discard:
+            self.write_rows(self.rows)
+        self.writer.close(discard=discard)
+        if not discard:
+            logging.info('wrote {} records to {}'.format(self.count, self.output))
+
+
+class SinglePassCsvSink(Sink):
+    """ writes the records of input to output as csv and the columns and types seen to '{output}.schema.json', no header required, see to_csv """
+    indexed = True
+
+    def __init__(self, input, output, index=None, integer_ids=False):
+        if integer_ids and index is None:
+            raise ValueError('integer ids are assigned by a vertex index')
+        self.input = input
+        self.output = output
+        self.uid = uid = index.uid if integer_ids else None
+        self.ignored = ignored_key(input)
+        self.columns = []
+        self.positions = {}
+        self.stats = {}
+        self.uid_keys = []
+        if uid is not None and 'Edge' in input:
+            self.uid_keys = ['from', 'to']
+        elif uid is not None:
+            # the integer id comes first, see decorate_key
+            self.columns.append('_uid')
+            self.positions['_uid'] = 0
+            self.stats['_uid'] = {'int': 0}
+        self.rows = []
+        self.count = 0
+
+    def cells_of(self, k, v):
+        """ the cells of a pair of a StreamedRecord, adding its column and tallying its type as write does """
+        t = v.__class__.__name__
+        if t not in py_2_neo or k == self.ignored:
+            return ()
+        if k not in self.positions:
+            self.positions[k] = len(self.columns)
+            self.columns.append(k)
+        counts = self.stats.setdefault(k, {})
+        counts[t] = counts.get(t, 0) + 1
+        cells = []
+        if k == 'gid' and self.uid is not None and not self.uid_keys:
+            cells.append((0, self.uid(v)))
+            self.stats['_uid']['int'] += 1
+        if k in self.uid_keys:
+            v = self.uid(v)
+        elif t == 'str':
+            v = v.strip().replace('\n', '').replace('\r', '')
+        cells.append((self.positions[k], v))
+        return cells
+
+    def open(self, timer=None):
+        self.writer = AsyncWriter(self.output, timer=timer)
+        self.write_rows = csv.writer(self.writer).writerows
+
+    def write(self, line, record, numbers):
+        rows = self.rows
+        if type(record) is StreamedRecord:
+            self.write_rows(rows)
+            rows.clear()
+            write_streamed(self.writer, record, self.cells_of, self.columns)
+            self.count += 1
+            return
+        columns = self.columns
+        positions = self.positions
+        stats = self.stats
+        uid = self.uid
+        uid_keys = self.uid_keys
+        ignored = self.ignored
+        row = [None] * len(columns)
+        if uid is not None and not uid_keys:
+            row[0] = uid(record['gid'])
+            stats['_uid']['int'] += 1
+        for k, v in record.items():
+            t = v.__class__.__name__
+            if t not in py_2_neo or k == ignored:
+                continue
+            if k not in positions:
+                # rows written so far simply end before this column
+                positions[k] = len(columns)
+                columns.append(k)
+                row.append(None)
+            counts = stats.setdefault(k, {})
+            counts[t] = counts.get(t, 0) + 1
+            if k in uid_keys:
+                v = uid(v)
+            elif t == 'str':
+                v = v.strip().replace('\n', '').replace('\r', '')
+            row[positions[k]] = v
+        rows.append(row)
+        if len(rows) == 4096:
+            self.write_rows(rows)
+            rows.clear()
+        self.count += 1
+
+    def close(self, discard=False):
+        if not discard:
+            self.write_rows(self.rows)
+        self.writer.close(discard=discard)
+        if discard:
+            return
+        logging.info('wrote {} records to {}'.format(self.count, self.output))
+        stats_path = get_stats_path(self.output)
+        with open(stats_path + '.tmp', 'w') as fh:
+            ujson.dump({'input': self.input, 'columns': self.columns, 'types': self.stats}, fh)
+        os.replace(stats_path + '.tmp', stats_path)
+        logging.info('wrote {}'.format(stats_path))
+
+
+def to_csv(input, output, header=None, limit=None, write_header=False, safe_columns=None, vertex_index=None, integer_ids=False, timer=None):
+    """ file to csv '{path}.csv'
+
+    without a header, each value is converted according to its own type,
+    columns are appended in order of first appearance and the columns and
+    types seen are written to '{output}.schema.json' for merge_header
+
+    safe_columns names string columns known to never contain a comma or a
+    quote; when every column is safe, rows are joined without the csv module
+
+    with a vertex_index, see build_vertex_index, edges to or from vertices
+    not in it are dropped and counted by label in '{output}.dropped.json';
+    with integer_ids as well, ids are the integers VertexIndex.uid assigns,
+    for neo4j-admin import --id-type=INTEGER, which needs far less memory
+    than mapping strings, and gid is written as a property
+
+    vertices longer than huge_record are written a cell at a time as they
+    are parsed, see write_streamed, so memory doesn't grow with them
+
+    a Timer, if given, is told the time spent in each stage and logs progress
+    """
+    index = VertexIndex(vertex_index) if vertex_index else None
+    edge_index = index if 'Edge' in input else None
+    if header:
+        sink = CsvSink(input, output, header, index, integer_ids, write_header, safe_columns)
+    else:
+        sink = SinglePassCsvSink(input, output, index, integer_ids)
+    dropped = {}
+    convert(input, [sink], limit=limit, index=edge_index, dropped=dropped, timer=timer)
+    write_dropped(output, input, edge_index, dropped)
     return output
 
 
-def to_csv_job(path, outdir, limit=None):
-    """ cmd line to transform json to csv """
-    output_path = get_output_path(outdir, path)
-    label = get_label(path)
-    typ = 'Vertex' if 'Vertex' in path else 'Edge'
-    label = '{}.{}'.format(label, typ)
-    header_path = os.path.join(outdir, '{}.header.csv'.format(label))
-    comment = ''
-    if os.path.isfile(output_path):
-        comment = '# '
-    if limit:
-        limit = '--limit {}'.format(limit)
-    else:
-        limit = ''
-    script_dir = os.path.dirname(os.path.realpath(__file__))
-    return '{}python3.7 {}/to_csv.py convert --input {} --output {} --header {} {}'.format(comment, script_dir, path, output_path, header_path, limit)
+def merge_header(manifest, csv_outdir):
+    """ reduce the per-file statistics of a single pass conversion into per-file header files """
+    config = read_manifest(manifest)
+    file_stats = []
+    for path in config.vertex_files + config.edge_files:
+        if not os.path.isfile(path):
+            logging.warning('{} does not exist'.format(path))
+            continue
+        with open(get_stats_path(get_output_path(csv_outdir, path)), 'r') as fh:
+            file_stats.append((path, ujson.load(fh)))
+    label_types = to_label_types([(path, stats['types']) for path, stats in file_stats])
+    # every file of a label shares the widened types, but keeps its own column order
+    for path, stats in file_stats:
+        label = get_label(path)
+        typ = 'Vertex' if 'Vertex' in path else 'Edge'
+        types = label_types['{}.{}'.format(label, typ)]
+        header_path = get_header_path(get_output_path(csv_outdir, path))
+        integer_ids = '_uid' in stats['columns']
+        with open(header_path, 'w', newline='') as myfile:
+            writer = csv.writer(myfile)
+            writer.writerow([decorate_key(k, types[k], integer_ids) for k in stats['columns']])
+        logging.info('wrote {}'.format(header_path))
 
 
-def cmd_gen(manifest, db_name, cmd_outdir, csv_outdir, limit):
-    """render csv file(s) and neo4j-import clause"""
+def cypher_name(name):
+    return '`{}`'.format(name.replace('`', '``'))
 
-    config = {
-        'edge_files': [],
-        'vertex_files': [],
-    }
-    config = types.SimpleNamespace(**config)
 
-    os.makedirs(cmd_outdir, exist_ok=True)
-    os.makedirs(csv_outdir, exist_ok=True)
+def cypher_map(row):
+    """ cypher literal of a flat dict of scalars """
+    return '{{{}}}'.format(', '.join('{}: {}'.format(cypher_name(k), ujson.dumps(v, escape_forward_slashes=False)) for k, v in row.items()))
 
-    with open(manifest, 'r') as stream:
-        for line in stream:
-            line = line.strip()
-            if 'Edge' in line:
-                config.edge_files.append(line)
-            elif 'Vertex' in line:
-                config.vertex_files.append(line)
 
-    vertex_csvs = {}
-    edge_csvs = {}
-    to_csv_commands = []
-    headers = {}
-    # read all files to determine header by label
+def cypher_properties(record, exclude):
+    """ the properties neo4j-admin import would set from a flattened record """
+    properties = {}
+    for k, v in record.items():
+        if k in exclude or v.__class__.__name__ not in py_2_neo:
+            continue
+        if isinstance(v, str):
+            v = convert_string(v)
+        properties[k] = v
+    return properties
+
+
+def delta_statements(outdir, batch_size=1000):
+    """ cypher statements deleting removed edges and vertices, then merging added and changed ones """
+    flattener = Flattener()
+
+    def batches(op, suffix):
+        for group, path in read_delta(outdir, op):
+            if not group.endswith(suffix):
+                continue
+            batch = []
+            for lines in read_batches(path):
+                for line in lines:
+                    batch.append(flattener(ujson.loads(line)))
+                    if len(batch) == batch_size:
+                        yield group, batch
+                        batch = []
+            if batch:
+                yield group, batch
+
+    def endpoints(group):
+        """ labelled patterns for the start and end nodes of the edges of group """
+        parts = group[:-len('.Edge')].split('_')
+        if len(parts) != 3:
+            return '(a {gid: row.source})', '(b {gid: row.target})'
+        return '(a:{} {{gid: row.source}})'.format(cypher_name(parts[0])), '(b:{} {{gid: row.target}})'.format(cypher_name(parts[2]))
+
+    for group, batch in batches('delete', '.Edge'):
+        a, b = endpoints(group)
+        for label in sorted(set(record['label'] for record in batch)):
+            rows = [{'source': record['from'], 'target': record['to']} for record in batch if record['label'] == label]
+            yield 'UNWIND [{}] AS row MATCH {}-[r:{}]->{} DELETE r;'.format(', '.join(cypher_map(row) for row in rows), a, cypher_name(label), b)
+    for group, batch in batches('delete', '.Vertex'):
+        yield 'UNWIND [{}] AS gid MATCH (n:{} {{gid: gid}}) DETACH DELETE n;'.format(
+            ', '.join(ujson.dumps(record['gid'], escape_forward_slashes=False) for record in batch), cypher_name(group[:-len('.Vertex')]))
+    for group, batch in batches('upsert', '.Vertex'):
+        rows = [cypher_properties(record, ['_id', 'label']) for record in batch]
+        yield 'UNWIND [{}] AS row MERGE (n:{} {{gid: row.gid}}) SET n = row;'.format(', '.join(cypher_map(row) for row in rows), cypher_name(group[:-len('.Vertex')]))
+    for group, batch in batches('upsert', '.Edge'):
+        a, b = endpoints(group)
+        for label in sorted(set(record['label'] for record in batch)):
+            rows = ['{{source: {}, target: {}, properties: {}}}'.format(ujson.dumps(record['from'], escape_forward_slashes=False),
+                                                                ujson.dumps(record['to'], escape_forward_slashes=False),
+                                                                cypher_map(cypher_properties(record, ['_id', 'gid', 'from', 'to', 'label'])))
+                    for record in batch if record['label'] == label]
+            yield 'UNWIND [{}] AS row MATCH {}, {} MERGE (a)-[r:{}]->(b) SET r = row.properties;'.format(', '.join(rows), a, b, cypher_name(label))
+
+
+def diff(old_manifest, new_manifest, outdir, memory=1024, batch_size=1000):
+    """ cypher delta from old_manifest to new_manifest and {outdir}/load_delta.txt to apply it to a running neo4j
+
+    neo4j/delta.cypher detaches and deletes removed vertices and edges and
+    merges added and changed ones by gid, batch_size records per statement;
+    SET n = row also drops the properties changed vertices no longer have;
+    edges get the properties of the full import, without their gid
+    """
+    diff_json(old_manifest, new_manifest, outdir, memory=memory)
+    cypher_path = os.path.join(outdir, 'neo4j', 'delta.cypher')
+    os.makedirs(os.path.dirname(cypher_path), exist_ok=True)
+    c = 0
+    with AsyncWriter(cypher_path) as writer:
+        for statement in delta_statements(outdir, batch_size=batch_size):
+            writer.write(statement)
+            writer.write('\n')
+            c += 1
+    logging.info('wrote {} statements to {}'.format(c, cypher_path))
+
+    load_path = os.path.join(outdir, 'load_delta.txt')
+    with open(load_path, 'w') as outfile:
+        # credentials are read from NEO4J_USERNAME and NEO4J_PASSWORD
+        outfile.write('cypher-shell --format plain < {}\n'.format(cypher_path))
+    logging.info('wrote {}'.format(load_path))
+
+
+def infer_headers(config, csv_outdir, full_scan=False, jobs=None, integer_ids=False, pack_wide=False, cache_dir=None, native_lists=False):
+    """ read all files to determine header by label
+
+    with pack_wide, the wide object of a label, see find_wide, becomes one
+    string column holding its json instead of a column per key
+
+    with native_lists, a list of scalars of a vertex becomes one array
+    column, e.g. string[], its elements joined by array_delimiter, instead
+    of a column per position; lists of objects are still flattened
+
+    cache_dir holds the type statistics of each file, see scan_schema, by
+    default the outdir; another converter run on the same files can share them
+    """
+    scan = []
     for path in config.vertex_files + config.edge_files:
         if not os.path.isfile(path):
             logging.warning('{} does not exist'.format(path))
             continue
-        label = get_label(path)
-        typ = 'Vertex' if 'Vertex' in path else 'Edge'
-        label = '{}.{}'.format(label, typ)
-        if label not in headers:
-            headers[label] = {}
-        headers[label] = {**headers[label], **to_csv_header(path)}
+        scan.append(path)
+    sample_size = None if full_scan else 1000
+    with multiprocessing.Pool(jobs or multiprocessing.cpu_count()) as pool:
+        stats = pool.map(scan_schema, [(path, get_cache_path(cache_dir or csv_outdir, path), sample_size, native_lists) for path in scan], chunksize=1)
+    headers = {}
+    packed = {}
+    for label, types in to_label_types(zip(scan, stats)).items():
+        if pack_wide:
+            types, packed[label] = pack_wide_types(types, {'float': float, 'long': int})
+        headers[label] = {}
+        if integer_ids and label.endswith('.Vertex'):
+            headers[label]['_uid'] = decorate_key('_uid', 'long')
+        # keys no value of which had a type, e.g. lists of nulls only, get no column
+        headers[label].update({k: decorate_key(k, t, integer_ids) for k, t in types.items() if t is not None})
     # write csv header files
     for label in headers.keys():
         output_path = os.path.join(csv_outdir, '{}.header.csv'.format(label))
         with open(output_path, "w", newline='') as myfile:
             writer = csv.DictWriter(myfile, fieldnames=headers[label].keys())
             writer.writerow(headers[label])
+        write_packed(output_path, packed.get(label))
+
+
+def csv_backend(csv_outdir, single_pass=False, limit=None, index_hash=None, integer_ids=False, reuse_from=None):
+    """ the csv outputs of the files of a manifest, for convert_all, see run """
+
+    def header(path):
+        if single_pass:
+            return None
+        label = '{}.{}'.format(get_label(path), 'Vertex' if 'Vertex' in path else 'Edge')
+        return os.path.join(csv_outdir, '{}.header.csv'.format(label))
+
+    def sink(path):
+        if single_pass:
+            return SinglePassCsvSink, {'integer_ids': integer_ids}
+        return CsvSink, {'header': header(path), 'integer_ids': integer_ids}
+
+    def key(path):
+        indexed = 'Edge' in path or integer_ids
+        return build_key(header(path), limit, index_hash if indexed else None, integer_ids)
+
+    def sidecars(path):
+        files = [get_stats_path] if single_pass else []
+        if index_hash and 'Edge' in path:
+            # edges filtered by the vertex index also keep their dropped counts
+            files.append(get_dropped_path)
+        return files
+
+    return types.SimpleNamespace(
+        outdir=csv_outdir,
+        reuse_from=reuse_from,
+        output=lambda path: get_output_path(csv_outdir, path),
+        sink=sink,
+        key=key,
+        sidecars=sidecars,
+    )
+
+
+def run(manifest, csv_outdir, limit=None, single_pass=False, full_scan=False, jobs=None, worker_memory=None, chunk_size=None, chunk_dir=None, reuse_from=None, drop_dangling=False, dedupe=False, dedupe_policy='last', integer_ids=False, pack_wide=False, timings_dir='timings', profile=False, sample=None, sample_seed=0, native_lists=False):
+    """ convert every file in the manifest on a pool of workers, largest input first
+
+    outputs whose input content and header are unchanged since they were
+    built are kept; outputs of identical inputs in this or the reuse_from
+    directory, e.g. that of the previous release, are linked rather than
+    converted again
+
+    with drop_dangling, edges to or from vertices missing from the manifest
+    are left out, see build_vertex_index, and counted by label in
+    {outdir}/dropped_edges.json; with sample, a connected subgraph of that
+    many vertices of each label is converted instead, see sample_manifest
+
+    the time each file took per stage is written to {timings_dir}/to_csv_{time}.json,
+    see convert_all
+    """
+    if pack_wide and single_pass:
+        raise ValueError('--pack-wide changes the inferred headers, it can not be combined with --single-pass')
+    if native_lists and single_pass:
+        raise ValueError('--native-lists changes the inferred headers, it can not be combined with --single-pass')
+    os.makedirs(csv_outdir, exist_ok=True)
+    if dedupe:
+        manifest = dedupe_manifest(manifest, os.path.join(csv_outdir, 'dedupe'), memory=worker_memory or 1024, policy=dedupe_policy, jobs=jobs)
+    if sample:
+        manifest = sample_manifest(manifest, os.path.join(csv_outdir, 'sample'), sample, seed=sample_seed, jobs=jobs)
+    if chunk_size:
+        manifest = split_manifest(manifest, chunk_dir or os.path.join(csv_outdir, 'chunks'), chunk_size, jobs=jobs)
+    config = read_manifest(manifest)
+    if not single_pass:
+        infer_headers(config, csv_outdir, full_scan=full_scan, jobs=jobs, integer_ids=integer_ids, pack_wide=pack_wide, native_lists=native_lists)
+    if integer_ids:
+        # an edge to a vertex without an id can not be written
+        drop_dangling = True
+    index = None
+    if drop_dangling:
+        index = vertex_index(config, csv_outdir, jobs=jobs, memory=worker_memory or 1024)
+
+    backend = csv_backend(csv_outdir, single_pass, limit, index[1] if index else None, integer_ids, reuse_from)
+    convert_all(config, [backend], limit=limit, index=index, jobs=jobs, worker_memory=worker_memory, timings_dir=timings_dir, name='to_csv', profile=profile)
+    if single_pass:
+        merge_header(manifest, csv_outdir)
+    if drop_dangling:
+        report_dropped([get_output_path(csv_outdir, path) for path in config.edge_files], csv_outdir)
+
+
+def run_job(manifest, csv_outdir, limit=None, single_pass=False, full_scan=False, jobs=None, worker_memory=None, chunk_size=None, chunk_dir=None, reuse_from=None, drop_dangling=False, dedupe=False, dedupe_policy='last', integer_ids=False, pack_wide=False, timings_dir='timings', profile=False, sample=None, sample_seed=0, native_lists=False):
+    """ cmd line to convert every file in the manifest, which has been split already """
+    options = []
+    if limit:
+        options.append('--limit {}'.format(limit))
+    if single_pass:
+        options.append('--single-pass')
+    if full_scan:
+        options.append('--full-scan')
+    if jobs:
+        options.append('--jobs {}'.format(jobs))
+    if worker_memory:
+        options.append('--worker-memory {}'.format(worker_memory))
+    if reuse_from:
+        options.append('--reuse-from {}'.format(reuse_from))
+    if pack_wide:
+        options.append('--pack-wide')
+    if native_lists:
+        options.append('--native-lists')
+    if timings_dir != 'timings':
+        options.append('--timings-dir {}'.format(timings_dir))
+    if profile:
+        options.append('--profile')
+    if integer_ids:
+        options.append('--integer-ids')
+    elif drop_dangling:
+        options.append('--drop-dangling')
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    return 'python3.7 {}/to_csv.py run --manifest {} --csv-outdir {} {}'.format(script_dir, manifest, csv_outdir, ' '.join(options))
+
+
+def cmd_gen(manifest, db_name, cmd_outdir, csv_outdir, limit, single_pass=False, full_scan=False, jobs=None, worker_memory=None, chunk_size=None, chunk_dir=None, reuse_from=None, drop_dangling=False, dedupe=False, dedupe_policy='last', integer_ids=False, pack_wide=False, timings_dir='timings', profile=False, sample=None, sample_seed=0, native_lists=False):
+    """render csv file(s) and neo4j-import clause"""
+    if pack_wide and single_pass:
+        raise ValueError('--pack-wide changes the inferred headers, it can not be combined with --single-pass')
+    if native_lists and single_pass:
+        raise ValueError('--native-lists changes the inferred headers, it can not be combined with --single-pass')
+
+    os.makedirs(cmd_outdir, exist_ok=True)
+    os.makedirs(csv_outdir, exist_ok=True)
+
+    if dedupe:
+        manifest = dedupe_manifest(manifest, os.path.join(csv_outdir, 'dedupe'), memory=worker_memory or 1024, policy=dedupe_policy, jobs=jobs)
+    if sample:
+        manifest = sample_manifest(manifest, os.path.join(csv_outdir, 'sample'), sample, seed=sample_seed, jobs=jobs)
+    if chunk_size:
+        manifest = split_manifest(manifest, chunk_dir or os.path.join(csv_outdir, 'chunks'), chunk_size, jobs=jobs)
+    config = read_manifest(manifest)
+
+    vertex_csvs = {}
+    edge_csvs = {}
+    # with single_pass the header is inferred while converting, see merge_header
+    if not single_pass:
+        infer_headers(config, csv_outdir, full_scan=full_scan, jobs=jobs, integer_ids=integer_ids, pack_wide=pack_wide, native_lists=native_lists)
 
     for path in config.vertex_files:
         if not os.path.isfile(path):
             logging.warning('{} does not exist'.format(path))
             continue
         label = get_label(path)
-        if label not in vertex_csvs:
-            vertex_csvs[label] = []
-            vertex_csvs[label].append(os.path.join(csv_outdir, '{}.Vertex.header.csv'.format(label)))
-        to_csv_commands.append(to_csv_job(path, csv_outdir, limit=limit))
-        vertex_csvs[label].append(get_output_path(csv_outdir, path))
+        if single_pass:
+            # every file has its own header
+            vertex_csvs.setdefault(label, []).append([get_header_path(get_output_path(csv_outdir, path))])
+        elif label not in vertex_csvs:
+            vertex_csvs[label] = [[os.path.join(csv_outdir, '{}.Vertex.header.csv'.format(label))]]
+        vertex_csvs[label][-1].append(get_output_path(csv_outdir, path))
 
     for path in config.edge_files:
         if not os.path.isfile(path):
             logging.warning('{} does not exist'.format(path))
             continue
         label = get_label(path)
-        if label not in edge_csvs:
-            edge_csvs[label] = []
-            edge_csvs[label].append(os.path.join(csv_outdir, '{}.Edge.header.csv'.format(label)))
-        to_csv_commands.append(to_csv_job(path, csv_outdir, limit=limit))
-        edge_csvs[label].append(get_output_path(csv_outdir, path))
-
-    path = os.path.join(cmd_outdir, 'to_csv_commands.txt')
-    with open(path, 'w') as outfile:
-        for command in to_csv_commands:
-            outfile.write('{}\n'.format(command))
-        logging.info('wrote {}'.format(path))
+        if single_pass:
+            # every file has its own header
+            edge_csvs.setdefault(label, []).append([get_header_path(get_output_path(csv_outdir, path))])
+        elif label not in edge_csvs:
+            edge_csvs[label] = [[os.path.join(csv_outdir, '{}.Edge.header.csv'.format(label))]]
+        edge_csvs[label][-1].append(get_output_path(csv_outdir, path))
 
     nodes = []
     for key in vertex_csvs.keys():
-        nodes.append('--nodes:{} {}'.format(key, ','.join(vertex_csvs[key])))
+        for group in vertex_csvs[key]:
+            nodes.append('--nodes:{} {}'.format(key, ','.join(group)))
 
     edges = []
     for key in edge_csvs.keys():
-        edges.append('--relationships:{} {}'.format(key, ','.join(edge_csvs[key])))
+        for group in edge_csvs[key]:
+            edges.append('--relationships:{} {}'.format(key, ','.join(group)))
 
     cmds = '\n'.join([
-        'parallel --jobs {} < {}'.format(multiprocessing.cpu_count(), os.path.join(cmd_outdir, "to_csv_commands.txt")),
-        'neo4j-admin import --database {} --ignore-missing-nodes=true --ignore-duplicate-nodes=true --ignore-extra-columns=true --high-io=true \\'.format(db_name)
+        run_job(manifest, csv_outdir, limit=limit, single_pass=single_pass, full_scan=full_scan, jobs=jobs, worker_memory=worker_memory, reuse_from=reuse_from, drop_dangling=drop_dangling, integer_ids=integer_ids, pack_wide=pack_wide, timings_dir=timings_dir, profile=profile, native_lists=native_lists),
+        'neo4j-admin import --database {} --ignore-missing-nodes=true --ignore-duplicate-nodes=true --ignore-extra-columns=true --high-io=true{}{} \\'.format(
+            db_name, ' --id-type=INTEGER' if integer_ids else '', ' --array-delimiter=U+001F' if native_lists else '')
     ])
     cmds = '{}\n  {}\n'.format(cmds, ' \\\n  '.join(nodes + edges))
     path = os.path.join(cmd_outdir, 'load_db.txt')
@@ -284,6 +857,7 @@ def cmd_gen(manifest, db_name, cmd_outdir, csv_outdir, limit):
 
 
 if __name__ == '__main__':  # pragma: no cover
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
     logging.getLogger().setLevel(logging.DEBUG)
     parser = argparse.ArgumentParser(description='Loads vertexes and edges into neo4j')
     parser.add_argument('--limit', dest='limit', type=int, default=None, help='limit the number of rows in each vertex/edge')
@@ -291,19 +865,104 @@ if __name__ == '__main__':  # pragma: no cover
     cmdgen_parser = subparsers.add_parser('cmd-gen', help='generate to_csv commands')
     cmdgen_parser.add_argument('--manifest', dest='manifest', required=True, help='manifest file path')
     cmdgen_parser.add_argument('--db-name', dest='db_name', default='bmeg.db', help='directory name')
-    cmdgen_parser.add_argument('--cmd-outdir', dest='cmd_outdir', default='.', help='directory in which to write command files (to_csv_commands.txt, load_db.txt)')
+    cmdgen_parser.add_argument('--cmd-outdir', dest='cmd_outdir', default='.', help='directory in which to write load_db.txt')
     cmdgen_parser.add_argument('--csv-outdir', dest='csv_outdir', default='.', help='directory in which commands should specify to write csv files')
+    cmdgen_parser.add_argument('--full-scan', dest='full_scan', action='store_true', default=False, help='read every record of every file to infer the headers, instead of a sample')
+    cmdgen_parser.add_argument('--jobs', dest='jobs', type=int, default=None, help='number of processes used to infer the headers [default: cpu count]')
+    cmdgen_parser.add_argument('--single-pass', dest='single_pass', action='store_true', default=False, help='infer headers while converting instead of reading every file up front')
+    cmdgen_parser.add_argument('--worker-memory', dest='worker_memory', type=int, default=None, help='memory budget in MB for each conversion worker')
+    cmdgen_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=None, help='split inputs larger than this many MB into parts that are converted in parallel')
+    cmdgen_parser.add_argument('--chunk-dir', dest='chunk_dir', default=None, help='directory in which to write the parts of split inputs [default: {outdir}/chunks]')
+    cmdgen_parser.add_argument('--reuse-from', dest='reuse_from', default=None, help='csv output directory of a previous build, e.g. the last release, whose outputs are reused for identical inputs')
+    cmdgen_parser.add_argument('--drop-dangling', dest='drop_dangling', action='store_true', default=False, help='leave out edges to or from vertices missing from the manifest, counted by label in dropped_edges.json')
+    cmdgen_parser.add_argument('--dedupe', dest='dedupe', action='store_true', default=False, help='merge vertices with the same gid from the several files of a label into one file first, sorting within --worker-memory [default: 1024] MB')
+    cmdgen_parser.add_argument('--dedupe-policy', dest='dedupe_policy', choices=['last', 'first'], default='last', help='which copy of a duplicate vertex wins where their values conflict, in manifest order [default: last]')
+    cmdgen_parser.add_argument('--integer-ids', dest='integer_ids', action='store_true', default=False, help='write vertex ids as integers from the vertex index for neo4j-admin --id-type=INTEGER, keeping the gid as a property; implies --drop-dangling')
+    cmdgen_parser.add_argument('--pack-wide', dest='pack_wide', action='store_true', default=False, help='write objects of more than 1000 numeric values, e.g. expression values, as one json string property instead of a column per key')
+    cmdgen_parser.add_argument('--native-lists', dest='native_lists', action='store_true', default=False, help='write lists of scalars of a vertex as one array column, e.g. string[], for neo4j-admin --array-delimiter, instead of a column per position')
+    cmdgen_parser.add_argument('--timings-dir', dest='timings_dir', default='timings', help='directory in which to write the timings of the run, per file and stage [default: timings]')
+    cmdgen_parser.add_argument('--profile', dest='profile', action='store_true', default=False, help='sample the stacks of each conversion worker and write them to the timings directory, for flamegraph.pl or speedscope')
+    cmdgen_parser.add_argument('--sample', dest='sample', type=int, default=None, help='convert a connected sample of this many vertices of each label, the edges to or from them and the vertices at their other ends, instead of every record')
+    cmdgen_parser.add_argument('--sample-seed', dest='sample_seed', type=int, default=0, help='random seed of --sample [default: 0]')
     cmdgen_parser.set_defaults(func=cmd_gen)
+    bench_parser = subparsers.add_parser('bench-flatten', help='compare flatten_json with the cached Flattener on records of a real file')
+    bench_parser.add_argument('--limit', dest='limit', type=int, default=10000, help='number of records to flatten [default: 10000]')
+    bench_parser.add_argument('--input', dest='input', required=True, help='path for single input file')
+    bench_parser.set_defaults(func=bench_flatten)
+    diff_parser = subparsers.add_parser('diff', help='write a cypher delta between two releases and load_delta.txt to apply it to a running neo4j')
+    diff_parser.add_argument('--old-manifest', dest='old_manifest', required=True, help='manifest file path of the loaded release')
+    diff_parser.add_argument('--new-manifest', dest='new_manifest', required=True, help='manifest file path of the new release')
+    diff_parser.add_argument('--outdir', dest='outdir', required=True, help='directory in which to write the deltas')
+    diff_parser.add_argument('--memory', dest='memory', type=int, default=1024, help='memory in MB used to sort records before spilling to disk [default: 1024]')
+    diff_parser.add_argument('--batch-size', dest='batch_size', type=int, default=1000, help='records per cypher statement [default: 1000]')
+    diff_parser.set_defaults(func=diff)
+    run_parser = subparsers.add_parser('run', help='infer headers and convert every file in the manifest to csv')
+    run_parser.add_argument('--limit', dest='limit', type=int, default=None, help='limit the number of rows in each vertex/edge [default: None]')
+    run_parser.add_argument('--manifest', dest='manifest', required=True, help='manifest file path')
+    run_parser.add_argument('--csv-outdir', dest='csv_outdir', default='.', help='directory in which to write csv files')
+    run_parser.add_argument('--full-scan', dest='full_scan', action='store_true', default=False, help='read every record of every file to infer the headers, instead of a sample')
+    run_parser.add_argument('--jobs', dest='jobs', type=int, default=None, help='number of worker processes [default: cpu count]')
+    run_parser.add_argument('--single-pass', dest='single_pass', action='store_true', default=False, help='infer headers while converting instead of reading every file up front')
+    run_parser.add_argument('--worker-memory', dest='worker_memory', type=int, default=None, help='memory budget in MB for each worker; also caps the number of workers to fit in physical memory')
+    run_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=None, help='split inputs larger than this many MB into parts that are converted in parallel')
+    run_parser.add_argument('--chunk-dir', dest='chunk_dir', default=None, help='directory in which to write the parts of split inputs [default: {outdir}/chunks]')
+    run_parser.add_argument('--reuse-from', dest='reuse_from', default=None, help='csv output directory of a previous build, e.g. the last release, whose outputs are reused for identical inputs')
+    run_parser.add_argument('--drop-dangling', dest='drop_dangling', action='store_true', default=False, help='leave out edges to or from vertices missing from the manifest, counted by label in dropped_edges.json')
+    run_parser.add_argument('--dedupe', dest='dedupe', action='store_true', default=False, help='merge vertices with the same gid from the several files of a label into one file first, sorting within --worker-memory [default: 1024] MB')
+    run_parser.add_argument('--dedupe-policy', dest='dedupe_policy', choices=['last', 'first'], default='last', help='which copy of a duplicate vertex wins where their values conflict, in manifest order [default: last]')
+    run_parser.add_argument('--integer-ids', dest='integer_ids', action='store_true', default=False, help='write vertex ids as integers from the vertex index for neo4j-admin --id-type=INTEGER, keeping the gid as a property; implies --drop-dangling')
+    run_parser.add_argument('--pack-wide', dest='pack_wide', action='store_true', default=False, help='write objects of more than 1000 numeric values, e.g. expression values, as one json string property instead of a column per key')
+    run_parser.add_argument('--native-lists', dest='native_lists', action='store_true', default=False, help='write lists of scalars of a vertex as one array column, e.g. string[], for neo4j-admin --array-delimiter, instead of a column per position')
+    run_parser.add_argument('--timings-dir', dest='timings_dir', default='timings', help='directory in which to write the timings of the run, per file and stage [default: timings]')
+    run_parser.add_argument('--profile', dest='profile', action='store_true', default=False, help='sample the stacks of each conversion worker and write them to the timings directory, for flamegraph.pl or speedscope')
+    run_parser.add_argument('--sample', dest='sample', type=int, default=None, help='convert a connected sample of this many vertices of each label, the edges to or from them and the vertices at their other ends, instead of every record')
+    run_parser.add_argument('--sample-seed', dest='sample_seed', type=int, default=0, help='random seed of --sample [default: 0]')
+    run_parser.set_defaults(func=run)
+    split_parser = subparsers.add_parser('split', help='split large inputs into parts and write a manifest listing the parts')
+    split_parser.add_argument('--manifest', dest='manifest', required=True, help='manifest file path')
+    split_parser.add_argument('--chunk-dir', dest='chunk_dir', required=True, help='directory in which to write the parts and the new manifest')
+    split_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=512, help='split inputs larger than this many MB [default: 512]')
+    split_parser.add_argument('--jobs', dest='jobs', type=int, default=None, help='number of worker processes [default: cpu count]')
+    split_parser.set_defaults(func=split_manifest)
+
+    dedupe_parser = subparsers.add_parser('dedupe', help='merge duplicate vertices and write a manifest listing the merged files')
+    dedupe_parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
+    dedupe_parser.add_argument('--dedupe-dir', dest='dedupe_dir', required=True, help='directory in which to write the merged files and the new manifest')
+    dedupe_parser.add_argument('--memory', dest='memory', type=int, default=1024, help='memory in MB used to sort records before spilling to disk [default: 1024]')
+    dedupe_parser.add_argument('--policy', dest='policy', choices=['last', 'first'], default='last', help='which copy of a duplicate vertex wins where their values conflict, in manifest order [default: last]')
+    dedupe_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None, help='number of worker processes [default: cpu count]')
+    dedupe_parser.set_defaults(func=dedupe_manifest)
+
+    sample_parser = subparsers.add_parser('sample', help='sample a connected subgraph and write a manifest listing its files')
+    sample_parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
+    sample_parser.add_argument('--sample-dir', dest='sample_dir', required=True, help='directory in which to write the sampled files and the new manifest')
+    sample_parser.add_argument('--size', dest='size', type=int, required=True, help='number of vertices of each label to sample, before those the edges of the sample reference')
+    sample_parser.add_argument('--seed', dest='seed', type=int, default=0, help='random seed; the same seed picks the same sample [default: 0]')
+    sample_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None, help='number of worker processes [default: cpu count]')
+    sample_parser.set_defaults(func=sample_manifest)
     # config_path = '{}/config.yml'.format(os.path.dirname(os.path.realpath(__file__)))
     # parser.add_argument('--config', dest='config', default=config_path, help='config path {}'.format(config_path))
     tocsv_parser = subparsers.add_parser('convert', help='convert input json to csv')
     tocsv_parser.add_argument('--limit', dest='limit', type=int, default=None, help='limit the number of rows in each vertex/edge [default: None]')
     tocsv_parser.add_argument('--input', dest='input', required=True, help='path for single input file')
     tocsv_parser.add_argument('--output', dest='output', required=True, help='path for single output file')
-    tocsv_parser.add_argument('--header', dest='header', required=True, help='path to corresponding header file')
+    tocsv_parser.add_argument('--header', dest='header', default=None, help='path to corresponding header file; if omitted types are inferred and written to {output}.schema.json')
+    tocsv_parser.add_argument('--safe-columns', dest='safe_columns', type=lambda x: x.split(','), default=None, help='comma separated string columns known to contain no commas or quotes; if all columns are safe or numeric rows are written without csv quoting')
+    tocsv_parser.add_argument('--vertex-index', dest='vertex_index', default=None, help='vertex index written by run --drop-dangling; edges to or from vertices not in it are dropped and counted in {output}.dropped.json')
+    tocsv_parser.add_argument('--integer-ids', dest='integer_ids', action='store_true', default=False, help='write vertex ids as integers from the vertex index for neo4j-admin --id-type=INTEGER, keeping the gid as a property, numbered by --vertex-index')
     tocsv_parser.set_defaults(func=to_csv)
+    merge_parser = subparsers.add_parser('merge-header', help='merge the statistics of single pass conversions into header files')
+    merge_parser.add_argument('--manifest', dest='manifest', required=True, help='manifest file path')
+    merge_parser.add_argument('--csv-outdir', dest='csv_outdir', default='.', help='directory containing the converted csv files')
+    merge_parser.set_defaults(func=merge_header)
     args = parser.parse_args()
     logging.debug(vars(args))
     cmd_args = vars(args).copy()
+    if 'func' not in cmd_args:
+        parser.print_help()
+        sys.exit(0)
     del cmd_args['func']
+    if args.func in [merge_header, split_manifest, dedupe_manifest, sample_manifest, diff]:
+        # --limit only applies to conversion
+        del cmd_args['limit']
     args.func(**cmd_args)
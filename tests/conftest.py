@@ -0,0 +1,27 @@
+import gzip
+import os
+import sys
+
+import ujson
+
+# the converters are scripts in the directory of their database, importable as util/convert.py does
+repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+for d in [repo_dir, os.path.join(repo_dir, 'dgraph'), os.path.join(repo_dir, 'neo4j'), os.path.join(repo_dir, 'util')]:
+    if d not in sys.path:
+        sys.path.insert(0, d)
+
+
+def write_json(path, records):
+    """ records as gzipped json lines, as in a release """
+    with gzip.open(str(path), 'wt') as fh:
+        for record in records:
+            fh.write(ujson.dumps(record, escape_forward_slashes=False))
+            fh.write('\n')
+    return str(path)
+
+
+def write_manifest(path, paths):
+    with open(str(path), 'w') as fh:
+        for p in paths:
+            fh.write('{}\n'.format(p))
+    return str(path)
@@ -0,0 +1,35 @@
+import hashlib
+import os
+import sys
+
+import ujson
+
+import bench
+
+
+def digests(outdir):
+    with open(bench.get_dataset_path(outdir)) as fh:
+        dataset = ujson.load(fh)
+    return [(os.path.basename(f['path']), f['records'], hashlib.md5(open(f['path'], 'rb').read()).hexdigest()) for f in dataset['files']]
+
+
+def test_generate_is_reproducible(tmp_path):
+    bench.generate(str(tmp_path / 'a'), scale=1, seed=3)
+    bench.generate(str(tmp_path / 'b'), scale=1, seed=3)
+    assert digests(str(tmp_path / 'a')) == digests(str(tmp_path / 'b'))
+    assert [records for _, records, _ in digests(str(tmp_path / 'a'))][:2] == [2000, 5000]
+
+
+def test_results_have_the_stages_run(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / 'data')
+    bench.generate(data_dir, scale=1)
+    # load_converters imports the converters again under their names
+    for name in ['to_rdf', 'to_csv']:
+        if name in sys.modules:
+            monkeypatch.setitem(sys.modules, name, sys.modules[name])
+    results = bench.run(data_dir, results=str(tmp_path / 'results.json'), only=['parse', 'to_vertex'])
+    with open(results) as fh:
+        stages = ujson.load(fh)['stages']
+    assert sorted(stages) == ['parse', 'to_vertex']
+    assert stages['parse']['records'] == sum(records for _, records, _ in digests(data_dir))
+    assert stages['parse']['seconds'] > 0 and stages['parse']['peak_rss_mb'] > 0
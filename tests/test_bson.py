@@ -0,0 +1,51 @@
+import gzip
+import os
+
+import ujson
+
+from conftest import write_json, write_manifest
+from core.mongo import bson_documents, decode_document, encode_document
+import convert
+
+
+def test_documents_decode_to_their_json():
+    # the bytes of the bson spec's own example
+    assert encode_document({'hello': 'world'}) == b'\x16\x00\x00\x00\x02hello\x00\x06\x00\x00\x00world\x00\x00'
+    doc = {'_id': 'old', 'label': 'Gene', 'data': {
+        'symbol': 'BRAFé', 'ok': True, 'no': False, 'n': -3, 'big': 2 ** 40, 'huge': 2 ** 70, 'x': 0.5, 'none': None,
+        'list': [1, 'a', [], {}, [{'b': None}]],
+    }}
+    decoded, end = decode_document(encode_document(doc, id='Gene:1'))
+    assert end == len(encode_document(doc, id='Gene:1'))
+    # the id given replaces the _id of the record, and comes first
+    assert list(decoded) == ['_id', 'label', 'data']
+    assert decoded['_id'] == 'Gene:1'
+    assert decoded['data'] == dict(doc['data'], huge=float(2 ** 70))
+    assert type(decoded['data']['huge']) is float and type(decoded['data']['big']) is int
+
+
+def test_dump_holds_the_records_with_their_gid_as_id(tmp_path):
+    docs = [{'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i), 'tags': ['a'] * i}} for i in range(4)]
+    genes = [{'gid': 'Gene:{}'.format(i), 'label': 'Gene', 'data': {'symbol': 'G{}'.format(i)}} for i in range(3)]
+    edges = [{'gid': '(Doc:{})--about->(Gene:{})'.format(i, i % 3), 'label': 'about', 'from': 'Doc:{}'.format(i), 'to': 'Gene:{}'.format(i % 3), 'data': {}}
+             for i in range(4)]
+    manifest = write_manifest(tmp_path / 'manifest.txt', [
+        write_json(tmp_path / 'Doc.Vertex.json.gz', docs),
+        write_json(tmp_path / 'Gene.Vertex.json.gz', genes),
+        write_json(tmp_path / 'Doc_about_Gene.Edge.json.gz', edges),
+    ])
+    outdir = str(tmp_path / 'bson')
+    convert.run(manifest, bson_outdir=outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    dump_dir = os.path.join(outdir, 'dump', 'grip')
+
+    # the parts of both vertex files are in one collection
+    for collection, records in [('bmeg_vertices', docs + genes), ('bmeg_edges', edges)]:
+        assert list(bson_documents(os.path.join(dump_dir, '{}.bson.gz'.format(collection)))) == [dict(_id=r['gid'], **r) for r in records]
+        with gzip.open(os.path.join(dump_dir, '{}.metadata.json.gz'.format(collection)), 'rt') as fh:
+            metadata = ujson.load(fh)
+        assert metadata['collectionName'] == collection
+        assert [index['name'] for index in metadata['indexes']][0] == '_id_'
+    with open(os.path.join(outdir, 'load_bson.sh')) as fh:
+        script = fh.read()
+    assert 'mongorestore' in script and '--dir {}'.format(os.path.abspath(os.path.join(outdir, 'dump'))) in script
+    assert 'grip create bmeg' in script
@@ -0,0 +1,70 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from conftest import write_json, write_manifest
+import to_rdf
+
+
+def doc(i, title):
+    return {'_id': 'Doc:{}'.format(i), 'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': title}}
+
+
+def write_release(release_dir, title='a'):
+    os.makedirs(str(release_dir), exist_ok=True)
+    a = write_json(release_dir / 'a.Doc.Vertex.json.gz', [doc(0, title)])
+    b = write_json(release_dir / 'b.Doc.Vertex.json.gz', [doc(1, 'b')])
+    return [a, b], write_manifest(release_dir / 'manifest.txt', [a, b])
+
+
+def built(outdir, paths):
+    """ (inode, mtime) of the outputs of paths """
+    stats = [os.stat(to_rdf.get_output_path(outdir, path)) for path in paths]
+    return [(st.st_ino, st.st_mtime_ns) for st in stats]
+
+
+def test_only_changed_files_are_converted_again(tmp_path):
+    paths, manifest = write_release(tmp_path / 'rc1')
+    outdir = str(tmp_path / 'rdf')
+    to_rdf.run(manifest, outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    first = built(outdir, paths)
+    to_rdf.run(manifest, outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    assert built(outdir, paths) == first
+
+    # a changed input, and an output that got truncated
+    write_release(tmp_path / 'rc1', title='A')
+    with open(to_rdf.get_output_path(outdir, paths[1]), 'r+b') as fh:
+        fh.truncate(10)
+    to_rdf.run(manifest, outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    assert all(before != after for before, after in zip(first, built(outdir, paths)))
+    assert '"A"' in gzip.open(to_rdf.get_output_path(outdir, paths[0]), 'rt').read()
+    assert '"b"' in gzip.open(to_rdf.get_output_path(outdir, paths[1]), 'rt').read()
+
+
+def test_outputs_of_identical_inputs_are_reused(tmp_path):
+    old_paths, old_manifest = write_release(tmp_path / 'rc1')
+    old_outdir = str(tmp_path / 'rc1-rdf')
+    to_rdf.run(old_manifest, old_outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    # the next release changes the first file only
+    shutil.copytree(str(tmp_path / 'rc1'), str(tmp_path / 'rc2'))
+    paths = [str(tmp_path / 'rc2' / os.path.basename(path)) for path in old_paths]
+    write_json(paths[0], [doc(0, 'A')])
+    manifest = write_manifest(tmp_path / 'rc2' / 'manifest.txt', paths)
+    outdir = str(tmp_path / 'rc2-rdf')
+    to_rdf.run(manifest, outdir, jobs=1, reuse_from=old_outdir, timings_dir=str(tmp_path / 'timings'))
+    assert not os.path.samefile(to_rdf.get_output_path(outdir, paths[0]), to_rdf.get_output_path(old_outdir, old_paths[0]))
+    assert os.path.samefile(to_rdf.get_output_path(outdir, paths[1]), to_rdf.get_output_path(old_outdir, old_paths[1]))
+
+
+def test_interrupted_writes_leave_nothing_behind(tmp_path):
+    path = str(tmp_path / 'Doc.rdf.gz')
+    with pytest.raises(ValueError):
+        with to_rdf.AsyncWriter(path) as writer:
+            writer.write('_:Doc-0 <label.Doc> "" .\n')
+            raise ValueError('interrupted')
+    assert os.listdir(str(tmp_path)) == []
+    with to_rdf.AsyncWriter(path) as writer:
+        writer.write('_:Doc-0 <label.Doc> "" .\n')
+    assert os.listdir(str(tmp_path)) == ['Doc.rdf.gz']
@@ -0,0 +1,14 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import repo_dir
+
+
+@pytest.mark.parametrize('script', ['dgraph/to_rdf.py', 'neo4j/to_csv.py', 'util/convert.py', 'util/bench.py'])
+def test_no_subcommand_prints_usage(script):
+    p = subprocess.run([sys.executable, os.path.join(repo_dir, script)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert p.returncode == 0, p.stderr.decode()
+    assert p.stdout.decode().startswith('usage:')
@@ -0,0 +1,47 @@
+import gzip
+import os
+
+from conftest import write_json, write_manifest
+import to_csv
+import to_rdf
+
+
+def write_graph(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [
+        {'_id': 'Doc:{}'.format(i), 'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i)}} for i in range(100)
+    ])
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'_id': str(i), 'gid': str(i), 'label': 'cites', 'from': 'Doc:{}'.format(i), 'to': 'Doc:{}'.format(i + 1), 'data': {}} for i in range(99)
+    ])
+    return [vertices, edges], write_manifest(tmp_path / 'manifest.txt', [vertices, edges])
+
+
+def test_outputs_are_gzipped_as_written_plain(tmp_path):
+    paths, manifest = write_graph(tmp_path)
+    rdf_outdir = str(tmp_path / 'rdf')
+    csv_outdir = str(tmp_path / 'csv')
+    os.makedirs(rdf_outdir)
+    to_rdf.run(manifest, rdf_outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    to_csv.run(manifest, csv_outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    for path, label in zip(paths, ['Doc.Vertex', 'cites.Edge']):
+        output = to_rdf.get_output_path(rdf_outdir, path)
+        assert output.endswith('.rdf.gz')
+        plain = str(tmp_path / 'plain.rdf')
+        to_rdf.to_rdf(path, plain, os.path.join(rdf_outdir, '{}.schema.rdf'.format(label)))
+        assert gzip.open(output, 'rt').read() == open(plain).read()
+
+        output = to_csv.get_output_path(csv_outdir, path)
+        assert output.endswith('.csv.gz')
+        plain = str(tmp_path / 'plain.csv')
+        to_csv.to_csv(path, plain, os.path.join(csv_outdir, '{}.header.csv'.format(label)))
+        assert gzip.open(output, 'rt', newline='').read() == open(plain, newline='').read()
+
+
+def test_bulk_load_reads_the_compressed_files(tmp_path):
+    paths, manifest = write_graph(tmp_path)
+    rdf_outdir = str(tmp_path / 'rdf')
+    os.makedirs(rdf_outdir)
+    to_rdf.cmd_gen(manifest, rdf_outdir, rdf_outdir, None, jobs=1)
+    load = open(os.path.join(rdf_outdir, 'load_db.sh')).read()
+    assert 'cat ' not in load
+    assert '--rdfs {} '.format(','.join(to_rdf.get_output_path(rdf_outdir, path) for path in paths)) in load
@@ -0,0 +1,43 @@
+import csv
+import gzip
+import io
+import os
+
+from conftest import write_json, write_manifest
+import to_csv
+
+
+def write_docs(tmp_path):
+    records = [
+        {'_id': 'Doc:{}'.format(i), 'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i), 'pages': i, 'score': i / 2, 'open': i % 2 == 0}}
+        for i in range(10)
+    ]
+    # a missing value is an empty cell
+    del records[3]['data']['pages']
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', records)
+    return records, vertices, write_manifest(tmp_path / 'manifest.txt', [vertices])
+
+
+def read(path):
+    with (gzip.open(path, 'rt', newline='') if path.endswith('.gz') else open(path, newline='')) as fh:
+        return fh.read()
+
+
+def test_rows_are_those_of_csv_writer(tmp_path):
+    records, vertices, manifest = write_docs(tmp_path)
+    outdir = str(tmp_path / 'csv')
+    os.makedirs(outdir)
+    to_csv.run(manifest, outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    header = os.path.join(outdir, 'Doc.Vertex.header.csv')
+    assert next(csv.reader(open(header))) == ['gid:ID', 'data.title:string', 'data.pages:long', 'data.score:float', 'data.open:boolean']
+
+    expected = io.StringIO(newline='')
+    csv.writer(expected).writerows([
+        [r['gid'], r['data']['title'], r['data'].get('pages'), r['data']['score'], r['data']['open']] for r in records
+    ])
+    assert read(to_csv.get_output_path(outdir, vertices)) == expected.getvalue()
+
+    # and the same bytes when no column needs quoting
+    unquoted = str(tmp_path / 'unquoted.csv')
+    to_csv.to_csv(vertices, unquoted, header, safe_columns=['gid', 'data.title'])
+    assert read(unquoted) == expected.getvalue()
@@ -0,0 +1,53 @@
+import gzip
+
+import pytest
+import ujson
+
+from conftest import write_json, write_manifest
+from core.convert import dedupe_manifest, Flattener, line_gid
+
+
+@pytest.mark.parametrize('policy, title', [('last', 'A'), ('first', 'a')])
+def test_copies_of_a_vertex_are_merged(tmp_path, policy, title):
+    a = write_json(tmp_path / 'a.Doc.Vertex.json.gz', [
+        {'gid': 'Doc:1', 'label': 'Doc', 'data': {'title': 'a', 'year': 2000}},
+        {'gid': 'Doc:2', 'label': 'Doc', 'data': {'title': 'b'}},
+    ])
+    b = write_json(tmp_path / 'b.Doc.Vertex.json.gz', [
+        {'gid': 'Doc:1', 'label': 'Doc', 'data': {'title': 'A', 'pages': 10}},
+    ])
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [{'gid': 'e', 'label': 'cites', 'from': 'Doc:1', 'to': 'Doc:2', 'data': {}}])
+    manifest = dedupe_manifest(write_manifest(tmp_path / 'manifest.txt', [a, b, edges]), str(tmp_path / 'dedupe'), policy=policy, jobs=1)
+    paths = open(manifest).read().split()
+    # the edges are listed as they are
+    assert len(paths) == 2 and paths[1] == edges
+    records = [ujson.loads(line) for line in gzip.open(paths[0], 'rt')]
+    assert records == [
+        {'gid': 'Doc:1', 'label': 'Doc', 'data': {'title': title, 'year': 2000, 'pages': 10}},
+        {'gid': 'Doc:2', 'label': 'Doc', 'data': {'title': 'b'}},
+    ]
+
+
+def test_merged_vertices_give_their_gid_first(tmp_path):
+    a = write_json(tmp_path / 'a.Doc.Vertex.json.gz', [
+        {'gid': 'Doc:1', 'label': 'Doc', 'data': {'title': 'a', 'year': 2000}},
+        {'gid': 'Doc:2', 'label': 'Doc', 'data': {'title': 'b'}},
+    ])
+    b = write_json(tmp_path / 'b.Doc.Vertex.json.gz', [
+        {'gid': 'Doc:1', 'label': 'Doc', 'data': {'title': 'A', 'pages': 10}},
+    ])
+    manifest = dedupe_manifest(write_manifest(tmp_path / 'manifest.txt', [a, b]), str(tmp_path / 'dedupe'), jobs=1)
+    paths = open(manifest).read().split()
+    assert len(paths) == 1
+    lines = gzip.open(paths[0], 'rb').read().splitlines()
+    assert [line_gid(line, None) for line in lines] == ['Doc:1', 'Doc:2']
+    assert all(line.startswith(b'{"gid":') for line in lines)
+    assert ujson.loads(lines[0]) == {'gid': 'Doc:1', 'label': 'Doc', 'data': {'title': 'A', 'year': 2000, 'pages': 10}}
+    assert list(ujson.loads(lines[0])['data']) == ['title', 'year', 'pages']
+
+
+def test_line_gid_is_that_of_the_record(tmp_path):
+    gids = Flattener(fields=['gid'])
+    assert line_gid(b'{"gid": "Doc:1", "data": {"gid": "x"}}', gids) == 'Doc:1'
+    assert line_gid(b'{"data": {"gid": "x"}, "gid": "Doc:\\"2\\""}', gids) == 'Doc:"2"'
+    assert line_gid(b'{"label": "Doc", "gid": "Doc:3"}', gids) == 'Doc:3'
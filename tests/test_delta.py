@@ -0,0 +1,72 @@
+import gzip
+import os
+
+import ujson
+
+from conftest import write_json, write_manifest
+from core.convert import get_delta_path
+import to_csv
+import to_rdf
+
+
+def doc(gid, title, **data):
+    return {'gid': gid, 'label': 'Doc', 'data': dict({'title': title}, **data)}
+
+
+def cites(a, b, year):
+    return {'gid': '({})--cites->({})'.format(a, b), 'label': 'cites', 'from': a, 'to': b, 'data': {'year': year}}
+
+
+def write_releases(tmp_path):
+    """ Doc:1 and an edge to it are removed, Doc:2 changes and loses its year, Doc:3 and an edge from it are added """
+    old = [doc('Doc:1', 'a'), doc('Doc:2', 'b', year=2000)]
+    new = [doc('Doc:2', 'B'), doc('Doc:3', 'c')]
+    os.makedirs(str(tmp_path / 'old'))
+    os.makedirs(str(tmp_path / 'new'))
+    old_manifest = write_manifest(tmp_path / 'old.txt', [write_json(tmp_path / 'old' / 'Doc.Vertex.json.gz', old),
+                                                         write_json(tmp_path / 'old' / 'Doc_cites_Doc.Edge.json.gz', [cites('Doc:2', 'Doc:1', 1999)])])
+    new_manifest = write_manifest(tmp_path / 'new.txt', [write_json(tmp_path / 'new' / 'Doc.Vertex.json.gz', new),
+                                                         write_json(tmp_path / 'new' / 'Doc_cites_Doc.Edge.json.gz', [cites('Doc:3', 'Doc:2', 2000)])])
+    return old_manifest, new_manifest
+
+
+def read_delta(outdir, op, group):
+    return [ujson.loads(line) for line in gzip.open(get_delta_path(outdir, op, group), 'rt')]
+
+
+def test_deltas_hold_the_changed_records(tmp_path):
+    old_manifest, new_manifest = write_releases(tmp_path)
+    outdir = str(tmp_path / 'delta')
+    to_rdf.diff(old_manifest, new_manifest, outdir)
+    assert [v['gid'] for v in read_delta(outdir, 'upsert', 'Doc.Vertex')] == ['Doc:2', 'Doc:3']
+    assert [v['gid'] for v in read_delta(outdir, 'delete', 'Doc.Vertex')] == ['Doc:1']
+    assert read_delta(outdir, 'stale', 'Doc.Vertex') == [{'gid': 'Doc:2', 'label': 'Doc', 'removed': ['data.year']}]
+    assert [e['from'] for e in read_delta(outdir, 'upsert', 'Doc_cites_Doc.Edge')] == ['Doc:3']
+    assert [e['from'] for e in read_delta(outdir, 'delete', 'Doc_cites_Doc.Edge')] == ['Doc:2']
+
+    deletes = open(os.path.join(outdir, 'dgraph', 'delete', '00000.rdf')).read()
+    for mutation in ['uid(v0) * * .', 'uid(f1) <cites> uid(t1) .', 'uid(v2) <data.year> * .']:
+        assert '      {}\n'.format(mutation) in deletes
+    upserts = gzip.open(os.path.join(outdir, 'dgraph', 'upsert', 'Doc.Vertex.rdf.gz'), 'rt').read()
+    assert '<data.title> "B" .' in upserts and '<data.title> "c" .' in upserts
+
+    # the neo4j delta reads the same json
+    to_csv.diff(old_manifest, new_manifest, outdir)
+    cypher = open(os.path.join(outdir, 'neo4j', 'delta.cypher')).read().splitlines()
+    assert len(cypher) == 4
+    for statement, end in zip(cypher, ['DELETE r;', 'DETACH DELETE n;', 'SET n = row;', 'SET r = row.properties;']):
+        assert statement.endswith(end)
+
+
+def test_upserts_are_keyed_as_grip_keys_documents(tmp_path):
+    old_manifest, new_manifest = write_releases(tmp_path)
+    outdir = str(tmp_path / 'delta')
+    to_csv.diff(old_manifest, new_manifest, outdir)
+    assert [(v['_id'], v['gid']) for v in read_delta(outdir, 'upsert', 'Doc.Vertex')] == [('Doc:2', 'Doc:2'), ('Doc:3', 'Doc:3')]
+    assert [e['_id'] for e in read_delta(outdir, 'upsert', 'Doc_cites_Doc.Edge')] == ['(Doc:3)--cites->(Doc:2)']
+
+    # the properties the full import sets, neither _id nor the gid of an edge
+    cypher = open(os.path.join(outdir, 'neo4j', 'delta.cypher')).read()
+    assert '`_id`' not in cypher
+    edge = [line for line in cypher.splitlines() if 'MERGE (a)-[r:`cites`]->(b)' in line]
+    assert len(edge) == 1 and '`gid`' not in edge[0] and '`data.year`: 2000' in edge[0]
@@ -0,0 +1,53 @@
+import os
+
+from conftest import write_json, write_manifest
+import to_rdf
+
+
+def write_graph(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [
+        {'_id': 'Doc:{}'.format(i), 'gid': 'Doc:{}'.format(i), 'label': 'Doc',
+         'data': {'title': 'a "title"\nof {}'.format(i), 'score': i / 2, 'pages': i, 'open': i % 2 == 0, 'missing': None}}
+        for i in range(20)
+    ])
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'_id': str(i), 'gid': str(i), 'label': 'cites', 'from': 'Doc:{}'.format(i), 'to': 'Doc:{}'.format(i + 1), 'data': {'weight': i / 4}}
+        for i in range(19)
+    ])
+    return vertices, edges, write_manifest(tmp_path / 'manifest.txt', [vertices, edges])
+
+
+def test_emitter_matches_convert_value(tmp_path):
+    vertices, edges, manifest = write_graph(tmp_path)
+    outdir = str(tmp_path / 'rdf')
+    os.makedirs(outdir)
+    to_rdf.cmd_gen(manifest, outdir, outdir, None, jobs=1)
+    # bench_rdf fails if the two differ
+    to_rdf.bench_rdf(vertices, os.path.join(outdir, 'Doc.Vertex.schema.rdf'))
+    to_rdf.bench_rdf(edges, os.path.join(outdir, 'cites.Edge.schema.rdf'))
+
+
+def test_triples_of_a_record(tmp_path):
+    vertices, edges, manifest = write_graph(tmp_path)
+    outdir = str(tmp_path / 'rdf')
+    os.makedirs(outdir)
+    to_rdf.cmd_gen(manifest, outdir, outdir, None, jobs=1)
+    output = str(tmp_path / 'Doc.rdf')
+    to_rdf.to_rdf(vertices, output, os.path.join(outdir, 'Doc.Vertex.schema.rdf'), limit=2)
+    with open(output) as fh:
+        assert sorted(fh.read().splitlines()) == sorted([
+            '_:Doc-0 <label.Doc> "" .',
+            '_:Doc-0 <data.title> "a \\"title\\"of 0" .',
+            '_:Doc-0 <data.score> "0.0" .',
+            '_:Doc-0 <data.pages> "0" .',
+            '_:Doc-0 <data.open> "True" .',
+            '_:Doc-1 <label.Doc> "" .',
+            '_:Doc-1 <data.title> "a \\"title\\"of 1" .',
+            '_:Doc-1 <data.score> "0.5" .',
+            '_:Doc-1 <data.pages> "1" .',
+            '_:Doc-1 <data.open> "False" .',
+        ])
+    output = str(tmp_path / 'cites.rdf')
+    to_rdf.to_rdf(edges, output, os.path.join(outdir, 'cites.Edge.schema.rdf'), limit=2)
+    with open(output) as fh:
+        assert fh.read().splitlines() == ['_:Doc-0 <cites> _:Doc-1 (data.weight="0.0") .', '_:Doc-1 <cites> _:Doc-2 (data.weight="0.25") .']
@@ -0,0 +1,19 @@
+from flatten_json import flatten
+
+from core.convert import Flattener
+
+records = [
+    {'gid': 'Gene:1', 'label': 'Gene', 'data': {'symbol': 'A', 'synonyms': ['a', 'b'], 'xrefs': {'ensembl': 'E1'}, 'empty': {}, 'none': None}},
+    # the same layout, then new keys, longer lists and a key that changes from a scalar to an object
+    {'gid': 'Gene:2', 'label': 'Gene', 'data': {'symbol': 'B', 'synonyms': ['c'], 'xrefs': {'ensembl': 'E2'}, 'empty': {}, 'none': None}},
+    {'gid': 'Gene:3', 'label': 'Gene', 'data': {'symbol': {'value': 'C'}, 'synonyms': ['d', 'e', {'f': [1, []]}], 'chromosome': 1}},
+    {'gid': 'Gene:4', 'label': 'Gene', 'data': []},
+    {},
+]
+
+
+def test_flattener_matches_flatten():
+    flattener = Flattener()
+    for record in records + records:
+        # the same keys, values and key order
+        assert list(flattener(record).items()) == list(flatten(record, '.').items())
@@ -0,0 +1,41 @@
+import gzip
+import os
+
+from conftest import write_json, write_manifest
+from core.convert import get_json_path
+from core.mongo import bson_documents
+import convert
+
+
+def write_graph(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [{'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i)}} for i in range(3)])
+    # the last edge is to a vertex that isn't there
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'gid': '(Doc:{})--cites->(Doc:{})'.format(i, j), 'label': 'cites', 'from': 'Doc:{}'.format(i), 'to': 'Doc:{}'.format(j), 'data': {}}
+        for i, j in [(0, 1), (1, 2), (2, 9)]
+    ])
+    return vertices, edges, write_manifest(tmp_path / 'manifest.txt', [vertices, edges])
+
+
+def test_every_backend_drops_the_same_dangling_edges(tmp_path):
+    vertices, edges, manifest = write_graph(tmp_path)
+    json_outdir = str(tmp_path / 'json')
+    bson_outdir = str(tmp_path / 'bson')
+    convert.run(manifest, rdf_outdir=str(tmp_path / 'rdf'), json_outdir=json_outdir, bson_outdir=bson_outdir,
+                jobs=1, integer_ids=True, timings_dir=str(tmp_path / 'timings'))
+    json_edges = gzip.open(get_json_path(json_outdir, edges), 'rt').read().splitlines()
+    assert len(json_edges) == 2 and 'Doc:9' not in ''.join(json_edges)
+    bson_edges = list(bson_documents(os.path.join(bson_outdir, 'dump', 'grip', 'bmeg_edges.bson.gz')))
+    assert sorted(doc['_id'] for doc in bson_edges) == ['(Doc:0)--cites->(Doc:1)', '(Doc:1)--cites->(Doc:2)']
+    assert len(list(bson_documents(os.path.join(bson_outdir, 'dump', 'grip', 'bmeg_vertices.bson.gz')))) == 3
+
+
+def test_load_bson_takes_its_hosts(tmp_path):
+    _, _, manifest = write_graph(tmp_path)
+    bson_outdir = str(tmp_path / 'bson')
+    convert.run(manifest, bson_outdir=bson_outdir, jobs=1, mongo_host='db.example:27018', timings_dir=str(tmp_path / 'timings'))
+    script = (tmp_path / 'bson' / 'load_bson.sh').read_text()
+    assert 'MONGO_HOST=${MONGO_HOST:-db.example:27018}' in script
+    assert 'GRIP_HOST=${GRIP_HOST:-grip:8202}' in script
+    assert 'mongorestore --host="$MONGO_HOST"' in script
+    assert 'grip create bmeg --host "$GRIP_HOST"' in script
@@ -0,0 +1,103 @@
+import os
+import sys
+
+import pytest
+import ujson
+
+from conftest import write_manifest
+import load
+
+# a loader that logs when it starts and ends, and fails the first time for a file with flaky in its name
+stub = '''
+import os, sys, time
+path, kind, log = sys.argv[1:]
+name = os.path.basename(path)
+with open(log, 'a') as fh:
+    fh.write('start {} {} {}\\n'.format(kind, name, time.time()))
+time.sleep(0.2)
+failed = path + '.failed'
+flaky = 'flaky' in name and not os.path.exists(failed)
+if flaky:
+    open(failed, 'w').close()
+with open(log, 'a') as fh:
+    fh.write('end {} {} {}\\n'.format(kind, name, time.time()))
+sys.exit(1 if flaky or 'broken' in name else 0)
+'''
+
+
+def write_files(tmp_path, names):
+    """ files of the given names, each larger than the next, and their manifest """
+    paths = []
+    for i, name in enumerate(names):
+        path = str(tmp_path / name)
+        with open(path, 'wb') as fh:
+            fh.write(b'x' * 1000 * (len(names) - i))
+        paths.append(path)
+    return paths, write_manifest(tmp_path / 'manifest.txt', list(reversed(paths)))
+
+
+def run_load(tmp_path, manifest, jobs):
+    script = tmp_path / 'stub.py'
+    script.write_text(stub)
+    log = tmp_path / 'log.txt'
+    command = '{} {} {{path}} {{kind}} {}'.format(sys.executable, script, log)
+    try:
+        path = load.load(manifest, 'test', command=command, jobs=jobs, retries=2, retry_delay=0.01, timings_dir=str(tmp_path / 'timings'))
+    finally:
+        events = [line.split() for line in log.read_text().splitlines()] if log.exists() else []
+    return path, [(event, kind, name, float(t)) for event, kind, name, t in events]
+
+
+def test_load_schedule_retries_and_timings(tmp_path):
+    names = ['A.Vertex.json.gz', 'B_flaky.Vertex.json.gz', 'C.Vertex.json.gz', 'D.Vertex.json.gz', 'A_to_B.Edge.json.gz', 'B_to_C.Edge.json.gz']
+    paths, manifest = write_files(tmp_path, names)
+    timings, events = run_load(tmp_path, manifest, jobs=2)
+
+    # never more than jobs at a time
+    running = 0
+    for event, _, _, _ in sorted(events, key=lambda e: e[3]):
+        running += 1 if event == 'start' else -1
+        assert running <= 2
+    # the largest files first
+    starts = [name for event, kind, name, _ in sorted(events, key=lambda e: e[3]) if event == 'start']
+    assert set(starts[:2]) == set(names[:2])
+    # no edge file before every vertex file is done
+    last_vertex = max(t for event, kind, _, t in events if event == 'end' and kind == 'vertex')
+    first_edge = min(t for event, kind, _, t in events if event == 'start' and kind == 'edge')
+    assert first_edge >= last_vertex
+    # the flaky file ran twice
+    assert starts.count('B_flaky.Vertex.json.gz') == 2
+
+    with open(timings) as fh:
+        report = ujson.load(fh)
+    assert report['total']['files'] == 6
+    assert report['total']['failed'] == 0
+    assert report['total']['retries'] == 1
+    assert report['total']['input_bytes'] == sum(os.path.getsize(path) for path in paths)
+    files = {os.path.basename(f['path']): f for f in report['files']}
+    assert set(files) == set(names)
+    assert files['B_flaky.Vertex.json.gz']['attempts'] == 2
+    assert all(f['attempts'] == 1 for name, f in files.items() if 'flaky' not in name)
+    assert all(f['returncode'] == 0 and f['seconds'] >= 0.2 for f in files.values())
+    assert all(f['kind'] == ('edge' if 'Edge' in name else 'vertex') for name, f in files.items())
+    assert all(f['input_bytes'] == os.path.getsize(f['path']) for f in files.values())
+
+
+def test_load_order_is_largest_first(tmp_path):
+    names = ['A.Vertex.json.gz', 'B.Vertex.json.gz', 'C.Vertex.json.gz', 'D.Edge.json.gz', 'E.Edge.json.gz']
+    _, manifest = write_files(tmp_path, names)
+    _, events = run_load(tmp_path, manifest, jobs=1)
+    assert [name for event, _, name, _ in events if event == 'start'] == names
+
+
+def test_failed_vertices_stop_the_edges(tmp_path):
+    names = ['A_broken.Vertex.json.gz', 'B.Vertex.json.gz', 'A_to_B.Edge.json.gz']
+    _, manifest = write_files(tmp_path, names)
+    with pytest.raises(SystemExit, match='1 files failed to load'):
+        run_load(tmp_path, manifest, jobs=2)
+    events = [line.split() for line in (tmp_path / 'log.txt').read_text().splitlines()]
+    # tried and retried twice, then given up on, and no edge loaded
+    assert [name for event, _, name, _ in events if event == 'start'].count('A_broken.Vertex.json.gz') == 3
+    assert not any(kind == 'edge' for _, kind, _, _ in events)
+    timings = os.listdir(str(tmp_path / 'timings'))
+    assert len(timings) == 1
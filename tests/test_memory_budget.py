@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from conftest import write_json, write_manifest
+import to_rdf
+
+
+def write_docs(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [{'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't'}} for i in range(10)])
+    return vertices, write_manifest(tmp_path / 'manifest.txt', [vertices])
+
+
+def test_worker_over_its_budget_fails_the_file(tmp_path):
+    vertices, manifest = write_docs(tmp_path)
+    with pytest.raises(SystemExit, match='1 of 1 conversions failed'):
+        to_rdf.run(manifest, str(tmp_path / 'rdf'), jobs=1, worker_memory=1, timings_dir=str(tmp_path / 'timings'))
+    assert not os.path.exists(to_rdf.get_output_path(str(tmp_path / 'rdf'), vertices))
+
+
+def test_budget_counts_resident_memory(tmp_path):
+    # far less than the address space of a python process with its threads and mapped files
+    vertices, manifest = write_docs(tmp_path)
+    to_rdf.run(manifest, str(tmp_path / 'rdf'), jobs=1, worker_memory=256, timings_dir=str(tmp_path / 'timings'))
+    assert os.path.exists(to_rdf.get_output_path(str(tmp_path / 'rdf'), vertices))
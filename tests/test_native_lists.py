@@ -0,0 +1,118 @@
+import csv
+import gzip
+
+import pytest
+
+from conftest import write_json, write_manifest
+import core.convert
+import to_csv
+import to_rdf
+
+
+def thing(i, aliases):
+    return {'gid': 'Thing:{}'.format(i), 'label': 'Thing', 'data': {'name': 'n{}'.format(i), 'aliases': aliases, 'tags': ['a', 'b']}}
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+def test_lists_of_scalars_are_kept_whole(tmp_path, monkeypatch, streamed):
+    if streamed:
+        monkeypatch.setattr(core.convert, 'huge_record', 0)
+    vertices = write_json(tmp_path / 'Thing.Vertex.json.gz', [
+        thing(0, ['x', 'y\x1fz']),
+        {'gid': 'Thing:1', 'label': 'Thing', 'data': {'name': 'n1', 'aliases': ['q'], 'tags': ['a', 'b'], 'refs': [{'name': 'o'}]}},
+        {'gid': 'Thing:2', 'label': 'Thing', 'data': {'name': 'n2', 'aliases': [], 'tags': 'c'}},
+    ])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+
+    rdf_outdir = tmp_path / 'rdf'
+    to_rdf.run(manifest, str(rdf_outdir), jobs=1, native_lists=True, timings_dir=str(tmp_path / 'timings'))
+    schema = sorted((rdf_outdir / 'Thing.Vertex.schema.rdf').read_text().splitlines())
+    # a list holding an object is still flattened by position
+    assert schema == ['<data.aliases>: [string] .', '<data.name>: string .', '<data.refs.0.name>: string .', '<data.tags>: [string] .']
+    rdf = sorted(gzip.open(to_rdf.get_output_path(str(rdf_outdir), vertices), 'rt').read().splitlines())
+    assert [line for line in rdf if 'data.name' not in line and 'label' not in line] == [
+        '_:Thing-0 <data.aliases> "x" .',
+        '_:Thing-0 <data.aliases> "y\\u001fz" .',
+        '_:Thing-0 <data.tags> "a" .',
+        '_:Thing-0 <data.tags> "b" .',
+        '_:Thing-1 <data.aliases> "q" .',
+        '_:Thing-1 <data.refs.0.name> "o" .',
+        '_:Thing-1 <data.tags> "a" .',
+        '_:Thing-1 <data.tags> "b" .',
+        # a lone scalar in a list predicate
+        '_:Thing-2 <data.tags> "c" .',
+    ]
+
+    csv_outdir = tmp_path / 'csv'
+    to_csv.run(manifest, str(csv_outdir), jobs=1, native_lists=True, timings_dir=str(tmp_path / 'timings'))
+    header = next(csv.reader(open(str(csv_outdir / 'Thing.Vertex.header.csv'))))
+    assert header == ['gid:ID', 'data.name:string', 'data.aliases:string[]', 'data.tags:string[]', 'data.refs.0.name:string']
+    rows = list(csv.reader(gzip.open(to_csv.get_output_path(str(csv_outdir), vertices), 'rt')))
+    # the delimiter is stripped from the elements
+    assert rows == [['Thing:0', 'n0', 'x\x1fyz', 'a\x1fb', ''], ['Thing:1', 'n1', 'q', 'a\x1fb', 'o'], ['Thing:2', 'n2', '', 'c', '']]
+
+
+def test_lists_are_flattened_without_the_flag(tmp_path):
+    vertices = write_json(tmp_path / 'Thing.Vertex.json.gz', [thing(0, ['x', 'y'])])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+    to_rdf.run(manifest, str(tmp_path / 'rdf'), jobs=1, timings_dir=str(tmp_path / 'timings'))
+    schema = (tmp_path / 'rdf' / 'Thing.Vertex.schema.rdf').read_text()
+    assert '<data.aliases.1>: string .' in schema and '[' not in schema
+
+
+def test_list_of_nulls_gets_no_type(tmp_path):
+    vertices = write_json(tmp_path / 'Thing.Vertex.json.gz', [thing(0, [None]), thing(1, [None, None])])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+
+    rdf_outdir = tmp_path / 'rdf'
+    to_rdf.run(manifest, str(rdf_outdir), jobs=1, native_lists=True, timings_dir=str(tmp_path / 'timings'))
+    schema = (rdf_outdir / 'Thing.Vertex.schema.rdf').read_text()
+    assert 'aliases' not in schema
+    assert '<data.tags>: [string] .' in schema
+    rdf = gzip.open(to_rdf.get_output_path(str(rdf_outdir), vertices), 'rt').read()
+    assert rdf.count('<data.tags> "a" .') == 2
+    assert 'aliases' not in rdf
+
+    csv_outdir = tmp_path / 'csv'
+    to_csv.run(manifest, str(csv_outdir), jobs=1, native_lists=True, timings_dir=str(tmp_path / 'timings'))
+    header = next(csv.reader(open(str(csv_outdir / 'Thing.Vertex.header.csv'))))
+    assert header == ['gid:ID', 'data.name:string', 'data.tags:string[]']
+    rows = list(csv.reader(gzip.open(to_csv.get_output_path(str(csv_outdir), vertices), 'rt')))
+    assert rows == [['Thing:0', 'n0', 'a\x1fb'], ['Thing:1', 'n1', 'a\x1fb']]
+
+
+def test_nulls_in_typed_list_are_left_out(tmp_path):
+    vertices = write_json(tmp_path / 'Thing.Vertex.json.gz', [thing(0, [None, 'x']), thing(1, [None])])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+    rdf_outdir = tmp_path / 'rdf'
+    to_rdf.run(manifest, str(rdf_outdir), jobs=1, native_lists=True, timings_dir=str(tmp_path / 'timings'))
+    assert '<data.aliases>: [string] .' in (rdf_outdir / 'Thing.Vertex.schema.rdf').read_text()
+    rdf = gzip.open(to_rdf.get_output_path(str(rdf_outdir), vertices), 'rt').read()
+    assert [line for line in rdf.splitlines() if 'aliases' in line] == ['_:Thing-0 <data.aliases> "x" .']
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+def test_list_of_scalars_is_kept_where_others_hold_objects(tmp_path, monkeypatch, streamed):
+    if streamed:
+        monkeypatch.setattr(core.convert, 'huge_record', 0)
+    vertices = write_json(tmp_path / 'Thing.Vertex.json.gz', [thing(0, ['x', 'y']), thing(1, [{'name': 'o'}, 'z'])])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+
+    rdf_outdir = tmp_path / 'rdf'
+    to_rdf.run(manifest, str(rdf_outdir), jobs=1, native_lists=True, timings_dir=str(tmp_path / 'timings'))
+    schema = (rdf_outdir / 'Thing.Vertex.schema.rdf').read_text()
+    assert '<data.aliases>: [string] .' in schema and '<data.aliases.0.name>: string .' in schema
+    rdf = gzip.open(to_rdf.get_output_path(str(rdf_outdir), vertices), 'rt').read()
+    assert sorted(line for line in rdf.splitlines() if 'aliases' in line) == [
+        '_:Thing-0 <data.aliases> "x" .',
+        '_:Thing-0 <data.aliases> "y" .',
+        '_:Thing-1 <data.aliases.0.name> "o" .',
+        '_:Thing-1 <data.aliases.1> "z" .',
+    ]
+
+    csv_outdir = tmp_path / 'csv'
+    to_csv.run(manifest, str(csv_outdir), jobs=1, native_lists=True, timings_dir=str(tmp_path / 'timings'))
+    header = next(csv.reader(open(str(csv_outdir / 'Thing.Vertex.header.csv'))))
+    rows = [dict(zip(header, row)) for row in csv.reader(gzip.open(to_csv.get_output_path(str(csv_outdir), vertices), 'rt'))]
+    assert [row['data.aliases:string[]'] for row in rows] == ['x\x1fy', '']
+    assert [row['data.aliases.0.name:string'] for row in rows] == ['', 'o']
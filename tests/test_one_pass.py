@@ -0,0 +1,48 @@
+import gzip
+import os
+
+from conftest import write_json, write_manifest
+from core.convert import get_json_path
+import convert
+import to_csv
+import to_rdf
+
+
+def write_graph(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [
+        {'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i), 'tags': ['a', 'b'][:i % 3], 'year': 2000 + i}} for i in range(20)
+    ])
+    # the last edge is to a vertex that isn't there
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'gid': '(Doc:{})--cites->(Doc:{})'.format(i, j), 'label': 'cites', 'from': 'Doc:{}'.format(i), 'to': 'Doc:{}'.format(j), 'data': {'n': i}}
+        for i, j in [(0, 1), (1, 2), (2, 99)]
+    ])
+    return vertices, edges, write_manifest(tmp_path / 'manifest.txt', [vertices, edges])
+
+
+def read(path):
+    with gzip.open(path, 'rt') as fh:
+        return fh.read()
+
+
+def test_one_pass_writes_what_each_converter_does(tmp_path):
+    vertices, edges, manifest = write_graph(tmp_path)
+    timings_dir = str(tmp_path / 'timings')
+    to_rdf.run(manifest, str(tmp_path / 'rdf'), jobs=1, drop_dangling=True, timings_dir=timings_dir)
+    to_csv.run(manifest, str(tmp_path / 'csv'), jobs=1, drop_dangling=True, timings_dir=timings_dir)
+    outdirs = {name: str(tmp_path / 'all' / name) for name in ['rdf', 'csv', 'json']}
+    convert.run(manifest, rdf_outdir=outdirs['rdf'], csv_outdir=outdirs['csv'], json_outdir=outdirs['json'], jobs=1, drop_dangling=True, timings_dir=timings_dir)
+
+    for path in [vertices, edges]:
+        assert read(to_rdf.get_output_path(outdirs['rdf'], path)) == read(to_rdf.get_output_path(str(tmp_path / 'rdf'), path))
+        assert read(to_csv.get_output_path(outdirs['csv'], path)) == read(to_csv.get_output_path(str(tmp_path / 'csv'), path))
+    for name in ['Doc.Vertex.schema.rdf', 'cites.Edge.schema.rdf']:
+        assert open(os.path.join(outdirs['rdf'], name)).read() == open(os.path.join(str(tmp_path / 'rdf'), name)).read()
+    for name in ['Doc.Vertex.header.csv', 'cites.Edge.header.csv']:
+        assert open(os.path.join(outdirs['csv'], name)).read() == open(os.path.join(str(tmp_path / 'csv'), name)).read()
+
+    # the json is the lines of the input, less the dangling edge
+    assert read(get_json_path(outdirs['json'], vertices)) == read(vertices)
+    assert read(get_json_path(outdirs['json'], edges)) == ''.join(read(edges).splitlines(True)[:2])
+    with open(os.path.join(outdirs['json'], 'bmeg_file_manifest.txt')) as fh:
+        assert fh.read().splitlines() == ['outputs/{}'.format(os.path.basename(get_json_path(outdirs['json'], path))) for path in [vertices, edges]]
@@ -0,0 +1,42 @@
+import gzip
+
+import pytest
+
+import core.convert
+
+
+def test_batches_are_whole_lines(tmp_path):
+    path = str(tmp_path / 'lines.json.gz')
+    lines = [('{"gid": "Doc:%d"}' % i).encode() for i in range(1000)]
+    with gzip.open(path, 'wb') as fh:
+        # the last line has no newline
+        fh.write(b'\n'.join(lines))
+    batches = list(core.convert.read_batches(path, block_size=100))
+    assert len(batches) > 1
+    assert [line for batch in batches for line in batch] == lines
+
+
+def test_prefetch_passes_on_items_and_errors():
+    def items():
+        yield 1
+        yield 2
+        raise ValueError('broken')
+
+    fetched = []
+    with pytest.raises(ValueError, match='broken'):
+        for item in core.convert.prefetch(items(), depth=1):
+            fetched.append(item)
+    assert fetched == [1, 2]
+
+    # stopping early doesn't hang on the producer
+    for item in core.convert.prefetch((i for i in range(100)), depth=1):
+        break
+
+
+def test_async_writer_keeps_the_order_of_writes(tmp_path):
+    path = str(tmp_path / 'out.rdf')
+    with core.convert.AsyncWriter(path, buffer_size=10, depth=1) as writer:
+        for i in range(1000):
+            writer.write('_:Doc-{} <label.Doc> "" .\n'.format(i))
+    with open(path) as fh:
+        assert fh.read() == ''.join('_:Doc-{} <label.Doc> "" .\n'.format(i) for i in range(1000))
@@ -0,0 +1,77 @@
+import csv
+import gzip
+
+from flatten_json import flatten
+
+from conftest import write_json, write_manifest
+import core.convert
+from core.convert import convert, Flattener, Sink
+import to_csv
+import to_rdf
+
+
+def test_projected_keys_are_those_of_flatten():
+    records = [
+        {'gid': 'Gene:1', 'label': 'Gene', 'data': {'symbol': 'A', 'synonyms': ['a', 'b'], 'xrefs': {'ensembl': 'E1', 'hgnc': 'H1'}, 'skipped': {'a': [1, {'b': 2}]}}},
+        {'gid': 'Gene:2', 'label': 'Gene', 'data': {'synonyms': ['c'], 'xrefs': {'hgnc': 'H2'}}},
+        {'gid': 'Gene:3', 'label': 'Gene', 'data': {'symbol': 'C', 'skipped': 1}},
+    ]
+    fields = ['gid', 'data.symbol', 'data.synonyms.1', 'data.xrefs.ensembl', 'data.missing']
+    flattener = Flattener(fields=fields)
+    for record in records:
+        expected = [(k, v) for k, v in flatten(record, '.').items() if k in fields]
+        assert list(flattener(record).items()) == expected
+
+
+class EveryField(Sink):
+    """ a sink reading every flattened key, so that convert projects nothing """
+
+    def write(self, line, record, numbers):
+        pass
+
+
+def doc(i, size, notes):
+    return {'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'size': size, 'notes': notes, 'skipped': {'a': [1, 2]}}}
+
+
+def convert_docs(tmp_path, docs, project=True):
+    """ the rdf and csv rows of docs, with a schema and header leaving data.skipped out, read projected or whole """
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', docs)
+    schema = tmp_path / 'Doc.Vertex.schema.rdf'
+    schema.write_text('<data.size>: int .\n<data.notes>: string .\n')
+    header = tmp_path / 'Doc.Vertex.header.csv'
+    header.write_text('gid:ID,data.size:long,data.notes:string\n')
+    rdf = str(tmp_path / 'Doc.rdf.gz')
+    rows = str(tmp_path / 'Doc.csv.gz')
+    sinks = [to_rdf.RdfSink(vertices, rdf, str(schema)), to_csv.CsvSink(vertices, rows, str(header))]
+    convert(vertices, sinks if project else sinks + [EveryField()])
+    return sorted(gzip.open(rdf, 'rt').read().splitlines()), list(csv.reader(gzip.open(rows, 'rt')))
+
+
+docs = [doc(0, 1, 'a'), doc(1, {'min': 1, 'max': 2}, {'text': 'b'}), doc(2, [1, 2], ['c', {'d': 1}])]
+
+
+def test_projection_only_prunes_fields(tmp_path):
+    expected = convert_docs(tmp_path, docs, project=False)
+    assert convert_docs(tmp_path, docs) == expected
+    assert expected[1] == [['Doc:0', '1', 'a'], ['Doc:1', '', ''], ['Doc:2', '', '']]
+
+
+def test_streamed_projection_only_prunes_fields(tmp_path, monkeypatch):
+    expected = convert_docs(tmp_path, docs, project=False)
+    monkeypatch.setattr(core.convert, 'huge_record', 0)
+    assert convert_docs(tmp_path, docs) == expected
+
+
+def test_packed_object_is_its_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.convert, 'wide_threshold', 2)
+    values = {'g{}'.format(i): i / 2 for i in range(3)}
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [{'gid': 'Doc:0', 'label': 'Doc', 'data': {'values': values, 'notes': {'text': 'b'}}}])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+    to_rdf.run(manifest, str(tmp_path / 'rdf'), jobs=1, pack_wide=True, timings_dir=str(tmp_path / 'timings'))
+    rdf = gzip.open(to_rdf.get_output_path(str(tmp_path / 'rdf'), vertices), 'rt').read()
+    assert '<data.values> "{\\"g0\\":0.0,\\"g1\\":0.5,\\"g2\\":1.0}" .' in rdf
+    assert '<data.notes.text> "b" .' in rdf
+    to_csv.run(manifest, str(tmp_path / 'csv'), jobs=1, pack_wide=True, timings_dir=str(tmp_path / 'timings'))
+    rows = list(csv.reader(gzip.open(to_csv.get_output_path(str(tmp_path / 'csv'), vertices), 'rt')))
+    assert rows == [['Doc:0', '{"g0":0.0,"g1":0.5,"g2":1.0}', 'b']]
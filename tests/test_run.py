@@ -0,0 +1,49 @@
+import gzip
+import os
+
+import pytest
+
+from conftest import write_json, write_manifest
+import to_rdf
+
+
+def write_graph(tmp_path, broken=False):
+    """ a vertex and an edge file, the edges with an unreadable record past the sample the schema is inferred from if broken """
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [
+        {'_id': 'Doc:{}'.format(i), 'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i)}} for i in range(10)
+    ])
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'_id': str(i), 'gid': str(i), 'label': 'cites', 'from': 'Doc:{}'.format(i % 10), 'to': 'Doc:{}'.format((i + 1) % 10), 'data': {}}
+        for i in range(1500)
+    ])
+    if broken:
+        with gzip.open(edges, 'at') as fh:
+            fh.write('{"gid": \n')
+    return [vertices, edges], write_manifest(tmp_path / 'manifest.txt', [vertices, edges])
+
+
+def read(path):
+    with gzip.open(path, 'rt') as fh:
+        return fh.read()
+
+
+def test_run_converts_every_file(tmp_path):
+    paths, manifest = write_graph(tmp_path)
+    outdir = str(tmp_path / 'rdf')
+    os.makedirs(outdir)
+    to_rdf.run(manifest, outdir, jobs=2, timings_dir=str(tmp_path / 'timings'))
+    for path, label in zip(paths, ['Doc.Vertex', 'cites.Edge']):
+        expected = str(tmp_path / 'expected.rdf.gz')
+        to_rdf.to_rdf(path, expected, os.path.join(outdir, '{}.schema.rdf'.format(label)))
+        assert read(to_rdf.get_output_path(outdir, path)) == read(expected)
+
+
+def test_failed_conversion_fails_the_run(tmp_path):
+    paths, manifest = write_graph(tmp_path, broken=True)
+    outdir = str(tmp_path / 'rdf')
+    os.makedirs(outdir)
+    with pytest.raises(SystemExit, match='1 of 2 conversions failed'):
+        to_rdf.run(manifest, outdir, jobs=2, timings_dir=str(tmp_path / 'timings'))
+    # no partial output is left to be taken for a finished one
+    assert os.path.isfile(to_rdf.get_output_path(outdir, paths[0]))
+    assert not os.path.exists(to_rdf.get_output_path(outdir, paths[1]))
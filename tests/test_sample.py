@@ -0,0 +1,71 @@
+import gzip
+import os
+
+import ujson
+
+from conftest import write_json, write_manifest
+from core.convert import sample_manifest
+import to_rdf
+
+
+def write_graph(tmp_path):
+    docs = write_json(tmp_path / 'Doc.Vertex.json.gz', [{'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i)}} for i in range(50)])
+    genes = write_json(tmp_path / 'Gene.Vertex.json.gz', [{'gid': 'Gene:{}'.format(i), 'label': 'Gene', 'data': {'symbol': 'G{}'.format(i)}} for i in range(30)])
+    # the last edge is to a vertex that isn't there
+    about = write_json(tmp_path / 'Doc_about_Gene.Edge.json.gz', [
+        {'gid': '(Doc:{})--about->(Gene:{})'.format(i, j), 'label': 'about', 'from': 'Doc:{}'.format(i), 'to': 'Gene:{}'.format(j), 'data': {}}
+        for i, j in [(i, i % 30) for i in range(50)] + [(0, 99)]
+    ])
+    cites = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'gid': '(Doc:{})--cites->(Doc:{})'.format(i, i + 1), 'label': 'cites', 'from': 'Doc:{}'.format(i), 'to': 'Doc:{}'.format(i + 1), 'data': {}}
+        for i in range(49)
+    ])
+    return write_manifest(tmp_path / 'manifest.txt', [docs, genes, about, cites])
+
+
+def read_sample(manifest):
+    with open(manifest) as fh:
+        paths = fh.read().splitlines()
+    return {os.path.basename(path): gzip.open(path, 'rt').read().splitlines() for path in paths}
+
+
+def test_sample_is_connected_and_seeded(tmp_path):
+    manifest = write_graph(tmp_path)
+    sampled = sample_manifest(manifest, str(tmp_path / 'a'), 5, seed=1, jobs=1)
+    sample = read_sample(sampled)
+    with open(manifest) as fh:
+        inputs = fh.read().splitlines()
+    # every file, named as split and dedupe name theirs, with lines copied as they are
+    assert sorted(sample) == sorted(path.replace('/', '.').strip('.') for path in inputs)
+    for path in inputs:
+        assert set(sample[path.replace('/', '.').strip('.')]) <= set(gzip.open(path, 'rt').read().splitlines())
+
+    vertices = {ujson.loads(line)['gid'] for name, lines in sample.items() if 'Vertex' in name for line in lines}
+    edges = [ujson.loads(line) for name, lines in sample.items() if 'Edge' in name for line in lines]
+    with open(os.path.join(str(tmp_path / 'a'), 'sample.json')) as fh:
+        stats = ujson.load(fh)
+    assert stats['seeds'] == 10 and stats['vertices'] == len(vertices) > 10 and stats['edges'] == len(edges) > 0
+    # no edge dangles
+    assert all(e['from'] in vertices and e['to'] in vertices for e in edges)
+    assert 'Gene:99' not in {e['to'] for e in edges}
+
+    # the same seed gives the same sample whatever the jobs
+    assert read_sample(sample_manifest(manifest, str(tmp_path / 'b'), 5, seed=1, jobs=2)) == sample
+    assert read_sample(sample_manifest(manifest, str(tmp_path / 'c'), 5, seed=2, jobs=1)) != sample
+
+    # and it is reused
+    mtimes = [os.path.getmtime(path) for path in open(sampled).read().splitlines()]
+    assert sample_manifest(manifest, str(tmp_path / 'a'), 5, seed=1, jobs=1) == sampled
+    assert [os.path.getmtime(path) for path in open(sampled).read().splitlines()] == mtimes
+
+
+def test_run_converts_the_sample(tmp_path):
+    manifest = write_graph(tmp_path)
+    outdir = str(tmp_path / 'rdf')
+    to_rdf.run(manifest, outdir, jobs=1, sample=5, sample_seed=1, timings_dir=str(tmp_path / 'timings'))
+    sampled = os.path.join(outdir, 'sample', 'manifest.txt')
+    expected = str(tmp_path / 'expected')
+    to_rdf.run(sampled, expected, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    for path in open(sampled).read().splitlines():
+        rdf = gzip.open(to_rdf.get_output_path(outdir, path), 'rt').read()
+        assert rdf and rdf == gzip.open(to_rdf.get_output_path(expected, path), 'rt').read()
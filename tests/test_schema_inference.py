@@ -0,0 +1,52 @@
+import os
+
+import ujson
+
+from conftest import write_json, write_manifest
+import to_rdf
+
+
+def doc(i, year):
+    return {'_id': 'Doc:{}'.format(i), 'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'year': year}}
+
+
+def read_schema(outdir):
+    with open(os.path.join(outdir, 'Doc.Vertex.schema.rdf')) as fh:
+        return fh.read().splitlines()
+
+
+def test_full_scan_widens_past_the_sample(tmp_path):
+    # the one float comes after the 1000 sampled records
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [doc(i, 2000 + i if i != 1500 else 2000.5) for i in range(2000)])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+    sampled = str(tmp_path / 'sampled')
+    scanned = str(tmp_path / 'scanned')
+    for outdir, full_scan in [(sampled, False), (scanned, True)]:
+        os.makedirs(outdir)
+        to_rdf.cmd_gen(manifest, outdir, outdir, None, full_scan=full_scan, jobs=2)
+    assert '<data.year>: int .' in read_schema(sampled)
+    assert '<data.year>: float .' in read_schema(scanned)
+
+
+def test_unchanged_files_are_read_from_the_cache(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [doc(0, 2000)])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+    outdir = str(tmp_path / 'rdf')
+    os.makedirs(outdir)
+    to_rdf.cmd_gen(manifest, outdir, outdir, None, jobs=1)
+    cache_path = to_rdf.get_cache_path(outdir, vertices)
+    with open(cache_path) as fh:
+        cached = ujson.load(fh)
+    assert cached['types']['data.year'] == {'int': 1}
+
+    # a cached file isn't read again
+    cached['types']['data.year'] = {'float': 1}
+    with open(cache_path, 'w') as fh:
+        ujson.dump(cached, fh)
+    to_rdf.cmd_gen(manifest, outdir, outdir, None, jobs=1)
+    assert '<data.year>: float .' in read_schema(outdir)
+
+    # a changed one is
+    write_json(tmp_path / 'Doc.Vertex.json.gz', [doc(0, 'unknown'), doc(1, 2001)])
+    to_rdf.cmd_gen(manifest, outdir, outdir, None, jobs=1)
+    assert '<data.year>: string .' in read_schema(outdir)
@@ -0,0 +1,73 @@
+import glob
+import gzip
+import os
+import types
+import zlib
+
+import ujson
+
+from conftest import write_json, write_manifest
+import to_rdf
+
+
+def write_graph(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [
+        {'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i), 'year': 2000 + i % 7}} for i in range(200)
+    ])
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'gid': '(Doc:{})--cites->(Doc:{})'.format(i, i + 1), 'label': 'cites', 'from': 'Doc:{}'.format(i), 'to': 'Doc:{}'.format(i + 1), 'data': {}}
+        for i in range(199)
+    ])
+    return write_manifest(tmp_path / 'manifest.txt', [vertices, edges])
+
+
+def read_lines(path):
+    with gzip.open(path, 'rt') as fh:
+        return fh.read().splitlines()
+
+
+def test_triples_go_to_their_shards_sorted(tmp_path):
+    manifest = write_graph(tmp_path)
+    plain = str(tmp_path / 'plain')
+    sharded = str(tmp_path / 'sharded')
+    to_rdf.run(manifest, plain, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    to_rdf.run(manifest, sharded, jobs=1, shards=3, timings_dir=str(tmp_path / 'timings'))
+
+    # no unsharded copy of the rdf
+    assert glob.glob(os.path.join(sharded, '*.rdf.gz')) == []
+    parts = sorted(glob.glob(os.path.join(sharded, 'shards', '*', '*.rdf.gz')))
+    expected = [line for path in glob.glob(os.path.join(plain, '*.rdf.gz')) for line in read_lines(path)]
+    assert sorted(line for part in parts for line in read_lines(part)) == sorted(expected)
+
+    with open(os.path.join(sharded, 'shards', 'assignment.json')) as fh:
+        assignment = ujson.load(fh)['assignment']
+    # the edges take most of the bytes, so they are spread, and the vertices share their size among their predicates
+    assert assignment['<cites>'] == -1
+    assert sorted(assignment[p] for p in ['<label.Doc>', '<data.title>', '<data.year>']) == [0, 1, 2]
+    for part in parts:
+        lines = read_lines(part)
+        assert lines == sorted(lines)
+        shard = int(os.path.basename(os.path.dirname(part)))
+        for line in lines:
+            subject, predicate, _ = line.split(' ', 2)
+            if assignment.get(predicate, -1) >= 0:
+                assert shard == assignment[predicate]
+            else:
+                assert shard == zlib.crc32((subject if predicate in assignment else predicate).encode('utf-8')) % 3
+
+    # unchanged inputs keep their parts
+    to_rdf.run(manifest, sharded, jobs=1, shards=3, timings_dir=str(tmp_path / 'timings'))
+    assert sorted(glob.glob(os.path.join(sharded, 'shards', '*', '*.rdf.gz'))) == parts
+
+
+def test_parts_are_written_as_memory_fills(tmp_path):
+    plan = types.SimpleNamespace(shards=2, assignment={'<a>': 0, '<b>': 1}, memory=0)
+    marker = str(tmp_path / 'Doc.shard.json')
+    writer = to_rdf.ShardWriter(marker, plan)
+    writer.write('_:z <a> "1" .\n_:y <b> "2" .\n_:x <a> "3" .\n')
+    writer.write('_:w <a> "4" .\n')
+    writer.close()
+    with open(marker) as fh:
+        parts = ujson.load(fh)['parts']
+    assert [read_lines(part) for part in parts] == [['_:x <a> "3" .', '_:z <a> "1" .'], ['_:y <b> "2" .'], ['_:w <a> "4" .']]
+    assert [os.path.basename(os.path.dirname(part)) for part in parts] == ['000', '001', '000']
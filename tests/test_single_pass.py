@@ -0,0 +1,58 @@
+import csv
+import gzip
+import os
+
+from conftest import write_json, write_manifest
+import to_csv
+import to_rdf
+
+
+def doc(i, year):
+    return {'_id': 'Doc:{}'.format(i), 'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i), 'year': year}}
+
+
+def write_docs(tmp_path):
+    """ two files of one label, the year an int in the first and a float in the second """
+    a = write_json(tmp_path / 'a.Doc.Vertex.json.gz', [doc(0, 2000), doc(1, 2001)])
+    b = write_json(tmp_path / 'b.Doc.Vertex.json.gz', [doc(2, 2002.5)])
+    return [a, b], write_manifest(tmp_path / 'manifest.txt', [a, b])
+
+
+def read_schema(path):
+    with open(path) as fh:
+        return sorted(fh.read().splitlines())
+
+
+def test_merged_schema_is_the_scanned_one(tmp_path):
+    paths, manifest = write_docs(tmp_path)
+    scanned = str(tmp_path / 'scanned')
+    single = str(tmp_path / 'single')
+    os.makedirs(scanned)
+    os.makedirs(single)
+    to_rdf.cmd_gen(manifest, scanned, scanned, None)
+    for path in paths:
+        to_rdf.to_rdf(path, to_rdf.get_output_path(single, path))
+    to_rdf.merge_schema(manifest, single)
+
+    schema = read_schema(os.path.join(single, 'Doc.Vertex.schema.rdf'))
+    assert schema == ['<data.title>: string .', '<data.year>: float .']
+    assert schema == read_schema(os.path.join(scanned, 'Doc.Vertex.schema.rdf'))
+    # the unified schema also indexes the xids that deltas find nodes by
+    assert read_schema(os.path.join(single, 'schema.rdf')) == schema + ['<xid>: string @index(exact) .']
+
+
+def test_merged_header_widens_every_file(tmp_path):
+    paths, manifest = write_docs(tmp_path)
+    outdir = str(tmp_path / 'csv')
+    os.makedirs(outdir)
+    for path in paths:
+        to_csv.to_csv(path, to_csv.get_output_path(outdir, path))
+    to_csv.merge_header(manifest, outdir)
+
+    for path in paths:
+        output = to_csv.get_output_path(outdir, path)
+        with open(to_csv.get_header_path(output)) as fh:
+            header = next(csv.reader(fh))
+        assert header == ['gid:ID', 'data.title:string', 'data.year:float']
+    with gzip.open(to_csv.get_output_path(outdir, paths[1]), 'rt') as fh:
+        assert list(csv.reader(fh)) == [['Doc:2', 't2', '2002.5']]
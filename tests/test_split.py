@@ -0,0 +1,56 @@
+import gzip
+import os
+import random
+
+from conftest import write_json, write_manifest
+import core.convert
+import to_rdf
+
+
+def write_docs(path, count):
+    """ Doc vertices of random text, that compress to about 650 bytes each """
+    rng = random.Random(0)
+    return write_json(path, [
+        {'_id': 'Doc:{}'.format(i), 'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'text': '{:01200x}'.format(rng.getrandbits(4800))}}
+        for i in range(count)
+    ])
+
+
+def read_lines(path):
+    with gzip.open(path, 'rt') as fh:
+        return fh.read().splitlines()
+
+
+def test_parts_hold_the_records_of_the_input(tmp_path):
+    vertices = write_docs(tmp_path / 'Doc.Vertex.json.gz', 500)
+    chunk_dir = str(tmp_path / 'chunks')
+    parts = core.convert.split_file((vertices, chunk_dir, 64 * 1024))
+    assert len(parts) > 1
+    assert [line for part in parts for line in read_lines(part)] == read_lines(vertices)
+    assert all(to_rdf.get_label(part) == 'Doc' and 'Vertex' in part for part in parts)
+
+    # unchanged inputs keep their parts
+    mtimes = [os.stat(part).st_mtime_ns for part in parts]
+    assert core.convert.split_file((vertices, chunk_dir, 64 * 1024)) == parts
+    assert [os.stat(part).st_mtime_ns for part in parts] == mtimes
+    # a small one is its own part
+    assert core.convert.split_file((vertices, chunk_dir, 1024 * 1024)) == [vertices]
+
+
+def test_run_converts_the_parts(tmp_path):
+    vertices = write_docs(tmp_path / 'Doc.Vertex.json.gz', 3000)
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+    whole = str(tmp_path / 'whole')
+    split = str(tmp_path / 'split')
+    os.makedirs(whole)
+    os.makedirs(split)
+    to_rdf.run(manifest, whole, jobs=2, timings_dir=str(tmp_path / 'timings'))
+    to_rdf.run(manifest, split, jobs=2, chunk_size=1, timings_dir=str(tmp_path / 'timings'))
+
+    with open(os.path.join(split, 'chunks', 'manifest.txt')) as fh:
+        parts = fh.read().split()
+    assert len(parts) > 1
+    lines = []
+    for part in parts:
+        lines.extend(read_lines(to_rdf.get_output_path(split, part)))
+    assert lines == read_lines(to_rdf.get_output_path(whole, vertices))
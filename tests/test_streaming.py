@@ -0,0 +1,101 @@
+import gzip
+import os
+import resource
+import subprocess
+import sys
+
+import pytest
+
+from conftest import repo_dir, write_json, write_manifest
+import core.convert
+import to_csv
+import to_rdf
+
+# a streamed record may not take more than this, whatever its size, see test_streamed_memory_is_bounded
+rss_bound = 256 * 1024 * 1024
+
+
+def doc(gid, sections, section_size, title=True):
+    """ a Doc vertex with sections of text, its gid last and, without title, missing the first column of the others """
+    data = {'sections': {'s{:06d}'.format(i): 'x{}'.format(i).ljust(section_size, 'y') for i in range(sections)}, 'count': sections}
+    if title:
+        data = dict({'title': gid}, **data)
+    return {'label': 'Doc', 'data': data, 'gid': gid}
+
+
+def write_docs(path, sections, section_size):
+    records = [doc('Doc:{}'.format(i), 3, 16) for i in range(3)]
+    records.insert(1, doc('Doc:huge', sections, section_size, title=False))
+    # few and long lines compress fast enough at level 1
+    with gzip.open(str(path), 'wt', compresslevel=1) as fh:
+        for record in records:
+            fh.write(core.convert.ujson.dumps(record))
+            fh.write('\n')
+    return str(path)
+
+
+def read_gz(path):
+    with gzip.open(path, 'rt', newline='') as fh:
+        return fh.read()
+
+
+def test_streamed_output_matches(tmp_path, monkeypatch):
+    vertices = write_docs(tmp_path / 'Doc.Vertex.json.gz', 2000, 1000)
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+    rdf_outdir = str(tmp_path / 'rdf')
+    csv_outdir = str(tmp_path / 'csv')
+    to_rdf.run(manifest, rdf_outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    to_csv.run(manifest, csv_outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    schema = os.path.join(rdf_outdir, 'Doc.Vertex.schema.rdf')
+    header = os.path.join(csv_outdir, 'Doc.Vertex.header.csv')
+    expected_rdf = read_gz(to_rdf.get_output_path(rdf_outdir, vertices))
+    expected_csv = read_gz(to_csv.get_output_path(csv_outdir, vertices))
+    to_rdf.to_rdf(vertices, str(tmp_path / 'single.rdf.gz'))
+    to_csv.to_csv(vertices, str(tmp_path / 'single.csv.gz'))
+    expected_single_rdf = read_gz(str(tmp_path / 'single.rdf.gz'))
+    expected_single_csv = read_gz(str(tmp_path / 'single.csv.gz'))
+
+    # the 2MB record is now streamed, and its cells and triples held in a temporary file past 64KB
+    monkeypatch.setattr(core.convert, 'huge_record', 1024 * 1024)
+    monkeypatch.setattr(core.convert, 'held_size', 64 * 1024)
+    streamed = {}
+    for name, convert, kwargs in [
+        ('schema.rdf.gz', to_rdf.to_rdf, {'schema': schema}),
+        ('single.rdf.gz', to_rdf.to_rdf, {}),
+        ('header.csv.gz', to_csv.to_csv, {'header': header}),
+        ('single.csv.gz', to_csv.to_csv, {}),
+    ]:
+        output = str(tmp_path / 'streamed' / name)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        convert(vertices, output, **kwargs)
+        streamed[name] = read_gz(output)
+
+    # the triples of a streamed vertex come in record order
+    assert sorted(streamed['schema.rdf.gz'].splitlines()) == sorted(expected_rdf.splitlines())
+    assert sorted(streamed['single.rdf.gz'].splitlines()) == sorted(expected_single_rdf.splitlines())
+    assert streamed['header.csv.gz'] == expected_csv
+    assert streamed['single.csv.gz'] == expected_single_csv
+    assert expected_csv.count('\r\n') == 4
+
+
+def peak_rss(args, cwd):
+    """ peak RSS in bytes of a command and the processes it waited for """
+    driver = 'import resource, subprocess, sys; subprocess.run(sys.argv[1:], check=True); print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)'
+    p = subprocess.run([sys.executable, '-c', driver] + args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    return int(p.stdout.decode().split()[-1]) * 1024
+
+
+@pytest.mark.skipif(resource.getrlimit(resource.RLIMIT_FSIZE)[0] not in (resource.RLIM_INFINITY, -1), reason='writes a 300MB temporary file')
+def test_streamed_memory_is_bounded(tmp_path):
+    # a 300MB vertex, 4800 sections of 64KB each; parsed whole it takes over 1GB
+    vertices = write_docs(tmp_path / 'Doc.Vertex.json.gz', 4800, 64 * 1024)
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices])
+    for args in [
+        [os.path.join(repo_dir, 'dgraph', 'to_rdf.py'), 'run', '--manifest', manifest, '--rdf-outdir', 'rdf', '--jobs', '1'],
+        [os.path.join(repo_dir, 'neo4j', 'to_csv.py'), 'run', '--manifest', manifest, '--csv-outdir', 'csv', '--jobs', '1'],
+        [os.path.join(repo_dir, 'neo4j', 'to_csv.py'), 'run', '--manifest', manifest, '--csv-outdir', 'csv-single', '--jobs', '1', '--single-pass'],
+    ]:
+        rss = peak_rss([sys.executable] + args, str(tmp_path))
+        assert rss < rss_bound, '{} took {} MB'.format(' '.join(args[:2]), rss >> 20)
+    rdf = read_gz(to_rdf.get_output_path(str(tmp_path / 'rdf'), vertices))
+    assert rdf.count('_:Doc-huge <data.sections.') == 4800
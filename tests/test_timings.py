@@ -0,0 +1,49 @@
+import glob
+import logging
+import os
+
+import ujson
+
+from conftest import write_json, write_manifest
+import core.convert
+import to_csv
+import to_rdf
+
+
+def write_graph(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [{'gid': 'Doc:{}'.format(i), 'label': 'Doc', 'data': {'title': 't{}'.format(i)}} for i in range(50)])
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'gid': '(Doc:{})--cites->(Doc:{})'.format(i, i + 1), 'label': 'cites', 'from': 'Doc:{}'.format(i), 'to': 'Doc:{}'.format(i + 1), 'data': {}}
+        for i in range(49)
+    ])
+    return vertices, edges, write_manifest(tmp_path / 'manifest.txt', [vertices, edges])
+
+
+def test_timings_report_every_file(tmp_path):
+    vertices, edges, manifest = write_graph(tmp_path)
+    for name, module in [('to_rdf', to_rdf), ('to_csv', to_csv)]:
+        timings_dir = str(tmp_path / 'timings' / name)
+        module.run(manifest, str(tmp_path / name), jobs=1, timings_dir=timings_dir, profile=True)
+        reports = glob.glob(os.path.join(timings_dir, '{}_*.json'.format(name)))
+        assert len(reports) == 1
+        with open(reports[0]) as fh:
+            timings = ujson.load(fh)
+        assert sorted(report['input'] for report in timings['files']) == sorted([vertices, edges])
+        assert sorted(report['records'] for report in timings['files']) == [49, 50]
+        assert timings['total']['records'] == 99 and timings['total']['files'] == 2
+        assert timings['total']['input_bytes'] == os.path.getsize(vertices) + os.path.getsize(edges)
+        assert sorted(timings['total']['stages']) == sorted(core.convert.Timer.stages)
+        assert timings['total']['peak_rss_mb'] > 0
+        # and a collapsed stack file per output
+        assert len([f for f in os.listdir(timings_dir) if f.endswith('.stacks')]) == 2
+
+
+def test_progress_is_logged(tmp_path, monkeypatch, caplog):
+    vertices, _, _ = write_graph(tmp_path)
+    monkeypatch.setattr(core.convert, 'progress_interval', 0)
+    timer = core.convert.Timer(vertices)
+    timer.read = timer.size
+    with caplog.at_level(logging.INFO):
+        timer.tick(50)
+    assert '{}: 100.0% of '.format(vertices) in caplog.text
+    assert 'eta ' in caplog.text
@@ -0,0 +1,127 @@
+import csv
+import gzip
+import os
+
+import pytest
+import ujson
+
+from conftest import write_json, write_manifest
+import core.convert
+from core.convert import build_vertex_index, gid_check, gid_hash, hash_gids, read_hashes, VertexIndex
+import to_csv
+import to_rdf
+
+
+def doc(gid, title):
+    return {'gid': gid, 'label': 'Doc', 'data': {'title': title}}
+
+
+def test_dangling_edges_are_dropped(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [doc('Doc:{}'.format(i), 't') for i in range(3)])
+    # the last edge is to a vertex that isn't there
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'gid': '(Doc:{})--cites->(Doc:{})'.format(i, j), 'label': 'cites', 'from': 'Doc:{}'.format(i), 'to': 'Doc:{}'.format(j), 'data': {}}
+        for i, j in [(0, 1), (1, 2), (2, 9)]
+    ])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices, edges])
+    for module, outdir in [(to_rdf, str(tmp_path / 'rdf')), (to_csv, str(tmp_path / 'csv'))]:
+        module.run(manifest, outdir, jobs=1, drop_dangling=True, timings_dir=str(tmp_path / 'timings'))
+        kept = gzip.open(module.get_output_path(outdir, edges), 'rt').read().splitlines()
+        assert len(kept) == 2 and not any('Doc-9' in line or 'Doc:9' in line for line in kept)
+        with open(os.path.join(outdir, 'dropped_edges.json')) as fh:
+            assert ujson.load(fh) == {'cites': 1}
+
+    # without the index every edge is kept
+    outdir = str(tmp_path / 'all')
+    to_rdf.run(manifest, outdir, jobs=1, timings_dir=str(tmp_path / 'timings'))
+    assert len(gzip.open(to_rdf.get_output_path(outdir, edges), 'rt').read().splitlines()) == 3
+
+
+def test_integer_ids_are_dense_and_shared(tmp_path):
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [doc('Doc:a/{}'.format(i), 't') for i in range(3)])
+    edges = write_json(tmp_path / 'Doc_cites_Doc.Edge.json.gz', [
+        {'gid': '(Doc:a/2)--cites->(Doc:a/0)', 'label': 'cites', 'from': 'Doc:a/2', 'to': 'Doc:a/0', 'data': {}},
+        {'gid': '(Doc:a/2)--cites->(Doc:9)', 'label': 'cites', 'from': 'Doc:a/2', 'to': 'Doc:9', 'data': {}},
+    ])
+    manifest = write_manifest(tmp_path / 'manifest.txt', [vertices, edges])
+    rdf_outdir = str(tmp_path / 'rdf')
+    csv_outdir = str(tmp_path / 'csv')
+    to_rdf.run(manifest, rdf_outdir, jobs=1, integer_ids=True, timings_dir=str(tmp_path / 'timings'))
+    to_csv.run(manifest, csv_outdir, jobs=1, integer_ids=True, timings_dir=str(tmp_path / 'timings'))
+
+    # the gid is kept verbatim in <xid>
+    triples = [line.split(' ', 2) for line in gzip.open(to_rdf.get_output_path(rdf_outdir, vertices), 'rt').read().splitlines()]
+    uids = {value[1:-3]: int(node[1:-1], 16) for node, predicate, value in triples if predicate == '<xid>'}
+    assert sorted(uids) == ['Doc:a/0', 'Doc:a/1', 'Doc:a/2'] and sorted(uids.values()) == [1, 2, 3]
+    # the dangling edge has no id to be written with
+    assert gzip.open(to_rdf.get_output_path(rdf_outdir, edges), 'rt').read() == '<{:#x}> <cites> <{:#x}> .\n'.format(uids['Doc:a/2'], uids['Doc:a/0'])
+
+    assert next(csv.reader(open(os.path.join(csv_outdir, 'Doc.Vertex.header.csv')))) == [':ID', 'gid:string', 'data.title:string']
+    rows = csv.reader(gzip.open(to_csv.get_output_path(csv_outdir, vertices), 'rt'))
+    assert {gid: int(uid) for uid, gid, _ in rows} == uids
+    rows = list(csv.reader(gzip.open(to_csv.get_output_path(csv_outdir, edges), 'rt')))
+    assert rows == [['cites', str(uids['Doc:a/2']), str(uids['Doc:a/0'])]]
+
+
+def test_repeated_gids_are_kept_once(tmp_path):
+    a = write_json(tmp_path / 'a.Doc.Vertex.json.gz', [doc('Doc:1', 'a'), doc('Doc:2', 'b')])
+    b = write_json(tmp_path / 'b.Doc.Vertex.json.gz', [doc('Doc:2', 'b'), doc('Doc:3', 'c')])
+    index = VertexIndex(build_vertex_index([a, b], str(tmp_path / 'index.bin'), jobs=1))
+    assert len(index) == 3
+    assert sorted(index.uid(gid) for gid in ['Doc:1', 'Doc:2', 'Doc:3']) == [1, 2, 3]
+    assert 'Doc:4' not in index
+
+
+@pytest.mark.parametrize('sort_with_numpy', [True, False])
+def test_runs_fit_the_memory_of_a_worker(tmp_path, monkeypatch, sort_with_numpy):
+    if sort_with_numpy and core.convert.numpy is None:
+        pytest.skip('numpy is not installed')
+    if not sort_with_numpy:
+        monkeypatch.setattr(core.convert, 'numpy', None)
+    gids = ['Doc:{}'.format(i) for i in range(1000)]
+    vertices = write_json(tmp_path / 'Doc.Vertex.json.gz', [doc(gid, 't') for gid in gids])
+    runs = hash_gids((vertices, str(tmp_path), 100))
+    assert len(runs) == 10
+    pairs = [pair for run in runs for pair in read_hashes(run)]
+    assert sorted(pairs) == sorted((gid_hash(gid), gid_check(gid)) for gid in gids)
+    assert all(list(read_hashes(run)) == sorted(read_hashes(run)) for run in runs)
+
+    expected = open(build_vertex_index([vertices], str(tmp_path / 'expected.bin'), jobs=1), 'rb').read()
+    # a run of 100 hashes in a MB
+    monkeypatch.setattr(core.convert, 'hash_size', 1024 * 1024 // 100)
+    assert open(build_vertex_index([vertices], str(tmp_path / 'index.bin'), jobs=1, memory=1), 'rb').read() == expected
+
+
+def test_hash_collision_is_reported(tmp_path, monkeypatch):
+    gid_hash = core.convert.gid_hash
+    # the workers are forked, so they hash with this too
+    monkeypatch.setattr(core.convert, 'gid_hash', lambda gid: 42 if gid in ('Doc:1', 'Doc:3') else gid_hash(gid))
+    a = write_json(tmp_path / 'a.Doc.Vertex.json.gz', [doc('Doc:1', 'a'), doc('Doc:2', 'b')])
+    b = write_json(tmp_path / 'b.Doc.Vertex.json.gz', [doc('Doc:3', 'c')])
+    with pytest.raises(ValueError, match='Doc:1, Doc:3'):
+        build_vertex_index([a, b], str(tmp_path / 'index.bin'), jobs=1)
+
+
+def test_integer_id_delta_finds_nodes_by_gid(tmp_path):
+    old = [doc('Doc:a/1', 'a'), doc('Doc:a/2', 'b')]
+    new = [doc('Doc:a/2', 'B'), doc('Doc:a/3', 'c')]
+    edges = [{'gid': '(Doc:a/3)--refers_to->(Doc:a/2)', 'label': 'refers_to', 'from': 'Doc:a/3', 'to': 'Doc:a/2', 'data': {}}]
+    os.makedirs(str(tmp_path / 'old'))
+    os.makedirs(str(tmp_path / 'new'))
+    old_manifest = write_manifest(tmp_path / 'old.txt', [write_json(tmp_path / 'old' / 'Doc.Vertex.json.gz', old)])
+    new_manifest = write_manifest(tmp_path / 'new.txt', [write_json(tmp_path / 'new' / 'Doc.Vertex.json.gz', new),
+                                                         write_json(tmp_path / 'new' / 'Doc_refers_to_Doc.Edge.json.gz', edges)])
+    outdir = tmp_path / 'delta'
+    to_rdf.diff(old_manifest, new_manifest, str(outdir), batch_size=10, integer_ids=True)
+    # the gid as <xid> keeps it, not the name of a blank node
+    deletes = (outdir / 'dgraph' / 'delete' / '00000.rdf').read_text()
+    assert 'eq(xid, "Doc:a/1")' in deletes
+    # the edge waits for the vertices, in a block of its own
+    assert sorted(os.listdir(str(outdir / 'dgraph' / 'upsert'))) == ['00000.rdf', '00001.rdf']
+    vertices = (outdir / 'dgraph' / 'upsert' / '00000.rdf').read_text()
+    assert 'eq(xid, "Doc:a/3")' in vertices and 'eq(xid, "Doc:a/2")' in vertices
+    assert 'set {' in vertices and '<data.title> "B" .' in vertices
+    edge = (outdir / 'dgraph' / 'upsert' / '00001.rdf').read_text()
+    assert '<refers_to> uid(t' in edge
+    load = (outdir / 'load_delta.sh').read_text()
+    assert 'dgraph live' not in load and load.count('curl') == 3
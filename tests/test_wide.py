@@ -0,0 +1,65 @@
+import csv
+import gzip
+import os
+
+import pytest
+
+from conftest import write_json, write_manifest
+import core.convert
+import to_csv
+import to_rdf
+
+
+@pytest.fixture
+def wide_threshold(monkeypatch):
+    # the workers are forked, so they see it too
+    monkeypatch.setattr(core.convert, 'wide_threshold', 2)
+
+
+def expression(i, values):
+    return {'gid': 'Expression:{}'.format(i), 'label': 'Expression', 'data': {'name': 'e{}'.format(i), 'values': values}}
+
+
+def write_expressions(tmp_path):
+    values = {'g{}'.format(i): i / 3 for i in range(5)}
+    records = [expression(i, dict((k, v * i) for k, v in values.items())) for i in range(3)]
+    # a key missing, and keys out of order, take the generic path
+    records.append(expression(3, {k: v for k, v in values.items() if k != 'g2'}))
+    records.append(expression(4, dict(reversed(list(values.items())))))
+    vertices = write_json(tmp_path / 'Expression.Vertex.json.gz', records)
+    return vertices, write_manifest(tmp_path / 'manifest.txt', [vertices])
+
+
+def read(path):
+    with gzip.open(path, 'rt', newline='') as fh:
+        return fh.read()
+
+
+def test_wide_output_is_that_of_the_generic_path(tmp_path, monkeypatch, wide_threshold):
+    vertices, manifest = write_expressions(tmp_path)
+    outputs = {}
+    for path in ['wide', 'generic']:
+        if path == 'generic':
+            for module in [to_rdf, to_csv]:
+                monkeypatch.setattr(module, 'wide_numbers', False)
+        to_rdf.run(manifest, str(tmp_path / path / 'rdf'), jobs=1, timings_dir=str(tmp_path / 'timings'))
+        to_csv.run(manifest, str(tmp_path / path / 'csv'), jobs=1, timings_dir=str(tmp_path / 'timings'))
+        outputs[path] = (read(to_rdf.get_output_path(str(tmp_path / path / 'rdf'), vertices)),
+                         read(to_csv.get_output_path(str(tmp_path / path / 'csv'), vertices)))
+    fieldnames, types = to_rdf.read_schema(str(tmp_path / 'wide' / 'rdf' / 'Expression.Vertex.schema.rdf'))
+    assert to_rdf.find_wide(fieldnames, types, {'float': float, 'int': int})[0] == 'data.values'
+    assert outputs['wide'] == outputs['generic']
+    assert outputs['wide'][0].count('<data.values.g1> "0.3333333333333333" .') == 3
+
+
+def test_packed_object_is_its_json(tmp_path, wide_threshold):
+    vertices, manifest = write_expressions(tmp_path)
+    rdf_outdir = str(tmp_path / 'rdf')
+    to_rdf.run(manifest, rdf_outdir, jobs=1, pack_wide=True, timings_dir=str(tmp_path / 'timings'))
+    assert '<data.values>: string .' in open(os.path.join(rdf_outdir, 'Expression.Vertex.schema.rdf')).read()
+    rdf = read(to_rdf.get_output_path(rdf_outdir, vertices))
+    assert '_:Expression-2 <data.values> "{\\"g0\\":0.0,\\"g1\\":0.6666666666666666,\\"g2\\":1.3333333333333333,\\"g3\\":2.0,\\"g4\\":2.6666666666666665}" .' in rdf
+    csv_outdir = str(tmp_path / 'csv')
+    to_csv.run(manifest, csv_outdir, jobs=1, pack_wide=True, timings_dir=str(tmp_path / 'timings'))
+    rows = list(csv.reader(gzip.open(to_csv.get_output_path(csv_outdir, vertices), 'rt')))
+    assert rows[2] == ['Expression:2', 'e2', '{"g0":0.0,"g1":0.6666666666666666,"g2":1.3333333333333333,"g3":2.0,"g4":2.6666666666666665}']
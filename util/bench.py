@@ -0,0 +1,505 @@
+import argparse
+import datetime
+import gzip
+import importlib.util
+import inspect
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import ujson
+
+from flatten_json import flatten
+
+# the converters benchmarked, see load_converters
+to_rdf = None
+to_csv = None
+
+
+words = ['gene', 'protein', 'cell', 'tumor', 'sample', 'assay', 'expression', 'kinase', 'receptor', 'pathway',
+         'binding', 'mutation', 'variant', 'domain', 'signal', 'response', 'growth', 'factor', 'complex', 'region']
+chromosomes = ['chr{}'.format(c) for c in list(range(1, 23)) + ['X', 'Y']]
+
+
+def text(rnd, n):
+    """ n words, with the commas, quotes and newlines real descriptions have """
+    out = [rnd.choice(words) for _ in range(n)]
+    for i in range(0, n, 7):
+        out[i] += rnd.choice([',', '.', '', '"', ';', '\n'])
+    return ' '.join(out)
+
+
+def gene_ids(scale):
+    return ['ENSG{:011d}'.format(i) for i in range(2000 * scale)]
+
+
+def genes(rnd, scale):
+    for i, gene_id in enumerate(gene_ids(scale)):
+        start = rnd.randrange(1, 200000000)
+        yield {
+            '_id': str(i),
+            'gid': 'Gene:{}'.format(gene_id),
+            'label': 'Gene',
+            'data': {
+                'gene_id': gene_id,
+                'symbol': 'G{}'.format(i),
+                'description': text(rnd, rnd.randrange(5, 40)),
+                'chromosome': rnd.choice(chromosomes),
+                'start': start,
+                'end': start + rnd.randrange(100, 100000),
+                'strand': rnd.choice('+-'),
+                'genome': 'GRCh37',
+                'project_id': 'Reference',
+                'submitter_id': gene_id,
+            },
+        }
+
+
+def transcripts(rnd, scale):
+    ids = gene_ids(scale)
+    for i in range(5000 * scale):
+        start = rnd.randrange(1, 200000000)
+        yield {
+            '_id': str(i),
+            'gid': 'Transcript:ENST{:011d}'.format(i),
+            'label': 'Transcript',
+            'data': {
+                'transcript_id': 'ENST{:011d}'.format(i),
+                'gene_id': ids[i % len(ids)],
+                'biotype': rnd.choice(['protein_coding', 'lincRNA', 'miRNA', 'pseudogene']),
+                'chromosome': rnd.choice(chromosomes),
+                'start': start,
+                'end': start + rnd.randrange(100, 10000),
+                'strand': rnd.choice('+-'),
+                'genome': 'GRCh37',
+                'project_id': 'Reference',
+            },
+        }
+
+
+def publications(rnd, scale):
+    """ nested documents, with lists of objects and strings """
+    for i in range(1000 * scale):
+        yield {
+            '_id': str(i),
+            'gid': 'Publication:ncbi.nlm.nih.gov/pubmed/{}'.format(i),
+            'label': 'Publication',
+            'data': {
+                'url': 'ncbi.nlm.nih.gov/pubmed/{}'.format(i),
+                'title': text(rnd, rnd.randrange(5, 20)),
+                'abstract': text(rnd, rnd.randrange(100, 400)),
+                'authors': ['{} {}'.format(rnd.choice(words).title(), rnd.choice(words).title()) for _ in range(rnd.randrange(1, 12))],
+                'citation': {
+                    'journal': rnd.choice(['Nature', 'Cell', 'Science', 'Cancer Res']),
+                    'year': rnd.randrange(1990, 2020),
+                    'volume': rnd.randrange(1, 500),
+                    'pages': {'first': rnd.randrange(1, 1000), 'last': rnd.randrange(1000, 2000)},
+                },
+                'keywords': [rnd.choice(words) for _ in range(rnd.randrange(0, 8))],
+                'project_id': 'Reference',
+            },
+        }
+
+
+def expressions(rnd, scale):
+    """ wide rows, a value for every gene """
+    ids = gene_ids(scale)
+    for i in range(20 * scale):
+        yield {
+            '_id': str(i),
+            'gid': 'GeneExpression:Aliquot:{}'.format(i),
+            'label': 'GeneExpression',
+            'data': {
+                'id': 'Aliquot:{}'.format(i),
+                'project_id': 'Project:TCGA-BRCA',
+                'metric': 'TPM',
+                'method': 'Illumina HiSeq',
+                'values': {gene_id: rnd.random() * 1000 for gene_id in ids},
+            },
+        }
+
+
+def copy_numbers(rnd, scale):
+    """ wide rows of small ints """
+    ids = gene_ids(scale)
+    for i in range(20 * scale):
+        yield {
+            '_id': str(i),
+            'gid': 'CopyNumberAlteration:Aliquot:{}'.format(i),
+            'label': 'CopyNumberAlteration',
+            'data': {
+                'id': 'Aliquot:{}'.format(i),
+                'project_id': 'Project:TCGA-BRCA',
+                'method': 'Gistic2',
+                'values': {gene_id: rnd.randrange(-2, 3) for gene_id in ids},
+            },
+        }
+
+
+def edges(rnd, scale, label, from_label, from_ids, to_label, to_ids, n):
+    """ n edges, the largest files of a release """
+    for i in range(n):
+        src = '{}:{}'.format(from_label, from_ids[i % len(from_ids)])
+        dst = '{}:{}'.format(to_label, to_ids[rnd.randrange(len(to_ids))])
+        yield {
+            '_id': str(i),
+            'gid': '({})--{}->({})'.format(src, label, dst),
+            'label': label,
+            'from': src,
+            'to': dst,
+            'data': {},
+        }
+
+
+def datasets(scale):
+    """ [(file name, records(rnd))], vertices first """
+    ids = gene_ids(scale)
+    transcript_ids = ['ENST{:011d}'.format(i) for i in range(5000 * scale)]
+    return [
+        ('Gene.Vertex.json.gz', lambda rnd: genes(rnd, scale)),
+        ('Transcript.Vertex.json.gz', lambda rnd: transcripts(rnd, scale)),
+        ('Publication.Vertex.json.gz', lambda rnd: publications(rnd, scale)),
+        ('GeneExpression.Vertex.json.gz', lambda rnd: expressions(rnd, scale)),
+        ('CopyNumberAlteration.Vertex.json.gz', lambda rnd: copy_numbers(rnd, scale)),
+        ('Transcript_Gene_Gene.Edge.json.gz', lambda rnd: edges(rnd, scale, 'gene', 'Transcript', transcript_ids, 'Gene', ids, 5000 * scale)),
+        ('Gene_Publications_Publication.Edge.json.gz', lambda rnd: edges(rnd, scale, 'publications', 'Gene', ids, 'Publication', ['ncbi.nlm.nih.gov/pubmed/{}'.format(i) for i in range(1000 * scale)], 20000 * scale)),
+    ]
+
+
+def get_dataset_path(data_dir):
+    return os.path.join(data_dir, 'dataset.json')
+
+
+def generate(outdir, scale=5, seed=0):
+    """ write the synthetic files of scale, their manifest and dataset.json with their sizes
+
+    every file gets its own random.Random(seed), so a file only changes
+    when its generator does
+    """
+    os.makedirs(outdir, exist_ok=True)
+    files = []
+    for name, records in datasets(scale):
+        path = os.path.join(outdir, name)
+        n, size = 0, 0
+        # fixed mtime, so the same data is the same bytes
+        with gzip.GzipFile(path, 'wb', compresslevel=1, mtime=0) as fh:
+            for record in records(random.Random('{}.{}'.format(seed, name))):
+                line = ujson.dumps(record, escape_forward_slashes=False).encode('utf-8') + b'\n'
+                fh.write(line)
+                n += 1
+                size += len(line)
+        files.append({'path': path, 'records': n, 'bytes': size})
+        logging.info('wrote {} records, {:.1f} MB to {}'.format(n, size / 1e6, path))
+    manifest = os.path.join(outdir, 'bmeg_file_manifest.txt')
+    with open(manifest, 'w') as fh:
+        for f in files:
+            fh.write(f['path'] + '\n')
+    with open(get_dataset_path(outdir), 'w') as fh:
+        ujson.dump({'scale': scale, 'seed': seed, 'manifest': manifest, 'files': files}, fh, indent=2, escape_forward_slashes=False)
+    logging.info('wrote {}'.format(manifest))
+    return manifest
+
+
+def load_converters(repo_dir):
+    """ import dgraph/to_rdf.py and neo4j/to_csv.py of repo_dir, e.g. a git worktree of an older commit """
+    global to_rdf, to_csv
+    modules = []
+    for name, path in [('to_rdf', 'dgraph/to_rdf.py'), ('to_csv', 'neo4j/to_csv.py')]:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(repo_dir, path))
+        module = importlib.util.module_from_spec(spec)
+        # the pools of the converters pickle their functions by module name
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        modules.append(module)
+    to_rdf, to_csv = modules
+
+
+def call(func, *args, **kwargs):
+    """ func(*args, **kwargs) without the keywords an older version of func doesn't take """
+    params = inspect.signature(func).parameters
+    return func(*args, **{k: v for k, v in kwargs.items() if k in params})
+
+
+def read_lines(path):
+    """ the raw lines of path, read the same way whatever the version of the converters """
+    with gzip.open(path, 'rb') as fh:
+        for line in fh:
+            yield line
+
+
+def stage_parse(dataset, workdir, jobs):
+    for f in dataset['files']:
+        for line in read_lines(f['path']):
+            ujson.loads(line)
+    return dataset['files']
+
+
+def stage_flatten(dataset, workdir, jobs):
+    """ flatten_json, as the converters did before the Flattener """
+    files = [f for f in dataset['files'] if 'Vertex' in f['path']]
+    for f in files:
+        for line in read_lines(f['path']):
+            flatten(ujson.loads(line), '.')
+    return files
+
+
+def stage_to_vertex(dataset, workdir, jobs):
+    """ reading, parsing and flattening as the converters do, without writing """
+    files = [f for f in dataset['files'] if 'Vertex' in f['path']]
+    for f in files:
+        for _ in to_rdf.values(f['path']):
+            pass
+    return files
+
+
+def stage_infer_schema(dataset, workdir, jobs):
+    outdir = os.path.join(workdir, 'dgraph')
+    call(to_rdf.infer_schema, to_rdf.read_manifest(dataset['manifest']), outdir, full_scan=True, jobs=jobs)
+    return dataset['files']
+
+
+def stage_infer_headers(dataset, workdir, jobs):
+    outdir = os.path.join(workdir, 'neo4j')
+    call(to_csv.infer_headers, to_csv.read_manifest(dataset['manifest']), outdir, full_scan=True, jobs=jobs)
+    return dataset['files']
+
+
+def get_schema_path(outdir, path, suffix):
+    label = '{}.{}'.format(to_rdf.get_label(path), 'Vertex' if 'Vertex' in path else 'Edge')
+    return os.path.join(outdir, '{}.{}'.format(label, suffix))
+
+
+def stage_to_rdf(dataset, workdir, jobs):
+    """ every file on this process, with the schemas of infer_schema """
+    outdir = os.path.join(workdir, 'dgraph')
+    for f in dataset['files']:
+        to_rdf.to_rdf(f['path'], to_rdf.get_output_path(outdir, f['path']), get_schema_path(outdir, f['path'], 'schema.rdf'))
+    return dataset['files']
+
+
+def stage_to_csv(dataset, workdir, jobs):
+    """ every file on this process, with the headers of infer_headers """
+    outdir = os.path.join(workdir, 'neo4j')
+    for f in dataset['files']:
+        to_csv.to_csv(f['path'], to_csv.get_output_path(outdir, f['path']), get_schema_path(outdir, f['path'], 'header.csv'))
+    return dataset['files']
+
+
+def stage_cmd_gen_dgraph(dataset, workdir, jobs):
+    outdir = os.path.join(workdir, 'cmd_gen_dgraph')
+    os.makedirs(outdir, exist_ok=True)
+    call(to_rdf.cmd_gen, dataset['manifest'], outdir, outdir, None, jobs=jobs)
+    return dataset['files']
+
+
+def stage_cmd_gen_neo4j(dataset, workdir, jobs):
+    outdir = os.path.join(workdir, 'cmd_gen_neo4j')
+    os.makedirs(outdir, exist_ok=True)
+    call(to_csv.cmd_gen, dataset['manifest'], 'bench.db', outdir, outdir, None, jobs=jobs)
+    return dataset['files']
+
+
+def stage_run_dgraph(dataset, workdir, jobs):
+    """ schema and conversion end to end, as load_db.sh runs them """
+    call(to_rdf.run, dataset['manifest'], os.path.join(workdir, 'run_dgraph'), jobs=jobs, timings_dir=os.path.join(workdir, 'run_dgraph'))
+    return dataset['files']
+
+
+def stage_run_neo4j(dataset, workdir, jobs):
+    call(to_csv.run, dataset['manifest'], os.path.join(workdir, 'run_neo4j'), jobs=jobs, timings_dir=os.path.join(workdir, 'run_neo4j'))
+    return dataset['files']
+
+
+# in the order they run; to_rdf and to_csv read what infer_schema and infer_headers wrote
+stages = [
+    ('parse', stage_parse),
+    ('flatten', stage_flatten),
+    ('to_vertex', stage_to_vertex),
+    ('infer_schema', stage_infer_schema),
+    ('infer_headers', stage_infer_headers),
+    ('to_rdf', stage_to_rdf),
+    ('to_csv', stage_to_csv),
+    ('cmd_gen_dgraph', stage_cmd_gen_dgraph),
+    ('cmd_gen_neo4j', stage_cmd_gen_neo4j),
+    ('run_dgraph', stage_run_dgraph),
+    ('run_neo4j', stage_run_neo4j),
+]
+
+
+def peak_rss():
+    """ peak resident set size in MB of this process and the children it waited for """
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+def stage_job(conn, stage, dataset, workdir, jobs):
+    """ run stage in a process of its own, so its peak RSS is its own, and send back (seconds, files, peak rss) or an error """
+    # only the timings are logged
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        start = time.perf_counter()
+        files = stage(dataset, workdir, jobs)
+        conn.send((time.perf_counter() - start, files, peak_rss(), None))
+    except BaseException as e:
+        conn.send((None, None, None, repr(e)))
+    finally:
+        conn.close()
+
+
+def run_stage(name, stage, dataset, workdir, jobs):
+    """ the timings of a stage, or {'error': ...} if it failed, e.g. as older converters don't have it """
+    parent, child = multiprocessing.Pipe(duplex=False)
+    # not a pool: the stages start pools of their own
+    p = multiprocessing.Process(target=stage_job, args=(child, stage, dataset, workdir, jobs))
+    p.start()
+    child.close()
+    seconds, files, rss, error = parent.recv()
+    p.join()
+    if error:
+        return {'error': error}
+    records = sum(f['records'] for f in files)
+    size = sum(f['bytes'] for f in files)
+    return {
+        'seconds': round(seconds, 4),
+        'records': records,
+        'bytes': size,
+        'records_per_sec': round(records / seconds, 1),
+        'mb_per_sec': round(size / 1e6 / seconds, 3),
+        'peak_rss_mb': round(rss, 1),
+    }
+
+
+def git_commit(repo_dir):
+    """ (commit, dirty) of repo_dir, or (None, None) outside a git checkout """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir, stderr=subprocess.DEVNULL).decode().strip() != ''
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run(data_dir, results=None, workdir=None, only=None, jobs=1, repeat=1, repo_dir=None):
+    """ time each stage on the data generate wrote to data_dir, write the results json and return its path
+
+    each stage runs repeat times in a fresh process on a fresh workdir and
+    keeps its fastest run; jobs defaults to 1 so numbers don't depend on
+    the core count; repo_dir is the checkout whose converters are timed,
+    by default this one
+    """
+    repo_dir = os.path.abspath(repo_dir or os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    load_converters(repo_dir)
+    with open(get_dataset_path(data_dir), 'r') as fh:
+        dataset = ujson.load(fh)
+    commit, dirty = git_commit(repo_dir)
+    workdir = workdir or os.path.join(data_dir, 'work')
+    names = [name for name, _ in stages]
+    for name in only or []:
+        if name not in names:
+            raise ValueError('unknown stage {}, expected one of {}'.format(name, ', '.join(names)))
+    selected = [(name, stage) for name, stage in stages if not only or name in only]
+    # the conversions need the schemas and headers
+    if any(name == 'to_rdf' for name, _ in selected) and not any(name == 'infer_schema' for name, _ in selected):
+        selected.insert(0, ('infer_schema', stage_infer_schema))
+    if any(name == 'to_csv' for name, _ in selected) and not any(name == 'infer_headers' for name, _ in selected):
+        selected.insert(0, ('infer_headers', stage_infer_headers))
+    if os.path.isdir(workdir):
+        shutil.rmtree(workdir)
+    timings = {}
+    for name, stage in selected:
+        runs = []
+        for _ in range(repeat):
+            # nothing cached by an earlier run, e.g. schema_cache or build_state.json
+            for d in ['cmd_gen_dgraph', 'cmd_gen_neo4j', 'run_dgraph', 'run_neo4j']:
+                shutil.rmtree(os.path.join(workdir, d), ignore_errors=True)
+            if name in ['infer_schema', 'infer_headers']:
+                shutil.rmtree(os.path.join(workdir, 'dgraph' if name == 'infer_schema' else 'neo4j'), ignore_errors=True)
+            runs.append(run_stage(name, stage, dataset, workdir, jobs))
+            if 'error' in runs[-1]:
+                break
+        if 'error' in runs[-1]:
+            timings[name] = runs[-1]
+            logging.warning('{:16} failed: {}'.format(name, runs[-1]['error']))
+            continue
+        best = min(runs, key=lambda r: r['seconds'])
+        best['runs'] = [r['seconds'] for r in runs]
+        timings[name] = best
+        logging.info('{:16} {:8.2f}s {:12.0f} records/s {:8.2f} MB/s {:8.0f} MB peak'.format(
+            name, best['seconds'], best['records_per_sec'], best['mb_per_sec'], best['peak_rss_mb']))
+    now = datetime.datetime.now()
+    out = {
+        'commit': commit,
+        'dirty': dirty,
+        'time': now.isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'ujson': ujson.__version__,
+        'cpu_count': multiprocessing.cpu_count(),
+        'jobs': jobs,
+        'repeat': repeat,
+        'dataset': {k: dataset[k] for k in ['scale', 'seed', 'files']},
+        'stages': timings,
+    }
+    # ./timings is mounted into the grip-kv container as /opt/timings
+    results = results or os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'timings', 'bench_{}_{}.json'.format(now.strftime('%Y%m%d-%H%M%S'), (commit or 'nogit')[:8]))
+    os.makedirs(os.path.dirname(os.path.abspath(results)), exist_ok=True)
+    with open(results, 'w') as fh:
+        ujson.dump(out, fh, indent=2, escape_forward_slashes=False)
+    logging.info('wrote {}'.format(results))
+    return results
+
+
+def compare(old, new):
+    """ print the seconds and peak RSS of each stage of two results files, and new's speedup """
+    with open(old, 'r') as fh:
+        old = ujson.load(fh)
+    with open(new, 'r') as fh:
+        new = ujson.load(fh)
+    for results in [old, new]:
+        print('{} {}{} scale {} jobs {}'.format(results['time'], (results['commit'] or 'nogit')[:8], '+' if results['dirty'] else '', results['dataset']['scale'], results['jobs']))
+    if old['dataset'] != new['dataset']:
+        print('warning: the results are for different data')
+    print('{:16} {:>9} {:>9} {:>8} {:>9} {:>9}'.format('stage', 'old s', 'new s', 'speedup', 'old MB', 'new MB'))
+    for name in [name for name, _ in stages]:
+        a, b = old['stages'].get(name, {}), new['stages'].get(name, {})
+        if 'seconds' not in a or 'seconds' not in b:
+            continue
+        print('{:16} {:9.2f} {:9.2f} {:7.2f}x {:9.0f} {:9.0f}'.format(name, a['seconds'], b['seconds'], a['seconds'] / b['seconds'], a['peak_rss_mb'], b['peak_rss_mb']))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description='Benchmarks the converters on synthetic BMEG shaped data')
+    subparsers = parser.add_subparsers(help='sub-command help')
+    generate_parser = subparsers.add_parser('generate', help='write deterministic synthetic vertex and edge files and their manifest')
+    generate_parser.add_argument('-o', '--outdir', dest='outdir', required=True, help='directory in which to write the files')
+    generate_parser.add_argument('--scale', dest='scale', type=int, default=5, help='size of the data; 1 is 2000 genes, 5000 transcripts and 25000 edges [default: 5]')
+    generate_parser.add_argument('--seed', dest='seed', type=int, default=0, help='random seed [default: 0]')
+    generate_parser.set_defaults(func=generate)
+    run_parser = subparsers.add_parser('run', help='time each stage on generated data and write the results json')
+    run_parser.add_argument('-d', '--data-dir', dest='data_dir', required=True, help='directory written by generate')
+    run_parser.add_argument('-r', '--results', dest='results', default=None, help='results json path [default: timings/bench_{time}_{commit}.json]')
+    run_parser.add_argument('-w', '--workdir', dest='workdir', default=None, help='directory for the stage outputs, emptied first [default: {data dir}/work]')
+    run_parser.add_argument('-s', '--stages', dest='only', type=lambda x: x.split(','), default=None, help='comma separated stages to run [default: all of {}]'.format(', '.join(name for name, _ in stages)))
+    run_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1, help='worker processes for the stages that use a pool [default: 1]')
+    run_parser.add_argument('--repeat', dest='repeat', type=int, default=1, help='run each stage this many times and keep the fastest [default: 1]')
+    run_parser.add_argument('--repo-dir', dest='repo_dir', default=None, help='checkout whose converters to time, e.g. a git worktree of another commit [default: this one]')
+    run_parser.set_defaults(func=run)
+    compare_parser = subparsers.add_parser('compare', help='compare two results files')
+    compare_parser.add_argument('old', help='results json of the baseline')
+    compare_parser.add_argument('new', help='results json to compare with it')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    cmd_args = vars(args).copy()
+    if 'func' not in cmd_args:
+        parser.print_help()
+        sys.exit(0)
+    del cmd_args['func']
+    args.func(**cmd_args)
@@ -0,0 +1,210 @@
+import argparse
+import logging
+import os
+import sys
+import types
+import ujson
+
+# the converters, each a script in the directory of its database
+repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+for d in [repo_dir, os.path.join(repo_dir, 'dgraph'), os.path.join(repo_dir, 'neo4j')]:
+    sys.path.insert(0, d)
+from core.convert import (  # noqa: E402
+    build_key,
+    convert_all,
+    get_dropped_path,
+    get_json_path,
+    JsonSink,
+    read_manifest,
+    report_dropped,
+    sample_manifest,
+    vertex_index,
+)
+from core.mongo import BsonSink, bson_documents, get_bson_path, write_dump  # noqa: E402
+import to_csv  # noqa: E402
+import to_rdf  # noqa: E402
+
+
+def json_backend(json_outdir, limit=None, index_hash=None, reuse_from=None):
+    """ the json lines, for mongoimport or grip load, of the files of a manifest, for convert_all, see run """
+
+    def key(path):
+        return build_key(None, limit, index_hash if 'Edge' in path else None)
+
+    def sidecars(path):
+        # edges filtered by the vertex index also keep their dropped counts
+        return [get_dropped_path] if index_hash and 'Edge' in path else []
+
+    return types.SimpleNamespace(
+        outdir=json_outdir,
+        reuse_from=reuse_from,
+        output=lambda path: get_json_path(json_outdir, path),
+        sink=lambda path: (JsonSink, {}),
+        key=key,
+        sidecars=sidecars,
+    )
+
+
+def bson_backend(bson_outdir, limit=None, index_hash=None, reuse_from=None):
+    """ the bson documents, for mongorestore, of the files of a manifest, for convert_all, see run and write_dump """
+
+    def key(path):
+        return build_key(None, limit, index_hash if 'Edge' in path else None)
+
+    def sidecars(path):
+        # edges filtered by the vertex index also keep their dropped counts
+        return [get_dropped_path] if index_hash and 'Edge' in path else []
+
+    return types.SimpleNamespace(
+        outdir=bson_outdir,
+        reuse_from=reuse_from,
+        output=lambda path: get_bson_path(bson_outdir, path),
+        sink=lambda path: (BsonSink, {}),
+        key=key,
+        sidecars=sidecars,
+    )
+
+
+def write_json_manifest(config, json_outdir):
+    """ {json_outdir}/bmeg_file_manifest.txt, listing the json files as a release manifest does, for etl/load_database.sh """
+    manifest_path = os.path.join(json_outdir, 'bmeg_file_manifest.txt')
+    with open(manifest_path, 'w') as fh:
+        for path in config.vertex_files + config.edge_files:
+            if os.path.isfile(path):
+                # load_database.sh links the directory of the manifest to ./outputs
+                fh.write('outputs/{}\n'.format(os.path.basename(get_json_path(json_outdir, path))))
+    logging.info('wrote {}'.format(manifest_path))
+    return manifest_path
+
+
+def run(manifest, rdf_outdir=None, csv_outdir=None, json_outdir=None, bson_outdir=None, graph='bmeg', insertion_workers=8, mongo_host='mongo', grip_host='grip:8202', limit=None, single_pass=False, full_scan=False, jobs=None, worker_memory=None, drop_dangling=False, integer_ids=False, shards=None, pack_wide=False, timings_dir='timings', profile=False, sample=None, sample_seed=0, native_lists=False):
+    """ convert every file in the manifest for several databases at once, reading and flattening each file once
+
+    each of rdf_outdir, csv_outdir and json_outdir that is given gets what
+    `to_rdf.py run`, `to_csv.py run` or, for mongo and grip, the json lines
+    kept after dropping dangling edges, would write there; outputs are kept,
+    reused and rebuilt per outdir as those do, see convert_all
+
+    bson_outdir gets a mongodump of the {graph}_vertices and {graph}_edges
+    collections grip reads, with the gid as _id, and load_bson.sh to restore
+    it with insertion_workers per collection into mongo_host and register the
+    graph with grip_host, see write_dump
+
+    the schemas and headers are inferred from one scan of each file, and
+    the vertex index is built once; integer_ids and native_lists apply to rdf
+    and csv; with sample, every backend gets the same connected subgraph, see
+    sample_manifest
+    """
+    outdirs = [d for d in [rdf_outdir, csv_outdir, json_outdir, bson_outdir] if d]
+    if not outdirs:
+        raise ValueError('nothing to write, give at least one of --rdf-outdir, --csv-outdir, --json-outdir and --bson-outdir')
+    if len(set(os.path.realpath(d) for d in outdirs)) < len(outdirs):
+        # each keeps its own build_state.json
+        raise ValueError('--rdf-outdir, --csv-outdir, --json-outdir and --bson-outdir have to be different directories')
+    if pack_wide and single_pass:
+        raise ValueError('--pack-wide changes the inferred schema, it can not be combined with --single-pass')
+    if native_lists and single_pass:
+        raise ValueError('--native-lists changes the inferred schema, it can not be combined with --single-pass')
+    if rdf_outdir and shards and single_pass:
+        raise ValueError('--shards assigns predicates by the inferred schema, it can not be combined with --single-pass')
+    for d in outdirs:
+        os.makedirs(d, exist_ok=True)
+    if sample:
+        manifest = sample_manifest(manifest, os.path.join(outdirs[0], 'sample'), sample, seed=sample_seed, jobs=jobs)
+    config = read_manifest(manifest)
+    if not single_pass:
+        # the type statistics are the same for both, so the second scan reads the cache of the first
+        cache_dir = rdf_outdir or csv_outdir
+        if rdf_outdir:
+            to_rdf.infer_schema(config, rdf_outdir, full_scan=full_scan, jobs=jobs, pack_wide=pack_wide, cache_dir=cache_dir, native_lists=native_lists)
+        if csv_outdir:
+            to_csv.infer_headers(config, csv_outdir, full_scan=full_scan, jobs=jobs, integer_ids=integer_ids, pack_wide=pack_wide, cache_dir=cache_dir, native_lists=native_lists)
+    if integer_ids:
+        # an edge to a vertex without an id can not be written
+        drop_dangling = True
+    index = None
+    if drop_dangling:
+        index = vertex_index(config, outdirs[0], jobs=jobs, memory=worker_memory or 1024)
+    index_hash = index[1] if index else None
+
+    shard_plan = None
+    if rdf_outdir and shards:
+        # half of a worker's memory for the triples it holds before sorting them
+        shard_plan = to_rdf.plan_shards(config, rdf_outdir, shards, integer_ids, memory=(worker_memory or 1024) // 2)
+
+    backends = []
+    if rdf_outdir:
+        backends.append(to_rdf.rdf_backend(rdf_outdir, single_pass, limit, index_hash, integer_ids, shard_plan=shard_plan))
+    if csv_outdir:
+        backends.append(to_csv.csv_backend(csv_outdir, single_pass, limit, index_hash, integer_ids))
+    if json_outdir:
+        backends.append(json_backend(json_outdir, limit, index_hash))
+    if bson_outdir:
+        backends.append(bson_backend(bson_outdir, limit, index_hash))
+    convert_all(config, backends, limit=limit, index=index, jobs=jobs, worker_memory=worker_memory, timings_dir=timings_dir, name='convert', profile=profile)
+
+    if rdf_outdir and single_pass:
+        to_rdf.merge_schema(manifest, rdf_outdir)
+    if csv_outdir and single_pass:
+        to_csv.merge_header(manifest, csv_outdir)
+    if drop_dangling:
+        for backend in backends:
+            report_dropped([backend.output(path) for path in config.edge_files], backend.outdir)
+    if rdf_outdir and shards:
+        to_rdf.clean_shards(rdf_outdir, [backends[0].output(path) for path in config.vertex_files + config.edge_files], shards)
+    if json_outdir:
+        write_json_manifest(config, json_outdir)
+    if bson_outdir:
+        write_dump(config, bson_outdir, graph, insertion_workers=insertion_workers, mongo_host=mongo_host, grip_host=grip_host)
+
+
+def cat_bson(path, limit=None):
+    """ print the documents of a bson file, e.g. of a dump, as json lines, to check them offline """
+    for i, doc in enumerate(bson_documents(path)):
+        if limit and i == limit:
+            break
+        print(ujson.dumps(doc, escape_forward_slashes=False))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description='Converts vertexes and edges for several databases in one pass')
+    subparsers = parser.add_subparsers(help='sub-command help')
+    run_parser = subparsers.add_parser('run', help='infer schemas and headers and convert every file in the manifest once for all outdirs given')
+    run_parser.add_argument('-l', '--limit', dest='limit', type=int, default=None, help='limit the number of rows in each vertex/edge')
+    run_parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
+    run_parser.add_argument('-r', '--rdf-outdir', dest='rdf_outdir', default=None, help='directory in which to write rdf files for dgraph')
+    run_parser.add_argument('-c', '--csv-outdir', dest='csv_outdir', default=None, help='directory in which to write csv files for neo4j')
+    run_parser.add_argument('--json-outdir', dest='json_outdir', default=None, help='directory in which to write json files and their bmeg_file_manifest.txt for mongo and grip')
+    run_parser.add_argument('--bson-outdir', dest='bson_outdir', default=None, help='directory in which to write a mongodump of the grip collections and load_bson.sh to restore it')
+    run_parser.add_argument('--graph', dest='graph', default='bmeg', help='grip graph the bson dump is of [default: bmeg]')
+    run_parser.add_argument('--insertion-workers', dest='insertion_workers', type=int, default=8, help='mongorestore --numInsertionWorkersPerCollection in load_bson.sh [default: 8]')
+    run_parser.add_argument('--mongo-host', dest='mongo_host', default='mongo', help='mongo host load_bson.sh restores into, unless MONGO_HOST is set [default: mongo]')
+    run_parser.add_argument('--grip-host', dest='grip_host', default='grip:8202', help='grip server load_bson.sh registers the graph with, unless GRIP_HOST is set [default: grip:8202]')
+    run_parser.add_argument('--full-scan', dest='full_scan', action='store_true', default=False, help='read every record of every file to infer the schema, instead of a sample')
+    run_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None, help='number of worker processes [default: cpu count]')
+    run_parser.add_argument('--single-pass', dest='single_pass', action='store_true', default=False, help='infer the schema and headers while converting instead of reading every file up front')
+    run_parser.add_argument('--worker-memory', dest='worker_memory', type=int, default=None, help='memory budget in MB for each worker; also caps the number of workers to fit in physical memory')
+    run_parser.add_argument('--drop-dangling', dest='drop_dangling', action='store_true', default=False, help='leave out edges to or from vertices missing from the manifest, counted by label in dropped_edges.json of each outdir')
+    run_parser.add_argument('--integer-ids', dest='integer_ids', action='store_true', default=False, help='number rdf and csv vertices from the vertex index, see to_rdf.py and to_csv.py; implies --drop-dangling')
+    run_parser.add_argument('--shards', dest='shards', type=int, default=None, help='partition the rdf by predicate into this many shard directories, see to_rdf.py')
+    run_parser.add_argument('--pack-wide', dest='pack_wide', action='store_true', default=False, help='write objects of more than 1000 numeric values as one json string predicate and column')
+    run_parser.add_argument('--native-lists', dest='native_lists', action='store_true', default=False, help='write lists of scalars of a vertex as one list predicate and array column instead of one per position, see to_rdf.py and to_csv.py')
+    run_parser.add_argument('--timings-dir', dest='timings_dir', default='timings', help='directory in which to write the timings of the run, per file and stage [default: timings]')
+    run_parser.add_argument('--profile', dest='profile', action='store_true', default=False, help='sample the stacks of each conversion worker and write them to the timings directory')
+    run_parser.add_argument('--sample', dest='sample', type=int, default=None, help='convert a connected sample of this many vertices of each label, the edges to or from them and the vertices at their other ends, instead of every record')
+    run_parser.add_argument('--sample-seed', dest='sample_seed', type=int, default=0, help='random seed of --sample [default: 0]')
+    run_parser.set_defaults(func=run)
+    cat_parser = subparsers.add_parser('cat-bson', help='print the documents of a bson file as json lines')
+    cat_parser.add_argument('-i', '--input', dest='path', required=True, help='bson file, e.g. dump/grip/bmeg_vertices.bson.gz')
+    cat_parser.add_argument('-l', '--limit', dest='limit', type=int, default=None, help='number of documents to print')
+    cat_parser.set_defaults(func=cat_bson)
+    args = parser.parse_args()
+    logging.debug(vars(args))
+    cmd_args = vars(args).copy()
+    if 'func' not in cmd_args:
+        parser.print_help()
+        sys.exit(0)
+    del cmd_args['func']
+    args.func(**cmd_args)
@@ -0,0 +1,152 @@
+import argparse
+import datetime
+import logging
+import multiprocessing.pool
+import os
+import shlex
+import subprocess
+import sys
+import time
+import ujson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from core.convert import read_manifest  # noqa: E402
+
+# the command loading one file, by backend; {kind} is vertex or edge and {collection} {graph}_vertices or {graph}_edges
+loaders = {
+    'kv': 'grip load {graph} --{kind} {path} --host {host}',
+    'mongo': 'gunzip -cf {path} | mongoimport -d grip -c {collection} --type json --numInsertionWorkers 24 --writeConcern 0 --bypassDocumentValidation --host={host}',
+}
+default_hosts = {
+    'kv': 'localhost:8202',
+    'mongo': 'mongo',
+}
+
+
+def load_command(template, path, kind, graph, host):
+    """ the shell command of template for one file """
+    collection = '{}_{}'.format(graph, 'vertices' if kind == 'vertex' else 'edges')
+    return template.format(path=shlex.quote(path), kind=kind, graph=graph, collection=collection, host=host)
+
+
+def load_file(args):
+    """ run the command of (path, command, retries, retry_delay) until it succeeds or runs out of retries
+
+    a failure is taken for a transient one, e.g. a server that is busy or
+    restarting, and retried after retry_delay seconds, doubled every time;
+    return its timings, with the end of its output if it failed
+    """
+    path, command, retries, retry_delay = args
+    start = time.time()
+    attempt = 0
+    while True:
+        attempt += 1
+        # pipefail, so a failing gunzip fails the load too
+        p = subprocess.run(['bash', '-o', 'pipefail', '-c', command], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if p.returncode == 0 or attempt > retries:
+            break
+        logging.warning('loading {} failed with exit code {}, retry {} of {}'.format(path, p.returncode, attempt, retries))
+        time.sleep(retry_delay * 2 ** (attempt - 1))
+    report = {
+        'path': path,
+        'input_bytes': os.path.getsize(path),
+        'seconds': round(time.time() - start, 3),
+        'attempts': attempt,
+        'returncode': p.returncode,
+    }
+    if p.returncode != 0:
+        report['output'] = p.stdout.decode('utf-8', 'replace')[-4096:]
+    return report
+
+
+def load_files(paths, kind, template, graph, host, jobs, retries, retry_delay, start):
+    """ load paths on jobs threads, largest first, return their timings """
+    paths = sorted(paths, key=os.path.getsize, reverse=True)
+    tasks = [(path, load_command(template, path, kind, graph, host), retries, retry_delay) for path in paths]
+    total_size = sum(os.path.getsize(path) for path in paths)
+    done_size = 0
+    reports = []
+    # threads, as the work is in the loader processes
+    with multiprocessing.pool.ThreadPool(jobs) as pool:
+        for report in pool.imap_unordered(load_file, tasks):
+            reports.append(report)
+            done_size += report['input_bytes']
+            if report['returncode'] != 0:
+                logging.error('failed to load {}\n{}'.format(report['path'], report['output']))
+            elapsed = time.time() - start
+            rate = done_size / elapsed if elapsed else 0
+            eta = datetime.timedelta(seconds=round((total_size - done_size) / rate)) if rate else '?'
+            logging.info('loaded {} of {} {} files, {:.1%} of {:.1f} MB, {:.2f} MB/s, eta {}'.format(
+                len(reports), len(tasks), kind, done_size / total_size if total_size else 1, total_size / 1e6, rate / 1e6, eta))
+    return reports
+
+
+def load(manifest, graph, backend='kv', command=None, host=None, jobs=4, retries=2, retry_delay=5, timings_dir='timings'):
+    """ load every file in the manifest into graph, jobs at a time, largest first, all vertices before any edge
+
+    command is the shell command loading one file, by default that of the
+    backend, see loaders; a stub, e.g. 'sleep 1 && test -s {path}', tries
+    out the scheduling without a database; edges are not loaded if any
+    vertex file failed to load
+
+    the time each file took and its attempts are written to
+    {timings_dir}/load_{backend}_{time}.json
+    """
+    template = command or loaders[backend]
+    host = host or default_hosts[backend]
+    config = read_manifest(manifest)
+    start = time.time()
+    reports = []
+    failed = []
+    for kind, paths in [('vertex', config.vertex_files), ('edge', config.edge_files)]:
+        existing = []
+        for path in paths:
+            if not os.path.isfile(path):
+                logging.warning('{} does not exist'.format(path))
+                continue
+            existing.append(path)
+        kind_reports = load_files(existing, kind, template, graph, host, jobs, retries, retry_delay, time.time())
+        for report in kind_reports:
+            report['kind'] = kind
+        reports.extend(kind_reports)
+        failed.extend(report['path'] for report in kind_reports if report['returncode'] != 0)
+        if failed:
+            # edges of vertices that are not there
+            break
+
+    elapsed = time.time() - start
+    size = sum(report['input_bytes'] for report in reports)
+    total = {
+        'files': len(reports),
+        'failed': len(failed),
+        'retries': sum(report['attempts'] - 1 for report in reports),
+        'input_bytes': size,
+        'seconds': round(elapsed, 3),
+        'mb_per_sec': round(size / 1e6 / elapsed, 3) if elapsed else None,
+    }
+    os.makedirs(timings_dir, exist_ok=True)
+    path = os.path.join(timings_dir, 'load_{}_{}.json'.format(backend, time.strftime('%Y%m%d%H%M%S', time.localtime(start))))
+    with open(path, 'w') as fh:
+        ujson.dump({'total': total, 'files': reports}, fh, indent=2, escape_forward_slashes=False)
+    logging.info('{} files, {:.1f} MB in {:.1f}s'.format(total['files'], size / 1e6, elapsed))
+    logging.info('wrote {}'.format(path))
+    if failed:
+        raise SystemExit('{} files failed to load: {}'.format(len(failed), ', '.join(failed)))
+    return path
+
+
+if __name__ == '__main__':  # pragma: no cover
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description='Loads the vertexes and edges of a manifest into grip, several files at a time')
+    parser.add_argument('-m', '--manifest', dest='manifest', required=True, help='manifest file path')
+    parser.add_argument('-g', '--graph', dest='graph', required=True, help='graph to load into')
+    parser.add_argument('-b', '--backend', dest='backend', choices=sorted(loaders), default='kv', help='grip load into a grip server, or mongoimport into its mongo [default: kv]')
+    parser.add_argument('--command', dest='command', default=None, help='shell command loading one file instead, with {path}, {kind}, {graph}, {collection} and {host} filled in')
+    parser.add_argument('--host', dest='host', default=None, help='grip or mongo host [default: {}]'.format(', '.join('{} for {}'.format(v, k) for k, v in sorted(default_hosts.items()))))
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=4, help='files loaded at a time [default: 4]')
+    parser.add_argument('--retries', dest='retries', type=int, default=2, help='times a failed load is retried [default: 2]')
+    parser.add_argument('--retry-delay', dest='retry_delay', type=float, default=5, help='seconds before the first retry, doubled for each next one [default: 5]')
+    parser.add_argument('--timings-dir', dest='timings_dir', default='timings', help='directory in which to write the timings of the load, per file [default: timings]')
+    args = parser.parse_args()
+    load(**vars(args))